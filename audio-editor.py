@@ -1,13 +1,36 @@
+import time
+
+# startup is measured from here: imports, building the window and its first paint
+STARTED_AT = time.perf_counter_ns() // 1000
+
 import sys
 import os
-import subprocess
-import re
 
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
-from PyQt5 import uic
 
-ui_class = uic.loadUiType("audio-editor.ui")[0]
+from audio_editor import trace
+from audio_editor.audio_file import AudioFile
+from audio_editor.scanner import Scanner
+from audio_editor.session import lastWorkspace, saveWorkspace
+
+# print the startup time and quit once the window is up, like audio-editor2.py
+STARTUP_PROBE = bool(os.environ.get('AUDIO_EDITOR_STARTUP_PROBE'))
+
+UI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audio-editor.ui')
+
+# the module pyuic5 generated from audio-editor.ui, unless the .ui was edited since
+def loadUiClass():
+    import audio_editor_ui
+
+    if os.path.getmtime(UI_PATH) <= os.path.getmtime(audio_editor_ui.__file__):
+        return audio_editor_ui.Ui_MainWindow
+
+    from PyQt5 import uic
+
+    return uic.loadUiType(UI_PATH)[0]
+
+ui_class = loadUiClass()
 files_by_name={}
 extensions={
     ".flac": [ ".flac", ".m4a" ],
@@ -16,74 +39,44 @@ extensions={
     ".m4a": [ ".m4a", ".mp3" ]
 }
 
+class BackgroundWorkerSignals(QObject):
+    finished = pyqtSignal(object)
+
+# reports (file name, pipeline, error) back to the window, error being None when the job went through
 class BackgroundWorker(QRunnable):
-    def __init__(self, audio_file, directory):
+    def __init__(self, file_name, audio_file):
         super().__init__()
+        self.file_name = file_name
         self.audio_file = audio_file
-        self.directory = directory
+        self.signals = BackgroundWorkerSignals()
+        self.queued_at = trace.now()
     
     def run(self):
-        before_file_name = f'{self.audio_file.filename}{self.audio_file.extension}'
-        after_file_name = f'{self.audio_file.filename_after}{self.audio_file.extension_after}'
-
-        file_path = os.path.join(self.directory, before_file_name)
-        output_path = os.path.join(self.directory, after_file_name)
-
-        if self.audio_file.extension == '.flac':
-            command = f'ffmpeg -y -i "{file_path}" -af volume="{self.audio_file.getVolumeDiff()}dB" -c:v copy -c:a alac "{output_path}"'            
-        else:
-            command = f'ffmpeg -y -i "{file_path}" -b:a {self.audio_file.bitrate_after} -af volume="{self.audio_file.getVolumeDiff()}dB" "{output_path}" 2>&1'
-        
-        subprocess.run(command, shell=True, capture_output=True, text=True)
-
-class AudioFile():
-    def __init__(self, filename, extension, output):
-        mean_volume = re.search(r"mean_volume:\s(-?\d+\.\d+) dB", output)
-        max_volume = re.search(r"max_volume:\s(-?\d+\.\d+) dB", output)
-        bitrate = re.search(r"bitrate: (\d+) kb/s", output)
-
-        mean_volume = float(mean_volume.group(1)) if mean_volume else None
-        max_volume = float(max_volume.group(1)) if max_volume else None
-        bitrate = int(bitrate.group(1)) if bitrate else None
-
-        self.filename = filename
-        self.filename_after = f'{filename}_adjusted'
-
-        self.max_volume = max_volume
-        self.changed = False
-        self.reserved = False
+        file_name = f'{self.audio_file.filename}{self.audio_file.extension}'
+        trace.complete('queue wait', 'pool', self.queued_at, runnable='worker', file=file_name)
 
-        self.extension = extension
-        self.extension_after = extension
+        # numpy, ffmpeg and friends load with the first job, not with the window
+        from audio_editor.journal import shared_journal
+        from audio_editor.process import errorOf
+        from audio_editor.runner import runJob
 
-        self.mean_volume = mean_volume
-        self.mean_volume_after = round(mean_volume, 2)
+        with trace.span('worker', 'pool', file=file_name):
+            try:
+                kind = runJob(self.audio_file, shared_journal())
+                error = None
+            except Exception as e:
+                kind = None
+                error = self.audio_file.error or errorOf(e, 'encode')
 
-        self.bitrate = f'{bitrate}K'
-        self.bitrate_after = self.bitrate
-
-    def checkChanged(self):
-        if self.mean_volume != self.mean_volume_after or self.extension != self.extension_after or self.bitrate != self.bitrate_after:
-            self.changed = True
-        else:
-            self.changed = False
-
-        return self.changed
-    
-    def getVolumeDiff(self):
-        return self.mean_volume_after - self.mean_volume
-
-    def getBeforeData(self):
-        return f'filename: {self.filename}{self.extension}\nvolume:\n  mean: {self.mean_volume}\n  max: {self.max_volume}\nbitrate: {self.bitrate}'
-    
-    def getAfterData(self):
-        return f'filename: {self.filename_after}{self.extension_after}\nvolume:\n mean: {self.mean_volume_after}\n max: {self.max_volume}\nbitrate: {self.bitrate_after}'
+        self.signals.finished.emit((self.file_name, kind, error))
 
 class AudioEditor(QMainWindow, ui_class):
     def __init__(self):
         super().__init__()
         self.setupUi(self)
-        self.threadpool = QThreadPool()
+        self.threadpool = None
+        self.running = 0
+        self.job_errors = {}
         self.constructEventListener()
     
     def constructEventListener(self):
@@ -98,33 +91,58 @@ class AudioEditor(QMainWindow, ui_class):
         
         self.apply_button.setEnabled(False)
 
+    # first turn of the event loop, the window is on screen: the startup time ends here.
+    # then the last workspace comes back, its measurements from the analysis cache.
+    def onStarted(self):
+        ready_at = trace.now()
+        seconds = (ready_at - STARTED_AT) / 1e6
+        trace.complete('startup', 'ui', STARTED_AT, ready_at)
+
+        if STARTUP_PROBE:
+            print(f'startup {seconds:.4f}', flush=True)
+            QApplication.instance().quit()
+            return
+
+        self.statusBar().showMessage(f'ready in {seconds * 1000:.0f} ms')
+        workspace = lastWorkspace()
+
+        if workspace:
+            self.directory_label.setText(workspace)
+            self.loadMusicFiles(workspace)
+
     # 디렉토리 선택 팝업 노출
     def selectDirectory(self):
         dir_path = QFileDialog.getExistingDirectory(self, '디렉토리 선택')
         if dir_path:
             self.directory_label.setText(dir_path)
             self.loadMusicFiles(dir_path)
+            saveWorkspace(dir_path)
 
     def loadMusicFiles(self, dir_path):
         self.file_list.clear()
         files_by_name.clear()
 
-        for file in os.listdir(dir_path):
+        # nested folders too, listed by their path below dir_path
+        for path, _, container in Scanner(dir_path):
+            directory, file = os.path.split(path)
             name, ext = os.path.splitext(file)
+            file_name = os.path.relpath(path, dir_path)
+            metadata = self.obtainMetadata(file_name)
 
-            if ext in ('.mp4', '.mp3', '.m4a', '.flac'):
-                file_name = f'{name}{ext}'
-                metadata = self.obtainMetadata(file)
-                
-                self.file_list.addItem(file_name)
-                files_by_name[file_name] = AudioFile(name, ext, metadata)
+            self.file_list.addItem(file_name)
+            files_by_name[file_name] = AudioFile(directory, name, ext, metadata, container)
 
+    # an unreadable file is listed with what went wrong instead of its measurements
     def obtainMetadata(self, filename):
+        from audio_editor.process import errorOf
+        from audio_editor.runner import loadMetadata
+
         file_path = os.path.join(self.directory_label.text(), filename)
-        command = f'ffmpeg -i "{file_path}" -af volumedetect -f null - 2>&1'
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
 
-        return result.stdout
+        try:
+            return loadMetadata(file_path)
+        except Exception as e:
+            return {'error': errorOf(e, 'analysis')}
     
     def clearMetadataWindow(self):
         self.metadata.setText('')
@@ -145,8 +163,12 @@ class AudioEditor(QMainWindow, ui_class):
         
         return index
     
+    # files that failed, in their analysis or their last job, sit out until they are reloaded
+    def isApplicable(self, audio_file):
+        return audio_file.reserved is True and audio_file.analyzed and not audio_file.error
+
     def countReservedFiles(self):
-        return sum(1 for v in files_by_name.values() if v.reserved is True)
+        return sum(1 for v in files_by_name.values() if self.isApplicable(v))
 
     # 파일 목록에서 파일 선택 시
     def updateMetadataWindow(self):
@@ -157,9 +179,20 @@ class AudioEditor(QMainWindow, ui_class):
         current_item = self.file_list.currentItem().text()
         current_file = files_by_name[current_item]
 
-        current_file.checkChanged()
+        changed = current_file.isChanged()
 
         self.metadata.setText(current_file.getBeforeData())
+
+        # nothing to edit without measurements, the error shows above
+        if not current_file.analyzed:
+            self.metadata_after.setText('')
+            self.volume_double_spin_box.setEnabled(False)
+            self.quality_combo_box.setEnabled(False)
+            self.extension_combo_box.setEnabled(False)
+            self.reserve_button.setEnabled(False)
+            self.updateApplyButton()
+            return
+
         self.metadata_after.setText(current_file.getAfterData())
         
         # volume
@@ -169,7 +202,7 @@ class AudioEditor(QMainWindow, ui_class):
         # bitrate
         self.quality_combo_box.setCurrentIndex(self.findIndexInComboBox(self.quality_combo_box, current_file.bitrate_after))
 
-        if current_file.extension == '.flac':
+        if current_file.container == '.flac':
             self.quality_combo_box.setEnabled(False)    
         else:
             self.quality_combo_box.setEnabled(True)
@@ -179,15 +212,21 @@ class AudioEditor(QMainWindow, ui_class):
         self.extension_combo_box.setEnabled(True)
 
         # reserve button
-        if current_file.reserved or current_file.changed:
+        if current_file.reserved or changed:
             self.reserve_button.setEnabled(True)
         else:
             self.reserve_button.setEnabled(False)
 
+        self.updateApplyButton()
+
+    def updateApplyButton(self):
         reserve_count = self.countReservedFiles()
         
         # apply button
-        if reserve_count > 0 and self.file_list.count() > 0:
+        if self.running > 0:
+            self.apply_button.setEnabled(False)
+            self.apply_button.setText(f'3. 전체 적용 ({self.running}개 진행 중)')
+        elif reserve_count > 0 and self.file_list.count() > 0:
             self.apply_button.setEnabled(True)
             self.apply_button.setText(f'3. 전체 적용 ({reserve_count}개)')
         else:
@@ -223,22 +262,56 @@ class AudioEditor(QMainWindow, ui_class):
         current_item = self.file_list.currentItem().text()
         current_file = files_by_name[current_item]
 
-        current_file.reserved = current_file.checkChanged()
+        current_file.reserved = current_file.isChanged()
         
         self.updateMetadataWindow()
 
     # 전체적용 버튼 클릭 시 수행할 동작
     def execute(self):
-        for v in files_by_name.values():
-            if v.changed and v.reserved:
-                worker = BackgroundWorker(v, self.directory_label.text())
+        if self.threadpool is None:
+            self.threadpool = QThreadPool()
+
+        for k, v in files_by_name.items():
+            if self.isApplicable(v) and v.isChanged():
+                worker = BackgroundWorker(k, v)
+                worker.signals.finished.connect(self.onWorkerFinished)
+                self.running += 1
                 self.threadpool.start(worker)
-        
+
+        # the list is only reloaded once every output is complete
+        self.directory_button.setEnabled(False)
+        self.updateMetadataWindow()
+
+    def onWorkerFinished(self, result):
+        file_name, kind, error = result
+        self.running -= 1
+
+        if error:
+            self.job_errors[file_name] = error
+            self.statusBar().showMessage(f'{file_name} -> failed: {error["message"]}')
+        else:
+            applied = files_by_name[file_name].applied_volume_diff
+            gain = f' ({applied:+.1f} dB)' if applied is not None else ''
+            self.statusBar().showMessage(f'{file_name} -> {kind}{gain}')
+
+        if self.running > 0:
+            self.updateApplyButton()
+            return
+
+        # the reloaded files keep what went wrong, and sit out until the directory is opened again
+        job_errors, self.job_errors = self.job_errors, {}
         self.loadMusicFiles(self.directory_label.text())
+
+        for k, error in job_errors.items():
+            if k in files_by_name:
+                files_by_name[k].error = error
+
+        self.directory_button.setEnabled(True)
         self.updateMetadataWindow()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = AudioEditor()
     ex.show()
+    QTimer.singleShot(0, ex.onStarted)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -1,5 +1,12 @@
+import time
+
+# startup is measured from here: imports, building the window and its first paint
+STARTED_AT = time.perf_counter_ns() // 1000
+
 from PyQt6.QtWidgets import (
-    QListWidget, 
+    QAbstractItemView,
+    QHBoxLayout,
+    QListView, 
     QSizePolicy,
     QWidget, 
     QApplication, 
@@ -7,131 +14,529 @@ from PyQt6.QtWidgets import (
     QGridLayout, 
     QLabel, 
     QPushButton, 
+    QCheckBox,
     QComboBox,
+    QLineEdit,
     QDoubleSpinBox,
-    QFileDialog
+    QFileDialog,
+    QProgressBar
 )
 from PyQt6.QtCore import (
+    QAbstractListModel,
+    QModelIndex,
     QObject,
     Qt,
     QRunnable, 
+    QSocketNotifier,
     QThreadPool,
+    QTimer,
     pyqtSignal,
     pyqtSlot,
 )
 from PyQt6.QtGui import (
-    QColor
+    QColor,
+    QPainter
 )
 
-import ffmpeg
+from audio_editor import EXTENSIONS, trace
+from audio_editor.audio_file import AudioFile
+from audio_editor.cache import shared_cache
+from audio_editor.catalog import Catalog
+from audio_editor.journal import shared_journal
+from audio_editor.normalize import ALBUM, DEFAULT_CEILING, DEFAULT_TARGET, TRACK, isNormalizable, normalizedVolumes
+from audio_editor.orchestrator import CACHED, CANCELLED, FAILED, TIMEOUT, Orchestrator
+from audio_editor.gain import supportsGain
+from audio_editor.planner import ENCODE, GAIN
+from audio_editor.process import JobError, errorOf
+from audio_editor.scanner import SCAN_QUEUE, isOutput, sniff
+from audio_editor.scheduler import ADJUST_INTERVAL, CpuMonitor, adjust, poolSize
+from audio_editor.session import lastWorkspace, saveWorkspace
+from audio_editor.watcher import DirectoryWatcher
+
+import asyncio
+import math
 import sys
 import os
-import re
+import threading
 
-audio_files = {}
+catalog = Catalog()
 
-class AudioFile():
-    def __init__(self, directory, filename, extension, output):
-        mean_volume = re.search(r"mean_volume:\s(-?\d+\.\d+) dB", output)
-        max_volume = re.search(r"max_volume:\s(-?\d+\.\d+) dB", output)
-        bitrate = re.search(r"bitrate: (\d+) kb/s", output)
+# each band leaves room below it for background work, which starts longest first:
+# a loader's priority within the band is its seconds of audio
+PRIORITY_BAND = 1 << 24
+PRIORITY_HEADER = 4 * PRIORITY_BAND
+PRIORITY_SELECTED = 3 * PRIORITY_BAND
+PRIORITY_ESTIMATE = 2 * PRIORITY_BAND
+PRIORITY_VISIBLE = PRIORITY_BAND
+PRIORITY_BACKGROUND = 0
 
-        mean_volume = float(mean_volume.group(1)) if mean_volume else 0.0
-        max_volume = float(max_volume.group(1)) if max_volume else 0.0
-        bitrate = int(bitrate.group(1)) if bitrate else None
+def backgroundPriority(seconds):
+    return PRIORITY_BACKGROUND + min(int(seconds or 0), PRIORITY_BAND - 1)
 
-        self.directory = directory
-        self.filename = filename
-        self.filename_after = f'{filename}_adjusted'
+class BatchRunnerSignals(QObject):
+    progress = pyqtSignal(object)
+    reported = pyqtSignal(object)
+    finished = pyqtSignal(object)
 
-        self.max_volume = max_volume
-        self.reserved = False
+# one pool thread runs the event loop, ffmpeg runs in child processes
+class BatchRunner(QRunnable):
+    def __init__(self, dir_path, audio_files):
+        super().__init__()
+        self.dir_path = dir_path
+        self.audio_files = audio_files
+        self.journal = shared_journal()
+        self.signals = BatchRunnerSignals()
+        self.queued_at = trace.now()
+        self.orchestrator = Orchestrator(on_progress=self.onProgress, on_report=self.onReport)
 
-        self.extension = extension
-        self.extension_after = extension
+    def onProgress(self, path, job_progress):
+        trace.stamp(self.signals)
+        self.signals.progress.emit((os.path.relpath(path, self.dir_path), job_progress, self.orchestrator.stats()))
 
-        self.mean_volume = round(mean_volume, 2)
-        self.mean_volume_after = round(mean_volume, 2)
+    def onReport(self, path, kind):
+        trace.stamp(self.signals)
+        self.signals.reported.emit((os.path.relpath(path, self.dir_path), kind))
 
-        self.bitrate = f'{bitrate}K' if self.extension != '.mp4' else '320K'
-        self.bitrate_after = self.bitrate
-    
-    def clear(self):
-        self.reserved = False
+    @pyqtSlot()
+    def run(self):
+        trace.complete('queue wait', 'pool', self.queued_at, runnable='batch')
 
-    def isChanged(self):
-        return self.mean_volume != self.mean_volume_after or self.extension != self.extension_after or self.bitrate != self.bitrate_after
-    
-    def canReserve(self):
-        return self.reserved or self.isChanged()
+        with trace.span('batch', 'pool', files=len(self.audio_files)):
+            # fingerprinting every source for its recipe hash reads the files, so not on the GUI thread
+            # a source that is gone by now fails in the orchestrator with its own error
+            for audio_file in self.audio_files:
+                try:
+                    self.journal.enqueue(audio_file)
+                except OSError:
+                    pass
 
-    def getVolumeDiff(self):
-        return round(self.mean_volume_after - self.mean_volume, 2)
+            kinds = asyncio.run(self.orchestrator.runBatch(self.audio_files, self.journal))
 
-    def getBeforeData(self):
-        return f'filename: {self.filename}{self.extension}\nvolume:\n  mean: {self.mean_volume}\n  max: {self.max_volume}\nbitrate: {self.bitrate}'
-    
-    def getAfterData(self):
-        return f'filename: {self.filename_after}{self.extension_after}\nvolume:\n mean: {self.mean_volume_after}\n max: {self.max_volume}\nbitrate: {self.bitrate_after}'
+        trace.stamp(self.signals)
+        self.signals.finished.emit(kinds)
 
-class FileEditorSignals(QObject):
+class FileLoaderSignals(QObject):
+    finished = pyqtSignal(object)
+
+class ScanLoaderSignals(QObject):
+    found = pyqtSignal(object)
     finished = pyqtSignal(object)
 
-class FileEditor(QRunnable):
-    def __init__(self, audio_file):
+# phase zero: walks the workspace tree on its own thread and hands over what it finds in chunks.
+# every file holds one of `slots` until its header is loaded, so the walk waits for the loaders
+# instead of piling up a listing of the whole tree.
+class ScanLoader(QRunnable):
+    def __init__(self, watcher):
         super().__init__()
-        self.audio_file = audio_file
-        self.signals = FileEditorSignals()
+        self.watcher = watcher
+        self.slots = threading.Semaphore(SCAN_QUEUE)
+        self.stopped = False
+        self.signals = ScanLoaderSignals()
+
+    def stop(self):
+        self.stopped = True
+
+    def acquire(self):
+        while not self.stopped:
+            if self.slots.acquire(timeout=0.1):
+                return True
+
+        return False
 
     @pyqtSlot()
     def run(self):
-        before_absolute_path = os.path.join(self.audio_file.directory, f'{self.audio_file.filename}{self.audio_file.extension}')
-        after_absolute_path = os.path.join(self.audio_file.directory, f'{self.audio_file.filename_after}{self.audio_file.extension_after}')
-
-        if self.audio_file.extension == '.flac':
-            result = (
-                ffmpeg
-                    .input(before_absolute_path)
-                    .output(after_absolute_path, af=f'volume={self.audio_file.getVolumeDiff()}dB', **{'c:v': 'copy', 'c:a': 'alac'})
-                    .overwrite_output()
-                    .run()
-            )
-        else:
-            result = (
-                ffmpeg
-                    .input(before_absolute_path)
-                    .output(after_absolute_path, af=f'volume={self.audio_file.getVolumeDiff()}dB', **{'b:a': f'{self.audio_file.bitrate_after}'})
-                    .overwrite_output()
-                    .run()
-            )
+        scanner = self.watcher.scanner()
+        chunk = []
+        flushed_at = time.monotonic()
 
-        self.signals.finished.emit(1)
+        with trace.span('scan', 'pool') as span:
+            for path, stat, container in scanner:
+                full_name = self.watcher.relative(path)
 
-class FileLoaderSignals(QObject):
-    finished = pyqtSignal(object)
+                if not self.watcher.add(full_name, stat):
+                    continue
 
+                # about to wait for the loaders: hand over what they should be working on
+                if not self.slots.acquire(blocking=False):
+                    if chunk:
+                        self.signals.found.emit((self, chunk))
+                        chunk, flushed_at = [], time.monotonic()
+
+                    if not self.acquire():
+                        return
+
+                chunk.append((full_name, container))
+
+                if len(chunk) >= SCAN_CHUNK or (time.monotonic() - flushed_at) * 1000 >= INSERT_INTERVAL:
+                    self.signals.found.emit((self, chunk))
+                    chunk, flushed_at = [], time.monotonic()
+
+                if self.stopped:
+                    return
+
+            span.set(directories=scanner.directories, skipped=scanner.skipped)
+
+        if chunk:
+            self.signals.found.emit((self, chunk))
+
+        self.signals.finished.emit((self, scanner))
+
+# phase one: cached measurements or stream headers only, so the list fills at once
+class HeaderLoader(QRunnable):
+    def __init__(self, dir_path, full_name, slots=None, container=None):
+        super().__init__()
+        self.dir_path = dir_path
+        self.full_name = full_name
+        self.slots = slots
+        self.container = container
+        self.cache = shared_cache()
+        self.signals = FileLoaderSignals()
+        self.queued_at = trace.now()
+
+    @pyqtSlot()
+    def run(self):
+        # ffmpeg and mutagen load with the first file, not with the window
+        from audio_editor.loudness import probeHeader
+
+        trace.complete('queue wait', 'pool', self.queued_at, runnable='header', file=self.full_name)
+
+        try:
+            with trace.span('header', 'pool', file=self.full_name):
+                absolute_path = os.path.join(self.dir_path, self.full_name)
+                directory, file = os.path.split(absolute_path)
+                name, ext = os.path.splitext(file)
+
+                # the walk sniffed it already, a file the watcher reported is sniffed here
+                container = self.container or sniff(absolute_path)
+
+                # listed all the same, with what went wrong instead of its measurements
+                try:
+                    metadata = self.cache.get(absolute_path) or probeHeader(absolute_path)
+                except Exception as e:
+                    metadata = {'error': errorOf(e, 'probe')}
+        finally:
+            if self.slots:
+                self.slots.release()
+
+        trace.stamp(self.signals)
+        self.signals.finished.emit((self.dir_path, self.full_name, AudioFile(directory, name, ext, metadata, container)))
+
+# phase two: full decode for loudness, scheduled by priority.
+# long files get one loader per segment and the last one to finish reports.
 class FileLoader(QRunnable):
-    def __init__(self, dir_path, full_name, name, ext):
+    def __init__(self, dir_path, full_name, seconds, segments=None, index=0):
         super().__init__()
         self.dir_path = dir_path
         self.full_name = full_name
-        self.name = name
-        self.ext = ext
+        self.segments = segments
+        self.index = index
+        self.priority = backgroundPriority(seconds)
+        self.cache = shared_cache()
         self.signals = FileLoaderSignals()
+        self.queued_at = trace.now()
 
     @pyqtSlot()
     def run(self):
+        from audio_editor.loudness import analyze
+
+        trace.complete('queue wait', 'pool', self.queued_at, runnable='loader', file=self.full_name, priority=self.priority)
         absolute_path = os.path.join(self.dir_path, self.full_name)
-        stream = (
-            ffmpeg
-                .input(absolute_path)
-                .output('-', format='null', af='volumedetect')
-        )
-        _, stderr = ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
-        audio_file = AudioFile(self.dir_path, self.name, self.ext, stderr.decode())
 
-        audio_files[self.full_name] = audio_file
-        self.signals.finished.emit(self.full_name)
+        with trace.span('loader', 'pool', file=self.full_name, segment=self.index):
+            try:
+                if self.segments is None:
+                    metadata = analyze(absolute_path, reuse=self.cache.findAudio)
+                else:
+                    metadata = self.segments.run(self.index)
+
+                    if metadata is None:
+                        return
+            except Exception as e:
+                metadata = {'error': errorOf(e, 'analysis')}
+
+            if metadata.get('mean_volume') is not None:
+                self.cache.put(absolute_path, metadata)
+
+        trace.stamp(self.signals)
+        self.signals.finished.emit((absolute_path, metadata))
+
+# quick look ahead of the full analysis: a few seeked windows per file
+class EstimateLoader(QRunnable):
+    def __init__(self, dir_path, full_name):
+        super().__init__()
+        self.dir_path = dir_path
+        self.full_name = full_name
+        self.cache = shared_cache()
+        self.signals = FileLoaderSignals()
+        self.priority = PRIORITY_ESTIMATE
+        self.queued_at = trace.now()
+
+    @pyqtSlot()
+    def run(self):
+        from audio_editor.loudness import estimate
+
+        trace.complete('queue wait', 'pool', self.queued_at, runnable='estimate', file=self.full_name)
+        absolute_path = os.path.join(self.dir_path, self.full_name)
+
+        with trace.span('estimator', 'pool', file=self.full_name):
+            # the full analysis fails the same way and reports it
+            try:
+                metadata = estimate(absolute_path, reuse=self.cache.findAudio)
+            except Exception:
+                return
+
+            # too short to estimate, it was measured in full
+            if not metadata.get('estimated') and metadata['mean_volume'] is not None:
+                self.cache.put(absolute_path, metadata)
+
+        trace.stamp(self.signals)
+        self.signals.finished.emit((absolute_path, metadata))
+
+# reverts the lossless gain of an output in place; the watcher then reports it as modified
+class GainUndoer(QRunnable):
+    def __init__(self, dir_path, full_name, container):
+        super().__init__()
+        self.dir_path = dir_path
+        self.full_name = full_name
+        self.container = container
+        self.signals = FileLoaderSignals()
+
+    @pyqtSlot()
+    def run(self):
+        from audio_editor.gain import undoGain
+
+        absolute_path = os.path.join(self.dir_path, self.full_name)
+
+        with trace.span('undo gain', 'pool', file=self.full_name):
+            try:
+                result = 'gain undone' if undoGain(absolute_path, self.container) else 'no gain to undo'
+            except Exception as e:
+                result = f'{type(e).__name__}: {e}'
+
+        trace.stamp(self.signals)
+        self.signals.finished.emit((self.full_name, result))
+
+LOADING_COLOR = QColor('#999999')
+ERROR_COLOR = QColor('#d95f02')
+ESTIMATED_COLOR = QColor('#666666')
+DUPLICATE_COLOR = QColor('#386cb0')
+UNRESERVED_COLOR = QColor('#7fc97f')
+
+# rows are published in batches: one insert per INSERT_INTERVAL ms instead of one per header
+INSERT_INTERVAL = 50
+
+# the scan hands over found files in chunks of up to SCAN_CHUNK, or whatever it has every INSERT_INTERVAL ms
+SCAN_CHUNK = 64
+
+# which files the normalize button works on
+SCOPE_SELECTED = 'selected'
+SCOPE_FOLDER = 'folder'
+SCOPE_ALL = 'all'
+
+# print the startup time and quit once the window is up; the benchmark launches us like this
+STARTUP_PROBE = bool(os.environ.get('AUDIO_EDITOR_STARTUP_PROBE'))
+
+# removals in more separate places than this reset the list instead
+REMOVE_RUNS_MAX = 32
+
+# directory events are applied once they stop coming for WATCH_DEBOUNCE ms, or WATCH_MAX_DELAY ms
+# after the first one while they don't. without inotify the directory is rescanned every POLL_INTERVAL ms.
+WATCH_DEBOUNCE = 300
+WATCH_MAX_DELAY = 2000
+POLL_INTERVAL = 2000
+
+class FileListModel(QAbstractListModel):
+    def __init__(self, catalog):
+        super().__init__()
+        self.catalog = catalog
+        self.published = 0
+        self.marked = set()
+
+        self.insert_timer = QTimer()
+        self.insert_timer.setSingleShot(True)
+        self.insert_timer.setInterval(INSERT_INTERVAL)
+        self.insert_timer.timeout.connect(self.publish)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.published
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self.published:
+            return None
+
+        audio_file = self.catalog.at(index.row())
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.catalog.nameAt(index.row())
+        if role in (Qt.ItemDataRole.ForegroundRole, Qt.ItemDataRole.ToolTipRole) and audio_file.error:
+            return ERROR_COLOR if role == Qt.ItemDataRole.ForegroundRole else audio_file.getErrorData()
+        if role == Qt.ItemDataRole.ForegroundRole and not audio_file.analyzed:
+            return LOADING_COLOR
+        if role == Qt.ItemDataRole.ForegroundRole and audio_file.estimated:
+            return ESTIMATED_COLOR
+        if role in (Qt.ItemDataRole.ForegroundRole, Qt.ItemDataRole.ToolTipRole):
+            duplicates = self.catalog.duplicatesOf(self.catalog.nameAt(index.row()))
+
+            if duplicates:
+                return DUPLICATE_COLOR if role == Qt.ItemDataRole.ForegroundRole else 'same audio as:\n' + '\n'.join(duplicates)
+        if role == Qt.ItemDataRole.BackgroundRole and not audio_file.reserved and self.catalog.nameAt(index.row()) in self.marked:
+            return UNRESERVED_COLOR
+
+        return None
+
+    def add(self, audio_file, full_name):
+        self.catalog.add(audio_file, full_name)
+
+        if not self.insert_timer.isActive():
+            self.insert_timer.start()
+
+        return full_name
+
+    def publish(self):
+        if self.published < len(self.catalog):
+            self.beginInsertRows(QModelIndex(), self.published, len(self.catalog) - 1)
+            self.published = len(self.catalog)
+            self.endInsertRows()
+
+    def reset(self):
+        self.beginResetModel()
+        self.catalog.clear()
+        self.published = 0
+        self.marked.clear()
+        self.endResetModel()
+
+    def refresh(self, full_name):
+        row = self.catalog.rowOf(full_name)
+
+        if 0 <= row < self.published:
+            self.dataChanged.emit(self.index(row), self.index(row))
+
+    def refreshAll(self):
+        if self.published:
+            self.dataChanged.emit(self.index(0), self.index(self.published - 1))
+
+    def mark(self, full_name):
+        self.marked.add(full_name)
+        self.refresh(full_name)
+
+    def remove(self, full_names):
+        rows = sorted(self.catalog.rowOf(full_name) for full_name in full_names if full_name in self.catalog)
+        published = [row for row in rows if row < self.published]
+        self.marked.difference_update(full_names)
+
+        runs = []
+
+        for row in published:
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+
+        # scattered removals from a big list: one reset beats thousands of row moves
+        if len(runs) > REMOVE_RUNS_MAX:
+            self.beginResetModel()
+            self.catalog.remove(rows)
+            self.published -= len(published)
+            self.endResetModel()
+            return
+
+        # unpublished rows sit after all published ones, no view knows about them
+        self.catalog.remove(rows[len(published):])
+
+        for first, last in reversed(runs):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.catalog.remove(range(first, last + 1))
+            self.published -= last - first + 1
+            self.endRemoveRows()
+
+WAVEFORM_COLOR = QColor('#5b8cc8')
+SOURCE_COLOR = QColor('#d0d0d0')
+CLIPPED_COLOR = QColor('#e34a33')
+
+# one wheel step zooms by this much, around the cursor
+ZOOM_STEP = 1.25
+MIN_SPAN = 0.05
+CAPTION_HEIGHT = 18
+
+# min/max overview of the selected file, drawn from the peak pyramid at the current zoom.
+# the blue peaks are the ones after the volume change, the grey ones behind them the source,
+# and columns the change would push past full scale are red.
+class WaveformView(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.path = None
+        self.peaks = None
+        self.gain = 1.0
+        self.start = 0.0
+        self.end = 0.0
+        self.setMinimumHeight(120)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+
+    def setFile(self, path, volume_diff):
+        # numpy comes with the first waveform, not with the window
+        from audio_editor.waveform import loadPeaks
+
+        if path != self.path or self.peaks is None:
+            self.path = path
+            self.peaks = loadPeaks(path) if path else None
+            self.start = 0.0
+            self.end = self.peaks.duration if self.peaks else 0.0
+
+        self.setVolumeDiff(volume_diff)
+
+    def setVolumeDiff(self, volume_diff):
+        self.gain = 10 ** (volume_diff / 20)
+        self.update()
+
+    # sample peak of the whole file after the change, in dBFS
+    def peakAfter(self):
+        top = self.peaks.levels[-1]
+        peak = float(abs(top).max()) * self.gain if len(top) else 0.0
+
+        return 20 * math.log10(peak) if peak > 0 else -math.inf
+
+    def wheelEvent(self, event):
+        if not self.peaks or self.end <= self.start or self.width() == 0:
+            return
+
+        anchor = self.start + (self.end - self.start) * event.position().x() / self.width()
+        factor = 1 / ZOOM_STEP if event.angleDelta().y() > 0 else ZOOM_STEP
+        span = min(self.peaks.duration, max(MIN_SPAN, (self.end - self.start) * factor))
+
+        self.start = min(max(0.0, anchor - (anchor - self.start) / (self.end - self.start) * span), self.peaks.duration - span)
+        self.end = self.start + span
+        self.update()
+
+    def mouseDoubleClickEvent(self, event):
+        if self.peaks:
+            self.start, self.end = 0.0, self.peaks.duration
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        width = self.width()
+        # the caption gets its own strip above the waveform
+        amplitude = (self.height() - CAPTION_HEIGHT) / 2
+        middle = CAPTION_HEIGHT + amplitude
+
+        if not self.peaks:
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, 'no waveform yet' if self.path else '')
+            return
+
+        low, high = self.peaks.columns(self.start, self.end, width)
+
+        for x in range(len(low)):
+            painter.setPen(SOURCE_COLOR)
+            painter.drawLine(x, int(middle - high[x] * amplitude), x, int(middle - low[x] * amplitude))
+
+            after_low, after_high = low[x] * self.gain, high[x] * self.gain
+            painter.setPen(CLIPPED_COLOR if after_high > 1 or after_low < -1 else WAVEFORM_COLOR)
+            painter.drawLine(x, int(middle - min(after_high, 1) * amplitude), x, int(middle - max(after_low, -1) * amplitude))
+
+        peak = self.peakAfter()
+        clips = ', clips' if peak > 0 else ''
+        painter.setPen(CLIPPED_COLOR if peak > 0 else WAVEFORM_COLOR)
+        painter.drawText(4, CAPTION_HEIGHT - 4, f'{self.start:.1f}s - {self.end:.1f}s, peak after change: {peak:.2f} dBFS{clips}')
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -140,31 +545,432 @@ class MainWindow(QMainWindow):
         self.setUpUI()
         self.dir_path = ""
         self.background_color = 'Default (Inherited)'
+        self.file_loaders = {}
+        self.estimate_loaders = {}
+        self.pending_recipes = {}
+        # files decoded again for their peaks: a sidecar that couldn't be saved isn't retried
+        self.peak_retries = set()
+        self.batch_runner = None
+        self.watcher = None
+        self.watch_notifier = None
+        self.watch_names = set()
+        self.watch_started_at = None
         self.thread_pool = QThreadPool()
-        self.thread_pool.setMaxThreadCount(int(os.cpu_count()/2))
+        self.thread_pool.setMaxThreadCount(poolSize())
+
+        # the walk blocks on the header loaders, so it must not take one of their threads
+        self.scan_loader = None
+        self.scan_pool = QThreadPool()
+        self.scan_pool.setMaxThreadCount(1)
+
+        # grows the pool while cores idle and loaders wait, shrinks it when the cpu is oversubscribed.
+        # starts with the first workspace, like the pools' threads do.
+        self.cpu_monitor = None
+        self.adjust_timer = QTimer()
+        self.adjust_timer.setInterval(int(ADJUST_INTERVAL * 1000))
+        self.adjust_timer.timeout.connect(self.adjustPoolSize)
+
+        self.watch_timer = QTimer()
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(WATCH_DEBOUNCE)
+        self.watch_timer.timeout.connect(self.applyDirectoryChanges)
+
+        self.poll_timer = QTimer()
+        self.poll_timer.setInterval(POLL_INTERVAL)
+        self.poll_timer.timeout.connect(self.onPoll)
+
+    # first turn of the event loop, the window is on screen: the startup time ends here.
+    # then the last workspace comes back, its headers and measurements from the analysis cache.
+    @trace.handler
+    def onStarted(self):
+        ready_at = trace.now()
+        seconds = (ready_at - STARTED_AT) / 1e6
+        trace.complete('startup', 'ui', STARTED_AT, ready_at)
+
+        if STARTUP_PROBE:
+            print(f'startup {seconds:.4f}', flush=True)
+            QApplication.instance().quit()
+            return
 
+        self.statusBar().showMessage(f'ready in {seconds * 1000:.0f} ms')
+        workspace = lastWorkspace()
+
+        if workspace:
+            self.loadDirectory(workspace)
+            self.drawUI()
+
+    @trace.handler
+    def adjustPoolSize(self):
+        utilization, runnable = self.cpu_monitor.sample()
+        limit = self.thread_pool.maxThreadCount()
+        waiting = bool(self.file_loaders) and self.thread_pool.activeThreadCount() >= limit
+
+        self.thread_pool.setMaxThreadCount(adjust(limit, utilization, runnable, waiting))
+
+    @trace.handler
     def loadDirectory(self, dir_path):
-        if self.dir_path != dir_path:
-            self.dir_path = dir_path
-            audio_files.clear()
-            self.file_list.clear()
-            self.directory_label.setText(f'workspace: {dir_path}')
+        # the same workspace again: pick up what changed, everything else keeps its state
+        if self.dir_path == dir_path:
+            self.watch_names = None
+            self.applyDirectoryChanges()
+            return
+
+        self.dir_path = dir_path
+        self.file_list_model.reset()
+        saveWorkspace(dir_path)
+
+        if not self.adjust_timer.isActive():
+            self.cpu_monitor = CpuMonitor()
+            self.adjust_timer.start()
+
+        for full_name in list(self.file_loaders) + list(self.estimate_loaders):
+            self.forget(full_name)
+
+        self.directory_label.setText(f'workspace: {dir_path}')
+        self.peak_retries.clear()
+
+        # reservations of a batch that was interrupted last time
+        self.pending_recipes = {}
+
+        for recipe in shared_journal().unfinished(dir_path):
+            self.pending_recipes.setdefault(os.path.relpath(recipe['source'], dir_path), []).append(recipe)
+
+        if self.pending_recipes:
+            self.statusBar().showMessage(f'{len(self.pending_recipes)} unfinished job(s) restored, press Apply to resume')
+
+        self.watch(dir_path)
+
+        if self.scan_loader:
+            self.scan_loader.stop()
+
+        self.scan_loader = ScanLoader(self.watcher)
+        self.scan_loader.signals.found.connect(self.onFilesFound)
+        self.scan_loader.signals.finished.connect(self.onScanFinished)
+        self.scan_pool.start(self.scan_loader)
+
+    @trace.handler
+    def onFilesFound(self, found):
+        scan_loader, sources = found
+
+        # from the walk of a previous workspace
+        if scan_loader is not self.scan_loader:
+            return
+
+        for full_name, container in sources:
+            self.loadHeader(full_name, scan_loader.slots, container)
+
+        self.checkWatchMode()
+
+    @trace.handler
+    def onScanFinished(self, result):
+        scan_loader, scanner = result
+
+        if scan_loader is not self.scan_loader:
+            return
+
+        skipped = f', {scanner.skipped} skipped (not audio despite the name)' if scanner.skipped else ''
+        self.statusBar().showMessage(f'{len(self.watcher.files)} file(s) in {scanner.directories} folder(s){skipped}')
+        self.checkWatchMode()
+
+    def loadHeader(self, full_name, slots=None, container=None):
+        header_loader = HeaderLoader(self.dir_path, full_name, slots, container)
+        header_loader.signals.finished.connect(self.onHeaderLoaded)
+
+        self.thread_pool.start(header_loader, PRIORITY_HEADER)
+
+    # drops queued analysis; a running one finishes, but onFileAnalyzed ignores it
+    def forget(self, full_name):
+        for file_loader in self.file_loaders.pop(full_name, []):
+            self.thread_pool.tryTake(file_loader)
+
+        self.forgetEstimate(full_name)
+
+    def forgetEstimate(self, full_name):
+        estimate_loader = self.estimate_loaders.pop(full_name, None)
+
+        if estimate_loader:
+            self.thread_pool.tryTake(estimate_loader)
+
+    def watch(self, dir_path):
+        if self.watcher:
+            self.watch_notifier = None
+            self.watcher.close()
+
+        self.watch_timer.stop()
+        self.poll_timer.stop()
+        self.watch_names = set()
+        self.watcher = DirectoryWatcher(dir_path)
+
+        if self.watcher.polling:
+            self.poll_timer.start()
         else:
-            for _, v in audio_files.items():
-                v.clear()
-            
-            for i in range(self.file_list.count()):
-                self.file_list.item(i).setBackground(QColor('#7fc97f'))
+            self.watch_notifier = QSocketNotifier(self.watcher.fileno(), QSocketNotifier.Type.Read)
+            self.watch_notifier.activated.connect(self.onDirectoryEvent)
+
+    # a tree with more folders than inotify watches left is polled as a whole
+    def checkWatchMode(self):
+        if self.watcher.polling and not self.poll_timer.isActive():
+            self.watch_notifier = None
+            self.watcher.close()
+            self.poll_timer.start()
+
+    @trace.handler
+    def onDirectoryEvent(self):
+        names = self.watcher.names()
+        self.checkWatchMode()
+
+        if names is None or self.watch_names is None:
+            self.watch_names = None
+        else:
+            self.watch_names |= names
 
-        for file in os.listdir(dir_path):
-            if file not in audio_files.keys():
-                name, ext = os.path.splitext(file)
+        if not self.watch_timer.isActive():
+            self.watch_started_at = time.monotonic()
+
+        # a steady stream of events still gets applied every WATCH_MAX_DELAY
+        if (time.monotonic() - self.watch_started_at) * 1000 < WATCH_MAX_DELAY or not self.watch_timer.isActive():
+            self.watch_timer.start()
+
+    @trace.handler
+    def onPoll(self):
+        self.watch_names = None
+        self.applyDirectoryChanges()
+
+    @trace.handler
+    def applyDirectoryChanges(self):
+        added, removed, modified = self.watcher.changes(self.watch_names)
+        self.watch_names = set()
+        self.watch_timer.stop()
+
+        if not (added or removed or modified):
+            return
+
+        current = self.currentFileName()
+
+        for full_name in removed + modified:
+            self.forget(full_name)
+            self.pending_recipes.pop(full_name, None)
+
+        if current in modified:
+            self.waveform_view.setFile(None, 0.0)
+
+        orphans = {d for full_name in removed if full_name in catalog for d in catalog.duplicatesOf(full_name)}
+        self.file_list_model.remove([full_name for full_name in removed if full_name in catalog])
 
-                if ext in ('.mp4', '.mp3', '.m4a', '.flac'):
-                    file_loader = FileLoader(dir_path, file, name, ext)
-                    file_loader.signals.finished.connect(self.file_list.addItem)
-                    
-                    self.thread_pool.start(file_loader)
+        for full_name in orphans - set(removed):
+            self.file_list_model.refresh(full_name)
+
+        # a reset loses the selection, put it back if the file is still there
+        if current in catalog and self.currentFileName() != current:
+            self.file_list.setCurrentIndex(self.file_list_model.index(catalog.rowOf(current)))
+
+        # changed files start over from their header; edits made to the old content are dropped
+        for full_name in added + modified:
+            self.loadHeader(full_name)
+
+        self.statusBar().showMessage(f'{self.dir_path}: {len(added)} added, {len(removed)} removed, {len(modified)} changed')
+        self.drawUI()
+
+    @trace.handler
+    def onHeaderLoaded(self, result):
+        dir_path, full_name, audio_file = result
+
+        # a header from the previous workspace, or of a file removed since
+        if dir_path != self.dir_path or full_name not in self.watcher.files:
+            return
+
+        if full_name in catalog:
+            orphans = catalog.duplicatesOf(full_name)
+            catalog.replace(full_name, audio_file)
+
+            for duplicate in [full_name, *orphans]:
+                self.file_list_model.refresh(duplicate)
+        else:
+            self.file_list_model.add(audio_file, full_name)
+
+        if audio_file.analyzed:
+            self.restoreReservation(full_name)
+            return
+
+        # unreadable: analyzing it would fail the same way
+        if audio_file.error:
+            return
+
+        self.analyze(full_name, PRIORITY_BACKGROUND)
+
+        if self.estimate_check_box.isChecked():
+            self.estimate(full_name)
+
+        # not published yet, prioritizeVisible picks it up once it is
+        row = catalog.rowOf(full_name)
+
+        if row < self.file_list_model.published and self.file_list.visualRect(self.file_list_model.index(row)).intersects(self.file_list.viewport().rect()):
+            self.prioritize(full_name, PRIORITY_VISIBLE)
+
+    def analyze(self, full_name, priority):
+        from audio_editor.loudness import SEGMENT_THRESHOLD, SegmentedAnalysis
+
+        if full_name in self.file_loaders:
+            return
+
+        duration = catalog[full_name].duration
+
+        if duration and duration >= SEGMENT_THRESHOLD:
+            segments = SegmentedAnalysis(os.path.join(self.dir_path, full_name), duration, reuse=shared_cache().findAudio)
+            file_loaders = [
+                FileLoader(self.dir_path, full_name, min(segments.segment_length, duration - i * segments.segment_length), segments, i)
+                for i in range(segments.count)
+            ]
+        else:
+            file_loaders = [FileLoader(self.dir_path, full_name, duration)]
+
+        self.file_loaders[full_name] = file_loaders
+
+        for file_loader in file_loaders:
+            file_loader.priority = max(file_loader.priority, priority)
+            file_loader.setAutoDelete(False)
+            file_loader.signals.finished.connect(self.onFileAnalyzed)
+            self.thread_pool.start(file_loader, file_loader.priority)
+
+    def estimate(self, full_name):
+        if full_name in self.estimate_loaders:
+            return
+
+        estimate_loader = EstimateLoader(self.dir_path, full_name)
+        estimate_loader.setAutoDelete(False)
+        estimate_loader.signals.finished.connect(self.onFileEstimated)
+
+        self.estimate_loaders[full_name] = estimate_loader
+        self.thread_pool.start(estimate_loader, estimate_loader.priority)
+
+    @trace.handler
+    def onFileEstimated(self, result):
+        absolute_path, metadata = result
+        full_name = os.path.relpath(absolute_path, self.dir_path)
+        estimate_loader = self.estimate_loaders.get(full_name)
+
+        if estimate_loader is None or estimate_loader.signals is not self.sender():
+            return
+
+        self.estimate_loaders.pop(full_name)
+
+        if full_name not in catalog or catalog[full_name].getBeforePath() != absolute_path:
+            return
+
+        # a short file measured in full: the queued analysis has nothing left to do
+        if not metadata.get('estimated'):
+            for file_loader in self.file_loaders.pop(full_name, []):
+                self.thread_pool.tryTake(file_loader)
+
+            self.updateLoudness(full_name, metadata)
+        elif not catalog[full_name].analyzed:
+            catalog.updateLoudness(full_name, metadata)
+            self.file_list_model.refresh(full_name)
+
+            if full_name == self.currentFileName():
+                self.drawUI()
+
+    @trace.handler
+    def onFileAnalyzed(self, result):
+        absolute_path, metadata = result
+        full_name = os.path.relpath(absolute_path, self.dir_path)
+
+        # from a loader forgotten since: another workspace, or content that changed again
+        if not any(file_loader.signals is self.sender() for file_loader in self.file_loaders.get(full_name, [])):
+            return
+
+        self.file_loaders.pop(full_name)
+
+        if full_name not in catalog or catalog[full_name].getBeforePath() != absolute_path:
+            return
+
+        self.forgetEstimate(full_name)
+
+        if 'error' in metadata:
+            catalog.edit(full_name, error=metadata['error'])
+            self.file_list_model.refresh(full_name)
+
+            if full_name == self.currentFileName():
+                self.drawUI()
+
+            return
+
+        self.updateLoudness(full_name, metadata)
+
+    # full measurements in: they replace an estimate, but a second pass that only rebuilt
+    # the waveform keeps the edits made meanwhile
+    def updateLoudness(self, full_name, metadata):
+        if not catalog[full_name].analyzed or catalog[full_name].estimated:
+            catalog.updateLoudness(full_name, metadata)
+
+        self.file_list_model.refresh(full_name)
+
+        # the copies found earlier are duplicates now as well
+        for duplicate in catalog.duplicatesOf(full_name):
+            self.file_list_model.refresh(duplicate)
+
+        self.restoreReservation(full_name)
+
+        if full_name == self.currentFileName():
+            self.drawUI()
+
+    def restoreReservation(self, full_name):
+        recipes = self.pending_recipes.pop(full_name, None)
+
+        if not recipes:
+            return
+
+        # the output named like a single-target job is the main one, the rest were extra targets
+        audio_file = catalog[full_name]
+        main_output = os.path.join(audio_file.directory, audio_file.filename_after)
+        recipe = next((r for r in recipes if os.path.splitext(r['output'])[0] == main_output), recipes[0])
+
+        catalog.edit(
+            full_name,
+            mean_volume_after=round(audio_file.mean_volume + recipe['volume_diff'], 2),
+            extension_after=recipe['extension'],
+            bitrate_after=recipe['bitrate'],
+            gain_mode=recipe['gain_mode'],
+            extra_targets=[(r['extension'], r['bitrate']) for r in recipes if r is not recipe]
+        )
+        catalog.edit(full_name, reserved=audio_file.isChanged())
+
+        self.file_list_model.refresh(full_name)
+        self.drawApplyButton()
+
+    # move a queued analysis ahead of the background work
+    def prioritize(self, full_name, priority):
+        # the estimate is the quicker answer, so it goes just ahead of the file's own analysis
+        estimate_loader = self.estimate_loaders.get(full_name)
+
+        if estimate_loader and estimate_loader.priority <= priority and self.thread_pool.tryTake(estimate_loader):
+            estimate_loader.priority = priority + 1
+            self.thread_pool.start(estimate_loader, estimate_loader.priority)
+
+        for file_loader in self.file_loaders.get(full_name, []):
+            if file_loader.priority < priority and self.thread_pool.tryTake(file_loader):
+                file_loader.priority = priority
+                self.thread_pool.start(file_loader, priority)
+
+    @trace.handler
+    def prioritizeVisible(self):
+        viewport = self.file_list.viewport().rect()
+        top = self.file_list.indexAt(viewport.topLeft()).row()
+        bottom = self.file_list.indexAt(viewport.bottomLeft()).row()
+
+        if top == -1:
+            return
+
+        if bottom == -1:
+            bottom = self.file_list_model.published - 1
+
+        for row in range(top, bottom + 1):
+            self.prioritize(catalog.nameAt(row), PRIORITY_VISIBLE)
+
+    def currentFileName(self):
+        index = self.file_list.currentIndex()
+
+        return self.file_list_model.data(index) if index.isValid() else None
 
     # 디렉토리 선택 팝업 노출
     def selectDirectory(self):
@@ -184,114 +990,314 @@ class MainWindow(QMainWindow):
         return index
     
     def drawApplyButton(self):
-        reserve_count = sum(1 for v in audio_files.values() if v.reserved is True)
+        if self.batch_runner:
+            return
+
+        reserve_count = catalog.reserved_count
 
-        if reserve_count > 0 and self.file_list.count() > 0:
+        self.apply_button.setToolTip(f'{catalog.changed_count} file(s) with edits')
+
+        if reserve_count > 0:
             self.apply_button.setEnabled(True)
             self.apply_button.setText(f'3. Apply (total: {reserve_count})')
         else:
             self.apply_button.setEnabled(False)
             self.apply_button.setText('3. Apply')
 
+    @trace.handler
     def drawUI(self):
-        if not self.file_list.currentItem():
+        if not self.currentFileName():
             return
         
-        current_file = audio_files[self.file_list.currentItem().text()]
+        current_file = catalog[self.currentFileName()]
         
-        self.metadata_label.setText(current_file.getBeforeData())
+        duplicates = catalog.duplicatesOf(self.currentFileName())
+        self.metadata_label.setText(current_file.getBeforeData() + ''.join(f'\nsame audio: {d}' for d in duplicates))
         self.metadata_after_label.setText(current_file.getAfterData())
 
-        self.volume_double_spin_box.setValue(current_file.mean_volume_after)
-        self.volume_double_spin_box.setEnabled(True)
+        if current_file.analyzed:
+            self.volume_double_spin_box.setValue(current_file.mean_volume_after)
+            self.waveform_view.setFile(current_file.getBeforePath(), current_file.getVolumeDiff())
+
+            # measured before waveforms were kept: decode once more for the peaks
+            if self.waveform_view.peaks is None and current_file.getBeforePath() not in self.peak_retries:
+                self.peak_retries.add(current_file.getBeforePath())
+                self.analyze(self.currentFileName(), PRIORITY_SELECTED)
+        else:
+            self.waveform_view.setFile(None, 0.0)
+
+        self.volume_double_spin_box.setEnabled(current_file.analyzed)
 
         self.bitrate_combo_box.setCurrentIndex(self.findIndexInComboBox(self.bitrate_combo_box, current_file.bitrate_after))
-        self.bitrate_combo_box.setEnabled(False if current_file.extension == '.flac' else True)
+        self.bitrate_combo_box.setEnabled(False if current_file.container == '.flac' else True)
 
+        # a misnamed file can be given the name of what it holds, which is a plain copy
+        self.findIndexInComboBox(self.extension_combo_box, current_file.container)
+        self.extension_combo_box.setToolTip(f'holds {current_file.container} audio' if current_file.container != current_file.extension else '')
         self.extension_combo_box.setCurrentIndex(self.findIndexInComboBox(self.extension_combo_box, current_file.extension_after))
         self.extension_combo_box.setEnabled(True)
 
+        self.gain_mode_combo_box.setCurrentIndex(self.gain_mode_combo_box.findData(current_file.gain_mode))
+        self.gain_mode_combo_box.setEnabled(current_file.analyzed)
+        self.undo_gain_button.setEnabled(isOutput(current_file.getBeforePath()) and supportsGain(current_file.container))
+
+        self.extra_targets_edit.setText(', '.join(f'{e} {b}' for e, b in current_file.extra_targets))
+        self.extra_targets_edit.setEnabled(current_file.analyzed)
+
         self.reserve_button.setEnabled(current_file.canReserve())
         self.drawApplyButton()
 
+    @trace.handler
     def onSelectedFileChanged(self):
+        if self.currentFileName():
+            self.prioritize(self.currentFileName(), PRIORITY_SELECTED)
+
         self.drawUI()
 
-    def observeComplete(self, value):
-        self.count = self.count + value
-    
-        if self.max_count < self.count:
-            self.max_count = 0
-            self.count = 0
-                
-            self.loadDirectory(self.dir_path)
-            self.drawUI()
+    @trace.handler
+    def onBatchFinished(self, kinds):
+        self.batch_runner = None
+        self.cancel_button.setEnabled(False)
+        self.cancel_all_button.setEnabled(False)
 
-            self.apply_button.setEnabled(False)
+        # done jobs give up their reservation, failed and cancelled ones keep it for another try.
+        # the outputs show up through the watcher.
+        for path, kind in kinds.items():
+            full_name = os.path.relpath(path, self.dir_path)
+
+            if full_name in catalog and kind not in (FAILED, CANCELLED, TIMEOUT):
+                catalog.edit(full_name, reserved=False)
+                self.file_list_model.mark(full_name)
+
+                # show the volume a lossless gain really reached, not the one asked for
+                audio_file = catalog[full_name]
+
+                if audio_file.applied_volume_diff is not None:
+                    catalog.edit(full_name, mean_volume_after=round(audio_file.mean_volume + audio_file.applied_volume_diff, 2), applied_volume_diff=None)
+
+        self.drawUI()
+        self.drawApplyButton()
+
+    @trace.handler
+    def onBatchProgress(self, progress):
+        file_name, job_progress, stats = progress
+
+        eta = '?' if stats['eta'] is None else f'{stats["eta"]:.0f}s'
+        self.progress_bar.setValue(int(stats['fraction'] * 1000))
+        self.progress_bar.setFormat(f'{stats["done"]}/{stats["total"]} files, {stats["realtime_factor"]:.1f}x realtime, ETA {eta}')
 
+        if not job_progress.done:
+            speed = f'{job_progress.speed:.1f}x' if job_progress.speed else '?'
+            fraction = job_progress.position / job_progress.duration if job_progress.duration else 0
+            job_eta = '?' if job_progress.eta() is None else f'{job_progress.eta():.0f}s'
+            self.statusBar().showMessage(f'{file_name}: {fraction:.0%} at {speed}, ETA {job_eta}')
+
+    def onUndoGainButtonClicked(self):
+        full_name = self.currentFileName()
+
+        if not full_name:
+            return
+
+        gain_undoer = GainUndoer(self.dir_path, full_name, catalog[full_name].container)
+        gain_undoer.signals.finished.connect(self.onGainUndone)
+
+        self.undo_gain_button.setEnabled(False)
+        self.thread_pool.start(gain_undoer, PRIORITY_SELECTED)
+
+    @trace.handler
+    def onGainUndone(self, result):
+        full_name, message = result
+        self.statusBar().showMessage(f'{full_name}: {message}')
+
+    def onCancelButtonClicked(self):
+        if self.batch_runner and self.currentFileName():
+            self.batch_runner.orchestrator.cancel(os.path.join(self.dir_path, self.currentFileName()))
+
+    def onCancelAllButtonClicked(self):
+        if self.batch_runner:
+            self.batch_runner.orchestrator.cancel()
+
+    @trace.handler
+    def onJobReported(self, report):
+        file_name, kind = report
+        self.job_reports[file_name] = kind
+
+        kinds = list(self.job_reports.values())
+        summary = ', '.join(f'{k}: {kinds.count(k)}' for k in sorted(set(kinds)))
+        hits = kinds.count(CACHED)
+        misses = sum(1 for k in kinds if k not in (CACHED, FAILED, CANCELLED, TIMEOUT))
+        self.statusBar().showMessage(f'{file_name} -> {kind} ({summary}; cache hits: {hits}, misses: {misses})')
+
+        # the orchestrator left what went wrong on the file
+        if kind == FAILED and file_name in catalog:
+            self.file_list_model.refresh(file_name)
+            error = catalog[file_name].error
+
+            if error:
+                self.statusBar().showMessage(f'{file_name} -> {kind}: {JobError(**error)} ({summary})')
+
+    @trace.handler
     def onApplyButtonClicked(self):
-        self.reserve_button.setEnabled(False)
-        self.apply_button.setEnabled(False)
-        self.count = 0
-        self.max_count = 0
+        reserved = catalog.reserved()
+
+        # a gain set against an estimate only goes out when asked for, the rest stays reserved
+        if not self.apply_estimated_check_box.isChecked():
+            estimated = [v for v in reserved if v.estimated]
+            reserved = [v for v in reserved if not v.estimated]
 
-        for _, v in audio_files.items():
-            if v.reserved:
-                fileEditor = FileEditor(v)
-                fileEditor.signals.finished.connect(self.observeComplete)
-                self.thread_pool.start(fileEditor)
+            if estimated:
+                self.statusBar().showMessage(f'{len(estimated)} file(s) held back until their analysis finishes')
+
+        if not reserved:
+            return
 
-        return
+        self.reserve_button.setEnabled(False)
+        self.apply_button.setEnabled(False)
+        self.apply_button.setText('3. Apply (running)')
+        self.job_reports = {}
+
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat(f'0/{len(reserved)} files')
+        self.cancel_button.setEnabled(True)
+        self.cancel_all_button.setEnabled(True)
+
+        self.batch_runner = BatchRunner(self.dir_path, reserved)
+        self.batch_runner.signals.progress.connect(self.onBatchProgress)
+        self.batch_runner.signals.reported.connect(self.onJobReported)
+        self.batch_runner.signals.finished.connect(self.onBatchFinished)
+        self.thread_pool.start(self.batch_runner, PRIORITY_HEADER)
     
+    @trace.handler
     def onReserveButtonClicked(self):    
-        item = self.file_list.currentItem()
-        current_file = audio_files[item.text()]
+        full_name = self.currentFileName()
+        current_file = catalog[full_name]
        
-        current_file.reserved = current_file.isChanged()
+        catalog.edit(full_name, reserved=current_file.isChanged())
 
-        if current_file.reserved:
-            brush = item.background()
-            item.setBackground(brush)
+        if not current_file.reserved:
+            self.file_list_model.mark(full_name)
         else:
-            item.setBackground(QColor('#7fc97f'))
+            self.file_list_model.refresh(full_name)
 
         self.reserve_button.setEnabled(current_file.canReserve())
 
         self.drawUI()
 
+    @trace.handler
     def onExtensionChanged(self, text):
-        current_file = audio_files[self.file_list.currentItem().text()]
+        full_name = self.currentFileName()
+        current_file = catalog[full_name]
 
         if current_file.extension_after == text:
             return
         
-        current_file.extension_after = text
+        catalog.edit(full_name, extension_after=text)
             
         self.reserve_button.setEnabled(current_file.canReserve())
         self.metadata_after_label.setText(current_file.getAfterData())        
 
+    @trace.handler
     def onBitrateChanged(self, text):
-        current_file = audio_files[self.file_list.currentItem().text()]
+        full_name = self.currentFileName()
+        current_file = catalog[full_name]
 
         if current_file.bitrate_after == text:
             return
 
-        current_file.bitrate_after = text
+        catalog.edit(full_name, bitrate_after=text)
 
         self.reserve_button.setEnabled(current_file.canReserve())
         self.metadata_after_label.setText(current_file.getAfterData())        
 
+    @trace.handler
+    def onGainModeChanged(self, index):
+        full_name = self.currentFileName()
+        current_file = catalog[full_name]
+        gain_mode = self.gain_mode_combo_box.itemData(index)
+
+        if current_file.gain_mode == gain_mode:
+            return
+
+        catalog.edit(full_name, gain_mode=gain_mode)
+
+        self.metadata_after_label.setText(current_file.getAfterData())
+
+    @trace.handler
     def onVolumeChanged(self, value):
-        current_file = audio_files[self.file_list.currentItem().text()]
+        full_name = self.currentFileName()
+        current_file = catalog[full_name]
 
         if current_file.mean_volume_after == value:
             return
         
-        current_file.mean_volume_after = value
+        catalog.edit(full_name, mean_volume_after=value)
 
         self.reserve_button.setEnabled(current_file.canReserve())
         self.metadata_after_label.setText(current_file.getAfterData())
+        self.waveform_view.setVolumeDiff(current_file.getVolumeDiff())
         
+    # one gain computation for the whole scope, then a single pass that sets and reserves
+    @trace.handler
+    def onNormalizeButtonClicked(self):
+        scope = self.normalize_scope_combo_box.currentData()
+        current = self.currentFileName()
+
+        if scope == SCOPE_SELECTED:
+            full_names = [catalog.nameAt(index.row()) for index in self.file_list.selectionModel().selectedIndexes()]
+        elif scope == SCOPE_FOLDER and current:
+            directory = catalog[current].directory
+            full_names = [full_name for full_name, audio_file in zip(catalog.names, catalog.files) if audio_file.directory == directory]
+        elif scope == SCOPE_ALL:
+            full_names = list(catalog.names)
+        else:
+            full_names = []
+
+        analyzed = [full_name for full_name in full_names if catalog[full_name].analyzed]
+        measured = [full_name for full_name in analyzed if isNormalizable(catalog[full_name])]
+        target = self.normalize_target_spin_box.value()
+        mode = self.normalize_mode_combo_box.currentData()
+
+        volumes = normalizedVolumes([catalog[full_name] for full_name in measured], target, self.normalize_ceiling_spin_box.value(), mode)
+        catalog.reserveVolumes(measured, volumes)
+
+        self.file_list_model.refreshAll()
+
+        waiting = f', {len(full_names) - len(analyzed)} still analyzing' if len(full_names) > len(analyzed) else ''
+        unmeasured = f', {len(analyzed) - len(measured)} left as they are (no loudness measurement)' if len(analyzed) > len(measured) else ''
+        self.statusBar().showMessage(f'{len(measured)} file(s) normalized to {target} LUFS per {mode}{waiting}{unmeasured}')
+        self.drawUI()
+
+    # ".m4a 320K, .mp3 128K"; a missing bitrate means the main output's
+    @trace.handler
+    def onExtraTargetsChanged(self):
+        full_name = self.currentFileName()
+
+        if not full_name:
+            return
+
+        current_file = catalog[full_name]
+        extra_targets = []
+
+        for part in self.extra_targets_edit.text().split(','):
+            words = part.split()
+
+            if not words:
+                continue
+
+            if words[0] not in EXTENSIONS:
+                self.statusBar().showMessage(f'unknown extension: {words[0]}')
+                continue
+
+            extra_targets.append((words[0], words[1] if len(words) > 1 else current_file.bitrate_after))
+
+        if current_file.extra_targets == extra_targets:
+            return
+
+        catalog.edit(full_name, extra_targets=extra_targets)
+
+        self.reserve_button.setEnabled(current_file.canReserve())
+        self.metadata_after_label.setText(current_file.getAfterData())
+
     def setUpUI(self):
         layout = QGridLayout()
 
@@ -303,12 +1309,23 @@ class MainWindow(QMainWindow):
         
         self.directory_label = QLabel('', self)
         self.directory_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        layout.addWidget(self.directory_label, 0, 1, 1, 2)
+        layout.addWidget(self.directory_label, 0, 1)
+
+        self.estimate_check_box = QCheckBox('quick estimates', self)
+        self.estimate_check_box.setToolTip('measure a few short windows of long files first, the full analysis follows')
+        self.estimate_check_box.setChecked(True)
+        layout.addWidget(self.estimate_check_box, 0, 2)
 
-        self.file_list = QListWidget()
+        self.file_list_model = FileListModel(catalog)
+
+        self.file_list = QListView()
+        self.file_list.setModel(self.file_list_model)
+        self.file_list.setUniformItemSizes(True)
+        self.file_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.file_list.setMinimumWidth(300)
         self.file_list.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Expanding)
-        self.file_list.currentItemChanged.connect(self.onSelectedFileChanged)
+        self.file_list.selectionModel().currentChanged.connect(self.onSelectedFileChanged)
+        self.file_list.verticalScrollBar().valueChanged.connect(self.prioritizeVisible)
         layout.addWidget(self.file_list, 1, 0, 3, 1)
         
         self.metadata_label = QLabel('', self)
@@ -323,46 +1340,134 @@ class MainWindow(QMainWindow):
         self.metadata_after_label.setAlignment(Qt.AlignmentFlag.AlignLeft)
         layout.addWidget(self.metadata_after_label, 3, 1, 1, 2)
 
+        self.waveform_view = WaveformView(self)
+        layout.addWidget(self.waveform_view, 4, 0, 1, 3)
+
         self.extension_label = QLabel('extension', self)
         self.extension_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        layout.addWidget(self.extension_label, 4, 0)
+        layout.addWidget(self.extension_label, 5, 0)
 
         self.extension_combo_box = QComboBox(self)
         self.extension_combo_box.addItem('.m4a')
         self.extension_combo_box.addItem('.mp3')
         self.extension_combo_box.addItem('.mp4')
         self.extension_combo_box.currentTextChanged.connect(self.onExtensionChanged)
-        layout.addWidget(self.extension_combo_box, 4, 1, 1, 2)
+        layout.addWidget(self.extension_combo_box, 5, 1, 1, 2)
 
         self.bitrate_label = QLabel('bitrate', self)
         self.bitrate_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        layout.addWidget(self.bitrate_label, 5, 0)
+        layout.addWidget(self.bitrate_label, 6, 0)
 
         self.bitrate_combo_box = QComboBox(self)
         self.bitrate_combo_box.addItem('192K')
         self.bitrate_combo_box.addItem('320K')
         self.bitrate_combo_box.currentTextChanged.connect(self.onBitrateChanged)
-        layout.addWidget(self.bitrate_combo_box, 5, 1, 1, 2)
+        layout.addWidget(self.bitrate_combo_box, 6, 1, 1, 2)
 
         self.volume_label = QLabel('mean volume', self)
         self.volume_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        layout.addWidget(self.volume_label, 6, 0)
+        layout.addWidget(self.volume_label, 7, 0)
 
         self.volume_double_spin_box = QDoubleSpinBox()
         self.volume_double_spin_box.setRange(-100, 100)
         self.volume_double_spin_box.setSingleStep(0.05)
         self.volume_double_spin_box.valueChanged.connect(self.onVolumeChanged)
-        layout.addWidget(self.volume_double_spin_box, 6, 1, 1, 2)
+        layout.addWidget(self.volume_double_spin_box, 7, 1, 1, 2)
+
+        self.gain_mode_label = QLabel('volume change', self)
+        self.gain_mode_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.gain_mode_label, 8, 0)
+
+        self.gain_mode_combo_box = QComboBox(self)
+        self.gain_mode_combo_box.addItem('re-encode', ENCODE)
+        self.gain_mode_combo_box.addItem('lossless gain (mp3gain / ReplayGain tag)', GAIN)
+        self.gain_mode_combo_box.setEnabled(False)
+        self.gain_mode_combo_box.currentIndexChanged.connect(self.onGainModeChanged)
+        layout.addWidget(self.gain_mode_combo_box, 8, 1)
+
+        self.undo_gain_button = QPushButton('undo gain', self)
+        self.undo_gain_button.setToolTip('revert the lossless gain written into this output')
+        self.undo_gain_button.setEnabled(False)
+        self.undo_gain_button.clicked.connect(self.onUndoGainButtonClicked)
+        layout.addWidget(self.undo_gain_button, 8, 2)
+
+        self.normalize_label = QLabel('normalize', self)
+        self.normalize_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.normalize_label, 9, 0)
+
+        self.normalize_target_spin_box = QDoubleSpinBox()
+        self.normalize_target_spin_box.setRange(-70, 0)
+        self.normalize_target_spin_box.setSingleStep(0.5)
+        self.normalize_target_spin_box.setSuffix(' LUFS')
+        self.normalize_target_spin_box.setValue(DEFAULT_TARGET)
+
+        self.normalize_ceiling_spin_box = QDoubleSpinBox()
+        self.normalize_ceiling_spin_box.setRange(-20, 0)
+        self.normalize_ceiling_spin_box.setSingleStep(0.1)
+        self.normalize_ceiling_spin_box.setPrefix('peak ≤ ')
+        self.normalize_ceiling_spin_box.setSuffix(' dBFS')
+        self.normalize_ceiling_spin_box.setValue(DEFAULT_CEILING)
+
+        self.normalize_mode_combo_box = QComboBox(self)
+        self.normalize_mode_combo_box.addItem('per track', TRACK)
+        self.normalize_mode_combo_box.addItem('per album (folder)', ALBUM)
+
+        self.normalize_scope_combo_box = QComboBox(self)
+        self.normalize_scope_combo_box.addItem('selected files', SCOPE_SELECTED)
+        self.normalize_scope_combo_box.addItem('current folder', SCOPE_FOLDER)
+        self.normalize_scope_combo_box.addItem('all files', SCOPE_ALL)
+
+        self.normalize_button = QPushButton('normalize + reserve')
+        self.normalize_button.clicked.connect(self.onNormalizeButtonClicked)
+
+        normalize_layout = QHBoxLayout()
+        normalize_layout.setContentsMargins(0, 0, 0, 0)
+
+        for widget in (self.normalize_target_spin_box, self.normalize_ceiling_spin_box, self.normalize_mode_combo_box, self.normalize_scope_combo_box, self.normalize_button):
+            normalize_layout.addWidget(widget)
+
+        normalize_widget = QWidget()
+        normalize_widget.setLayout(normalize_layout)
+        layout.addWidget(normalize_widget, 9, 1, 1, 2)
+
+        self.extra_targets_label = QLabel('extra outputs', self)
+        self.extra_targets_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.extra_targets_label, 10, 0)
+
+        self.extra_targets_edit = QLineEdit(self)
+        self.extra_targets_edit.setPlaceholderText('.m4a 320K, .mp3 128K')
+        self.extra_targets_edit.setEnabled(False)
+        self.extra_targets_edit.editingFinished.connect(self.onExtraTargetsChanged)
+        layout.addWidget(self.extra_targets_edit, 10, 1, 1, 2)
 
         self.reserve_button = QPushButton('2. Reserve')
         self.reserve_button.setEnabled(False)
         self.reserve_button.clicked.connect(self.onReserveButtonClicked)
-        layout.addWidget(self.reserve_button, 7, 0, 1, 3)
+        layout.addWidget(self.reserve_button, 11, 0, 1, 3)
 
         self.apply_button = QPushButton('3. Apply')
         self.apply_button.setEnabled(False)
         self.apply_button.clicked.connect(self.onApplyButtonClicked)
-        layout.addWidget(self.apply_button, 8, 0, 1, 3)
+        layout.addWidget(self.apply_button, 12, 0, 1, 2)
+
+        self.apply_estimated_check_box = QCheckBox('apply estimated volumes', self)
+        self.apply_estimated_check_box.setToolTip('otherwise files still waiting for their full analysis are left reserved')
+        layout.addWidget(self.apply_estimated_check_box, 12, 2)
+
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setTextVisible(True)
+        layout.addWidget(self.progress_bar, 13, 0, 1, 3)
+
+        self.cancel_button = QPushButton('cancel selected')
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.onCancelButtonClicked)
+        layout.addWidget(self.cancel_button, 14, 0)
+
+        self.cancel_all_button = QPushButton('cancel all')
+        self.cancel_all_button.setEnabled(False)
+        self.cancel_all_button.clicked.connect(self.onCancelAllButtonClicked)
+        layout.addWidget(self.cancel_all_button, 14, 1, 1, 2)
 
         widget = QWidget()
         widget.setLayout(layout)
@@ -376,5 +1481,6 @@ if __name__ == '__main__':
 
     window = MainWindow()
     window.show()
+    QTimer.singleShot(0, window.onStarted)
 
     app.exec()
\ No newline at end of file
@@ -0,0 +1 @@
+EXTENSIONS = ('.mp4', '.mp3', '.m4a', '.flac')
@@ -0,0 +1,152 @@
+import copy
+import os
+
+from .planner import ENCODE, describeJob, planJob
+
+class AudioFile():
+    # a workspace can hold 100k of these
+    __slots__ = (
+        'directory', 'filename', 'filename_after', 'codec', 'duration', 'reserved',
+        'extension', 'extension_after', 'analyzed', 'max_volume', 'mean_volume', 'mean_volume_after',
+        'integrated_loudness', 'true_peak', 'bitrate', 'bitrate_after', 'gain_mode', 'extra_targets',
+        'audio_digest', 'estimated', 'volume_bound', 'error', 'container', 'applied_volume_diff',
+    )
+
+    # container is what the file holds (scanner.sniff), the extension only what it is named
+    def __init__(self, directory, filename, extension, metadata, container=None):
+        bitrate = metadata.get('bitrate')
+
+        self.directory = directory
+        self.filename = filename
+        self.filename_after = f'{filename}_adjusted'
+
+        self.codec = metadata.get('codec')
+        self.duration = metadata.get('duration')
+        self.reserved = False
+
+        self.extension = extension
+        self.extension_after = extension
+        self.container = container or extension
+
+        self.analyzed = False
+        # measured from a few windows only (loudness.estimate), to be replaced by the full analysis
+        self.estimated = False
+        self.volume_bound = None
+        self.max_volume = None
+        self.mean_volume = None
+        self.mean_volume_after = None
+        self.integrated_loudness = None
+        self.true_peak = None
+
+        self.bitrate = f'{bitrate}K' if self.container != '.mp4' and bitrate is not None else '320K'
+        self.bitrate_after = self.bitrate
+
+        self.gain_mode = ENCODE
+        # what the last gain job really wrote, which can differ from the request (gain.plannedGain)
+        self.applied_volume_diff = None
+
+        # more (extension, bitrate) outputs encoded from the same decode
+        self.extra_targets = []
+
+        # same digest, same audio: see loudness.audioDigest
+        self.audio_digest = metadata.get('audio_digest')
+
+        # what the last failed analysis or job left: process.JobError.asDict()
+        self.error = metadata.get('error')
+
+        if metadata.get('mean_volume') is not None:
+            self.updateLoudness(metadata)
+
+    # a target set while the numbers were estimated stays; otherwise it follows the new measurement
+    def updateLoudness(self, metadata):
+        mean_volume = metadata['mean_volume'] or 0.0
+        edited = self.analyzed and self.mean_volume_after != self.mean_volume
+
+        self.max_volume = metadata['max_volume'] or 0.0
+        self.integrated_loudness = metadata.get('integrated_loudness')
+        self.true_peak = metadata.get('true_peak')
+        self.audio_digest = metadata.get('audio_digest') or self.audio_digest
+
+        self.estimated = bool(metadata.get('estimated'))
+        self.volume_bound = metadata.get('volume_bound')
+
+        self.mean_volume = round(mean_volume, 2)
+
+        if not edited:
+            self.mean_volume_after = round(mean_volume, 2)
+
+        self.analyzed = True
+    
+    def clear(self):
+        self.reserved = False
+
+    def isChanged(self):
+        return self.mean_volume != self.mean_volume_after or self.extension != self.extension_after or self.bitrate != self.bitrate_after or bool(self.extra_targets)
+    
+    def canReserve(self):
+        return self.analyzed and (self.reserved or self.isChanged())
+
+    def getVolumeDiff(self):
+        if not self.analyzed:
+            return 0.0
+
+        return round(self.mean_volume_after - self.mean_volume, 2)
+
+    def getBeforePath(self):
+        return os.path.join(self.directory, f'{self.filename}{self.extension}')
+
+    def getAfterPath(self):
+        return os.path.join(self.directory, f'{self.filename_after}{self.extension_after}')
+
+    # the same file seen as producing one more output, named after its bitrate
+    def forTarget(self, extension, bitrate):
+        target = copy.copy(self)
+        target.filename_after = f'{self.filename_after}_{bitrate}'
+        target.extension_after = extension
+        target.bitrate_after = bitrate
+        target.extra_targets = []
+
+        return target
+
+    def getTargets(self):
+        targets = [self]
+        outputs = {self.getAfterPath()}
+
+        for extension, bitrate in self.extra_targets:
+            target = self.forTarget(extension, bitrate)
+
+            if target.getAfterPath() not in outputs:
+                outputs.add(target.getAfterPath())
+                targets.append(target)
+
+        return targets
+
+    def getContainerData(self):
+        return f'\ncontainer: {self.container}' if self.container != self.extension else ''
+
+    def getErrorData(self):
+        limit = f' ({self.error["limit"]} limit exceeded)' if self.error['limit'] else ''
+        detail = ''.join(f'\n  {line}' for line in self.error['stderr'][-2:])
+
+        return f'error ({self.error["stage"]}):\n  {self.error["message"]}{limit}{detail}'
+
+    def getBeforeData(self):
+        if not self.analyzed and self.error:
+            return f'filename: {self.filename}{self.extension}\n{self.getErrorData()}'
+
+        if not self.analyzed:
+            return f'filename: {self.filename}{self.extension}\nvolume:\n  analyzing...\nbitrate: {self.bitrate}'
+
+        if self.estimated:
+            bound = f' ± {self.volume_bound}' if self.volume_bound is not None else ''
+
+            return f'filename: {self.filename}{self.extension}\nvolume (estimate):\n  mean: {self.mean_volume}{bound}\n  max: ≥ {self.max_volume}\nloudness:\n  integrated: ~{self.integrated_loudness} LUFS\nbitrate: {self.bitrate}'
+
+        return f'filename: {self.filename}{self.extension}\nvolume:\n  mean: {self.mean_volume}\n  max: {self.max_volume}\nloudness:\n  integrated: {self.integrated_loudness} LUFS\n  true peak: {self.true_peak}\nbitrate: {self.bitrate}{self.getContainerData()}'
+    
+    def getAfterData(self):
+        extra = ''.join(f'\n+ {t.filename_after}{t.extension_after} ({planJob(t)})' for t in self.getTargets()[1:])
+
+        error = f'\n{self.getErrorData()}' if self.error else ''
+
+        return f'filename: {self.filename_after}{self.extension_after}\nvolume:\n mean: {self.mean_volume_after}\n max: {self.max_volume}\nbitrate: {self.bitrate_after}\npipeline: {describeJob(self)}{extra}{error}'
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import EXTENSIONS
+from .audio_file import AudioFile
+from .cli import findFiles
+from .journal import ffmpegVersion
+from .loudness import SEGMENT_THRESHOLD, SegmentedAnalysis, analyze, probeHeader
+from .orchestrator import Orchestrator
+from .planner import COPY, ENCODE, GAIN, REMUX, planJob
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'audio-editor2.py')
+FIXTURE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'audio-editor', 'bench-fixtures')
+
+# a regression is a files-per-second drop larger than this against the baseline
+REGRESSION_THRESHOLD = 0.10
+
+# deterministic lavfi sources: a tone over seeded pink noise, plus a tiny video track for .mp4
+FIXTURE_CODECS = {
+    '.flac': ['-c:a', 'flac'],
+    '.mp3': ['-c:a', 'libmp3lame', '-b:a', '192k'],
+    '.m4a': ['-c:a', 'aac', '-b:a', '192k'],
+    '.mp4': ['-c:v', 'mpeg4', '-c:a', 'aac', '-b:a', '192k'],
+}
+
+# how each encode path is forced on a freshly analyzed file
+def forceKind(audio_file, kind):
+    if kind == ENCODE:
+        audio_file.mean_volume_after = round(audio_file.mean_volume + 1.5, 2)
+    elif kind == GAIN:
+        audio_file.mean_volume_after = round(audio_file.mean_volume + 1.5, 2)
+        audio_file.gain_mode = GAIN
+    elif kind == REMUX:
+        audio_file.extension_after = '.m4a' if audio_file.extension == '.mp4' else '.mp4'
+
+    return planJob(audio_file) == kind
+
+def generateFixtures(root, extension, duration, count):
+    directory = os.path.join(root, f'{extension[1:]}_{duration}s_{count}')
+
+    if os.path.isdir(directory) and len(list(findFiles(directory))) == count:
+        return directory
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    for i in range(count):
+        inputs = [
+            '-f', 'lavfi', '-i', f'sine=frequency={220 + 40 * i}:sample_rate=44100:duration={duration}',
+            '-f', 'lavfi', '-i', f'anoisesrc=color=pink:seed={i + 1}:amplitude=0.05:sample_rate=44100:duration={duration}',
+        ]
+        graph = ['-filter_complex', '[0:a][1:a]amix=inputs=2,aformat=channel_layouts=stereo[a]', '-map', '[a]']
+
+        if extension == '.mp4':
+            inputs += ['-f', 'lavfi', '-i', f'color=c=black:s=64x64:r=1:d={duration}']
+            graph += ['-map', '2:v']
+
+        subprocess.run(
+            ['ffmpeg', '-nostdin', '-v', 'error', '-y', *inputs, *graph, *FIXTURE_CODECS[extension], os.path.join(directory, f'track{i:03d}{extension}')],
+            check=True
+        )
+
+    return directory
+
+# best of `repeat` runs, so warm-up (imports, page cache) doesn't count
+def bestOf(repeat, bench, *args):
+    runs = [bench(*args) for _ in range(repeat)]
+
+    return min(runs, key=lambda run: run[0] if run[0] is not None else float('inf'))
+
+def measure(stage, fixture, workers, wall, audio_seconds, **fields):
+    return {
+        'stage': stage,
+        **fixture,
+        'workers': workers,
+        **fields,
+        'wall': round(wall, 4),
+        'files_per_second': round(fixture['count'] / wall, 3) if wall > 0 else None,
+        'realtime_factor': round(audio_seconds / wall, 3) if wall > 0 else None,
+    }
+
+# phase one of loadDirectory: listing plus stream headers
+def benchScan(directory, workers):
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(workers) as executor:
+        headers = list(executor.map(probeHeader, findFiles(directory)))
+
+    return time.perf_counter() - started, headers
+
+# phase two: full loudness analysis, long files split into segments like FileLoader does
+def benchAnalyze(directory, workers):
+    paths = list(findFiles(directory))
+    tasks = []
+
+    for path, header in zip(paths, map(probeHeader, paths)):
+        if header['duration'] and header['duration'] >= SEGMENT_THRESHOLD:
+            segments = SegmentedAnalysis(path, header['duration'])
+            tasks += [(path, segments.run, i) for i in range(segments.count)]
+        else:
+            tasks.append((path, analyze, path))
+
+    started = time.perf_counter()
+    metadata = {}
+
+    with ThreadPoolExecutor(workers) as executor:
+        for (path, _, _), result in zip(tasks, executor.map(lambda task: task[1](task[2]), tasks)):
+            if result is not None:
+                metadata[path] = result
+
+    return time.perf_counter() - started, metadata
+
+def benchEncode(directory, metadata, kind, workers):
+    audio_files = []
+
+    for path, measurements in sorted(metadata.items()):
+        name, ext = os.path.splitext(os.path.basename(path))
+        audio_file = AudioFile(directory, name, ext, measurements)
+
+        if not forceKind(audio_file, kind):
+            return None, None
+
+        audio_files.append(audio_file)
+
+    started = time.perf_counter()
+    kinds = asyncio.run(Orchestrator(workers, adaptive=False).runBatch(audio_files))
+    wall = time.perf_counter() - started
+
+    for audio_file in audio_files:
+        if os.path.exists(audio_file.getAfterPath()):
+            os.remove(audio_file.getAfterPath())
+
+    return wall, kinds
+
+# launch to first paint of the GUI, as the app measures it itself; None without a usable Qt
+def benchStartup():
+    env = {**os.environ, 'AUDIO_EDITOR_STARTUP_PROBE': '1'}
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    try:
+        result = subprocess.run([sys.executable, GUI_PATH], env=env, capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return None, None
+
+    for line in result.stdout.splitlines():
+        if line.startswith('startup '):
+            return float(line.split()[1]), None
+
+    return None, None
+
+def compare(results, baseline, threshold):
+    def key(result):
+        return (result['stage'], result['extension'], result['duration'], result['count'], result['workers'], result.get('kind'))
+
+    before = {key(r): r for r in baseline['results']}
+    regressions = []
+
+    for result in results:
+        previous = before.get(key(result))
+
+        if previous and previous['files_per_second'] and result['files_per_second'] is not None:
+            change = result['files_per_second'] / previous['files_per_second'] - 1
+
+            if change < -threshold:
+                regressions.append((key(result), previous['files_per_second'], result['files_per_second'], change))
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='audio_editor.benchmark', description='Measure scan, analysis and encode throughput on synthetic libraries.')
+    parser.add_argument('--output', default='benchmark.json', help='where to write the JSON results')
+    parser.add_argument('--fixtures', default=FIXTURE_PATH, help='fixture libraries are generated here once and reused')
+    parser.add_argument('--extensions', default=','.join(EXTENSIONS))
+    parser.add_argument('--durations', default='10,120', help='seconds per file, comma separated')
+    parser.add_argument('--count', type=int, default=8, help='files per library')
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, max(1, (os.cpu_count() or 2) // 2), os.cpu_count() or 1})))
+    parser.add_argument('--kinds', default=','.join((ENCODE, REMUX, GAIN, COPY)), help='encode paths to measure')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest one counts')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--no-startup', action='store_true', help='skip measuring the GUI startup time')
+    args = parser.parse_args(argv)
+
+    extensions = args.extensions.split(',')
+    durations = [int(d) for d in args.durations.split(',')]
+    workers = [int(n) for n in args.workers.split(',')]
+    kinds = args.kinds.split(',')
+    results = []
+
+    # tracked like the rest: "files" per second here is launches per second
+    if not args.no_startup:
+        wall, _ = bestOf(args.repeat, benchStartup)
+
+        if wall is None:
+            print('startup: the GUI did not start, not measured', file=sys.stderr)
+        else:
+            results.append(measure('startup', {'extension': '', 'duration': 0, 'count': 1}, 1, wall, 0))
+
+    for extension in extensions:
+        for duration in durations:
+            directory = generateFixtures(args.fixtures, extension, duration, args.count)
+            fixture = {'extension': extension, 'duration': duration, 'count': args.count}
+            audio_seconds = duration * args.count
+
+            for n in workers:
+                wall, _ = bestOf(args.repeat, benchScan, directory, n)
+                results.append(measure('scan', fixture, n, wall, audio_seconds))
+
+                wall, metadata = bestOf(args.repeat, benchAnalyze, directory, n)
+                results.append(measure('analyze', fixture, n, wall, audio_seconds))
+
+                for kind in kinds:
+                    wall, reported = bestOf(args.repeat, benchEncode, directory, metadata, kind, n)
+
+                    if wall is not None:
+                        failed = sum(1 for k in reported.values() if k != kind)
+                        results.append(measure('encode', fixture, n, wall, audio_seconds, kind=kind, failed=failed))
+
+                print(f'{extension} {duration}s x{args.count}, {n} worker(s): done', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'repeat': args.repeat,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': ffmpegVersion(),
+        },
+        'results': results,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'{"stage":8} {"ext":5} {"dur":>5} {"n":>3} {"kind":7} {"files/s":>9} {"realtime":>9}')
+
+    for r in results:
+        print(f'{r["stage"]:8} {r["extension"]:5} {r["duration"]:>5} {r["workers"]:>3} {r.get("kind", ""):7} {r["files_per_second"]:>9} {r["realtime_factor"]:>8}x')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        for key, before, after, change in regressions:
+            print(f'REGRESSION {" ".join(str(k) for k in key if k is not None)}: {before} -> {after} files/s ({change:+.0%})')
+
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
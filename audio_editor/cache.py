@@ -0,0 +1,184 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.environ.get(
+    'AUDIO_EDITOR_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'audio-editor', 'analysis.sqlite3')
+)
+SCHEMA_VERSION = 4
+# rows are ~200 bytes, so even a library of this size stays a few hundred MB at most
+MAX_ENTRIES = 500000
+EVICT_INTERVAL = 100
+FINGERPRINT_CHUNK = 64 * 1024
+
+# head + tail of the file plus its size. cheap enough to compute on a miss,
+# and lets a renamed or touched file reuse its old measurements.
+def fingerprint(path, size=None):
+    if size is None:
+        size = os.path.getsize(path)
+
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+
+        if size > FINGERPRINT_CHUNK * 2:
+            f.seek(-FINGERPRINT_CHUNK, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_CHUNK))
+
+    return digest.digest()
+
+class AnalysisCache():
+    FIELDS = ('codec', 'mean_volume', 'max_volume', 'bitrate', 'duration', 'integrated_loudness', 'true_peak', 'audio_digest')
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.puts = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        # measurements are cheap to rebuild, so an old layout is simply dropped
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.connection.execute('DROP TABLE IF EXISTS analysis')
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS analysis ('
+            ' path TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' mtime_ns INTEGER NOT NULL,'
+            ' fingerprint BLOB NOT NULL,'
+            ' codec TEXT,'
+            ' mean_volume REAL,'
+            ' max_volume REAL,'
+            ' bitrate INTEGER,'
+            ' duration REAL,'
+            ' integrated_loudness REAL,'
+            ' true_peak REAL,'
+            ' audio_digest TEXT,'
+            ' accessed REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS analysis_fingerprint ON analysis (fingerprint)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS analysis_audio_digest ON analysis (audio_digest)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS analysis_accessed ON analysis (accessed)')
+
+    def get(self, path):
+        path = os.path.abspath(path)
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        with self.lock:
+            row = self.connection.execute(
+                f'SELECT size, mtime_ns, {", ".join(self.FIELDS)} FROM analysis WHERE path = ?',
+                (path,)
+            ).fetchone()
+
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                self.connection.execute('UPDATE analysis SET accessed = ? WHERE path = ?', (time.time(), path))
+                return dict(zip(self.FIELDS, row[2:]))
+
+        # path or mtime moved on, try to match the content instead
+        try:
+            digest = fingerprint(path, stat.st_size)
+        except OSError:
+            return None
+
+        with self.lock:
+            row = self.connection.execute(
+                f'SELECT {", ".join(self.FIELDS)} FROM analysis WHERE fingerprint = ? AND size = ? LIMIT 1',
+                (digest, stat.st_size)
+            ).fetchone()
+
+            if not row:
+                return None
+
+            measurements = dict(zip(self.FIELDS, row))
+            self._store(path, stat, digest, measurements)
+
+        return measurements
+
+    # measurements of any file with the same audio (see loudness.audioDigest), plus that file's
+    # content fingerprint so its waveform can be shared. an index lookup, whatever the library size.
+    def findAudio(self, digest):
+        with self.lock:
+            row = self.connection.execute(
+                f'SELECT fingerprint, {", ".join(self.FIELDS)} FROM analysis WHERE audio_digest = ? AND mean_volume IS NOT NULL LIMIT 1',
+                (digest,)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        return {'fingerprint': row[0], **dict(zip(self.FIELDS, row[1:]))}
+
+    def put(self, path, measurements):
+        path = os.path.abspath(path)
+
+        try:
+            stat = os.stat(path)
+            digest = fingerprint(path, stat.st_size)
+        except OSError:
+            return
+
+        with self.lock:
+            self._store(path, stat, digest, measurements)
+            self._evict()
+
+    def remove(self, path):
+        with self.lock:
+            self.connection.execute('DELETE FROM analysis WHERE path = ?', (os.path.abspath(path),))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _store(self, path, stat, digest, measurements):
+        self.connection.execute(
+            f'INSERT OR REPLACE INTO analysis (path, size, mtime_ns, fingerprint, {", ".join(self.FIELDS)}, accessed) '
+            f'VALUES (?, ?, ?, ?, {", ".join("?" for _ in self.FIELDS)}, ?)',
+            (path, stat.st_size, stat.st_mtime_ns, digest, *(measurements.get(f) for f in self.FIELDS), time.time())
+        )
+
+    # drop least recently used rows, with some slack so we don't evict on every put
+    def _evict(self):
+        self.puts += 1
+
+        if self.puts % EVICT_INTERVAL != 0:
+            return
+
+        count = self.connection.execute('SELECT COUNT(*) FROM analysis').fetchone()[0]
+
+        if count <= self.max_entries:
+            return
+
+        excess = count - self.max_entries + max(1, self.max_entries // 10)
+        self.connection.execute(
+            'DELETE FROM analysis WHERE path IN (SELECT path FROM analysis ORDER BY accessed LIMIT ?)',
+            (excess,)
+        )
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def shared_cache():
+    global _shared_cache
+
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = AnalysisCache()
+
+    return _shared_cache
@@ -0,0 +1,126 @@
+# the files of one workspace in load order, by their path relative to the workspace.
+# edits go through the catalog so the reserved and changed counts never need a scan,
+# and files with the same audio digest are grouped as duplicates.
+class Catalog():
+    def __init__(self):
+        self.files = []
+        self.names = []
+        self.rows = {}
+        self.digests = {}
+        self.reserved_count = 0
+        self.changed_count = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, full_name):
+        return full_name in self.rows
+
+    def __getitem__(self, full_name):
+        return self.files[self.rows[full_name]]
+
+    def at(self, row):
+        return self.files[row]
+
+    def nameAt(self, row):
+        return self.names[row]
+
+    def rowOf(self, full_name):
+        return self.rows.get(full_name, -1)
+
+    def add(self, audio_file, full_name=None):
+        full_name = full_name or f'{audio_file.filename}{audio_file.extension}'
+
+        self.rows[full_name] = len(self.files)
+        self.files.append(audio_file)
+        self.names.append(full_name)
+        self._count(audio_file, 1)
+        self._group(full_name, audio_file, True)
+
+        return full_name
+
+    # a file whose content changed starts over with a fresh header
+    def replace(self, full_name, audio_file):
+        row = self.rows[full_name]
+
+        self._count(self.files[row], -1)
+        self._group(full_name, self.files[row], False)
+        self.files[row] = audio_file
+        self._count(audio_file, 1)
+        self._group(full_name, audio_file, True)
+
+    # any number of rows in one pass over the list
+    def remove(self, rows):
+        removed = set(rows)
+
+        for row in removed:
+            self._count(self.files[row], -1)
+            self._group(self.names[row], self.files[row], False)
+
+        self.files = [audio_file for row, audio_file in enumerate(self.files) if row not in removed]
+        self.names = [full_name for row, full_name in enumerate(self.names) if row not in removed]
+        self.rows = {full_name: row for row, full_name in enumerate(self.names)}
+
+    def clear(self):
+        self.files.clear()
+        self.names.clear()
+        self.rows.clear()
+        self.digests.clear()
+        self.reserved_count = 0
+        self.changed_count = 0
+
+    def _group(self, full_name, audio_file, add):
+        if not audio_file.audio_digest:
+            return
+
+        names = self.digests.setdefault(audio_file.audio_digest, set())
+
+        if add:
+            names.add(full_name)
+        else:
+            names.discard(full_name)
+
+            if not names:
+                del self.digests[audio_file.audio_digest]
+
+    # the other files with the same audio
+    def duplicatesOf(self, full_name):
+        digest = self[full_name].audio_digest
+
+        return sorted(self.digests.get(digest, ()) - {full_name}) if digest else []
+
+    def _count(self, audio_file, sign):
+        self.reserved_count += sign * bool(audio_file.reserved)
+        self.changed_count += sign * audio_file.isChanged()
+
+    def edit(self, full_name, **fields):
+        audio_file = self[full_name]
+
+        self._count(audio_file, -1)
+
+        for key, value in fields.items():
+            setattr(audio_file, key, value)
+
+        self._count(audio_file, 1)
+
+    # a bulk edit in one pass: new target volumes, each file reserved if that changes it
+    def reserveVolumes(self, full_names, volumes):
+        for full_name, volume in zip(full_names, volumes):
+            audio_file = self[full_name]
+
+            self._count(audio_file, -1)
+            audio_file.mean_volume_after = volume
+            audio_file.reserved = audio_file.isChanged()
+            self._count(audio_file, 1)
+
+    def updateLoudness(self, full_name, metadata):
+        audio_file = self[full_name]
+
+        self._count(audio_file, -1)
+        self._group(full_name, audio_file, False)
+        audio_file.updateLoudness(metadata)
+        self._count(audio_file, 1)
+        self._group(full_name, audio_file, True)
+
+    def reserved(self):
+        return [audio_file for audio_file in self.files if audio_file.reserved]
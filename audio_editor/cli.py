@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import EXTENSIONS, trace
+from .scanner import DEFAULT_IGNORE, SCAN_QUEUE, Scanner, isOutput, scanInto
+
+# keep this module light: numpy, ffmpeg and friends are only imported by the workers
+GAIN_MODES = ('encode', 'gain')
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+# the orchestrator's kinds for jobs that didn't finish
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+UNFINISHED = (FAILED, TIMEOUT, CANCELLED)
+UNDONE = 'undone'
+
+# (path, container) of every input below root
+def findSources(root, max_depth=None, ignore=DEFAULT_IGNORE, scanner=None):
+    for path, _, container in scanner or Scanner(root, max_depth, ignore):
+        if not isOutput(path):
+            yield path, container
+
+def findFiles(root, max_depth=None, ignore=DEFAULT_IGNORE, scanner=None):
+    for path, _ in findSources(root, max_depth, ignore, scanner):
+        yield path
+
+# whatever the walk has found so far, at most `size` sources; None once it is done
+def nextWindow(paths, size):
+    first = paths.get()
+
+    if first is None:
+        return None
+
+    window = [first]
+
+    while len(window) < size:
+        try:
+            path = paths.get_nowait()
+        except queue.Empty:
+            break
+
+        if path is None:
+            # put the end marker back for the next call
+            paths.put(None)
+            break
+
+        window.append(path)
+
+    return window
+
+# with tracing on, the worker's events travel back with the result
+def processFile(path, rules, queued_at=None, container=None, attempt=None, still_leased=None):
+    trace.complete('queue wait', 'pool', queued_at, file=os.path.basename(path))
+
+    with trace.span('process file', 'pool', file=os.path.basename(path)):
+        kind = editFile(path, rules, container, attempt, still_leased)
+
+    return (kind, trace.drain()) if trace.ENABLED else kind
+
+def editFile(path, rules, container=None, attempt=None, still_leased=None):
+    from .audio_file import AudioFile
+    from .journal import shared_journal
+    from .process import JobError, ResourceLimits
+    from .runner import loadMetadata, runJob
+
+    directory, file = os.path.split(path)
+    name, ext = os.path.splitext(file)
+    limits = ResourceLimits(rules['memory'], rules['cpu'])
+
+    audio_file = AudioFile(directory, name, ext, loadMetadata(path, limits=limits), container)
+
+    if rules['volume'] is not None:
+        audio_file.mean_volume_after = round(rules['volume'], 2)
+
+    if rules['extension']:
+        audio_file.extension_after = rules['extension']
+
+    if rules['bitrate'] and audio_file.container != '.flac':
+        audio_file.bitrate_after = rules['bitrate']
+
+    audio_file.gain_mode = rules['gain_mode']
+
+    for extension, bitrate in rules['also']:
+        audio_file.extra_targets.append((extension, bitrate or audio_file.bitrate_after))
+
+    if not audio_file.isChanged():
+        return UNCHANGED
+
+    # worker exceptions don't all survive pickling, and one that doesn't breaks the whole pool
+    try:
+        return runJob(audio_file, shared_journal(), rules['timeout'], limits, attempt, still_leased)
+    except asyncio.TimeoutError:
+        return TIMEOUT
+    except asyncio.CancelledError:
+        return CANCELLED
+    except JobError:
+        raise
+    except Exception as e:
+        stderr = (getattr(e, 'stderr', None) or b'').decode(errors='replace').strip().splitlines()
+        raise RuntimeError(f'{type(e).__name__}: {e}' + (f' ({stderr[-1]})' if stderr else '')) from None
+
+# reverts the lossless gain written into the outputs below root, in place
+def undoGains(root, max_depth=None, ignore=DEFAULT_IGNORE):
+    from .gain import undoGain
+
+    counts = {}
+
+    for path, _, container in Scanner(root, max_depth, ignore):
+        if not isOutput(path):
+            continue
+
+        try:
+            kind = UNDONE if undoGain(path, container) else UNCHANGED
+        except Exception as e:
+            print(f'{path}: {type(e).__name__}: {e}', file=sys.stderr)
+            kind = FAILED
+
+        counts[kind] = counts.get(kind, 0) + 1
+        print(f'{kind}\t{path}', flush=True)
+
+    print(', '.join(f'{k}: {v}' for k, v in sorted(counts.items())) or 'no outputs')
+
+    return 1 if FAILED in counts else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='audio_editor', description='Adjust volume, container and bitrate of a whole directory tree.')
+    parser.add_argument('directory')
+    parser.add_argument('--volume', type=float, help='target mean volume in dB')
+    parser.add_argument('--extension', choices=EXTENSIONS, help='output container')
+    parser.add_argument('--bitrate', help='output bitrate, e.g. 192K (ignored for .flac sources)')
+    parser.add_argument('--also', action='append', default=[], metavar='EXTENSION[:BITRATE]', help='one more output from the same decode, e.g. .m4a:320K (repeatable)')
+    parser.add_argument('--gain-mode', choices=GAIN_MODES, default='encode', help='how volume-only changes are written')
+    parser.add_argument('--undo-gain', action='store_true', help='revert the lossless gain written into the outputs below DIRECTORY, in place, and do nothing else')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--timeout', type=float, help='seconds before a single ffmpeg job is killed (default: scaled to the file duration)')
+    parser.add_argument('--job-memory', type=int, metavar='MIB', help='address space limit of each ffmpeg process (default: AUDIO_EDITOR_JOB_MEMORY, else none)')
+    parser.add_argument('--job-cpu', type=int, metavar='SECONDS', help='cpu time limit of each ffmpeg process (default: AUDIO_EDITOR_JOB_CPU, else none)')
+    parser.add_argument('--max-depth', type=int, help='directory levels to descend below DIRECTORY (default: all)')
+    parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN', help='file or directory names to skip, glob syntax (repeatable)')
+    parser.add_argument('--serve', metavar='ADDRESS', help='hand the jobs to workers (python -m audio_editor.cluster ADDRESS) instead of running them here; host:port or a Unix socket path')
+    args = parser.parse_args(argv)
+
+    if args.undo_gain:
+        return undoGains(args.directory, args.max_depth, DEFAULT_IGNORE + tuple(args.ignore))
+
+    rules = {
+        'volume': args.volume,
+        'extension': args.extension,
+        'bitrate': args.bitrate,
+        'gain_mode': args.gain_mode,
+        'timeout': args.timeout,
+        'memory': args.job_memory,
+        'cpu': args.job_cpu,
+        'also': [],
+    }
+
+    for value in args.also:
+        extension, _, bitrate = value.partition(':')
+
+        if extension not in EXTENSIONS:
+            parser.error(f'--also: unknown extension {extension}')
+
+        rules['also'].append((extension, bitrate))
+    counts = {}
+
+    from .scheduler import estimateDuration, longestFirst
+
+    # the walk runs ahead of the workers by at most SCAN_QUEUE paths, and each window of what it
+    # has found is submitted longest first
+    scanner = Scanner(args.directory, args.max_depth, DEFAULT_IGNORE + tuple(args.ignore))
+    paths = queue.Queue(SCAN_QUEUE)
+    threading.Thread(target=scanInto, args=(findSources(args.directory, scanner=scanner), paths), daemon=True).start()
+
+    def count(kind, path, error=None):
+        if error:
+            print(f'{path}: {error}', file=sys.stderr)
+
+        counts[kind] = counts.get(kind, 0) + 1
+        print(f'{kind}\t{path}', flush=True)
+
+    def report(future, path):
+        try:
+            kind = future.result()
+
+            if trace.ENABLED:
+                kind, events = kind
+                trace.extend(events)
+        except Exception as e:
+            return count(FAILED, path, e)
+
+        count(kind, path)
+
+    if args.serve:
+        from .cluster import Coordinator
+
+        with Coordinator(args.serve, rules, on_report=count) as coordinator:
+            coordinator.run(paths)
+    else:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = {}
+
+            while True:
+                window = nextWindow(paths, SCAN_QUEUE)
+
+                if window is None:
+                    break
+
+                for path, container in longestFirst(window, lambda source: estimateDuration(source[0])):
+                    futures[executor.submit(processFile, path, rules, trace.now(), container)] = path
+
+                while len(futures) >= SCAN_QUEUE:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        report(future, futures.pop(future))
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    report(future, futures.pop(future))
+
+    if scanner.skipped:
+        print(f'{scanner.skipped} file(s) skipped: not audio despite the name', file=sys.stderr)
+
+    print(', '.join(f'{k}: {v}' for k, v in sorted(counts.items())) or 'no files')
+
+    hits = counts.get('cached', 0)
+    misses = sum(v for k, v in counts.items() if k not in ('cached', UNCHANGED, *UNFINISHED))
+    print(f'output cache: {hits} hit(s), {misses} miss(es)')
+
+    return 1 if any(kind in counts for kind in UNFINISHED) else 0
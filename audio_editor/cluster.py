@@ -0,0 +1,392 @@
+import argparse
+import collections
+import itertools
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import trace
+from .cli import FAILED, UNFINISHED, nextWindow, processFile
+from .scanner import SCAN_QUEUE
+from .scheduler import estimateDuration, longestFirst
+
+# workers renew the leases of their running jobs this often. a lease not renewed for LEASE_TIMEOUT
+# means the worker is gone, and its job goes back to the queue.
+HEARTBEAT = float(os.environ.get('AUDIO_EDITOR_HEARTBEAT', 5))
+LEASE_TIMEOUT = 3 * HEARTBEAT
+
+# a job that outlived this many workers (it may be what kills them) is reported failed instead
+MAX_ATTEMPTS = 3
+
+# idle workers ask again after this long
+POLL_INTERVAL = 1.0
+
+# how long a worker keeps trying a coordinator it can't reach
+CONNECT_TIMEOUT = 30
+
+MESSAGE_LIMIT = 1 << 20
+
+# 'host:port' is TCP, a path (or 'unix:path') a Unix socket. without a host only this machine can connect.
+def parseAddress(address):
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+
+    if os.sep in address:
+        return socket.AF_UNIX, address
+
+    host, _, port = address.rpartition(':')
+
+    return socket.AF_INET, (host or 'localhost', int(port))
+
+# one JSON object per line, one request and its reply per connection
+def request(address, message, timeout=LEASE_TIMEOUT):
+    family, target = parseAddress(address)
+
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(target)
+        connection.sendall(json.dumps(message).encode() + b'\n')
+
+        with connection.makefile('rb') as f:
+            line = f.readline(MESSAGE_LIMIT)
+
+    if not line:
+        raise ConnectionError('no reply from the coordinator')
+
+    return json.loads(line)
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            reply = self.server.coordinator.handle(json.loads(self.rfile.readline(MESSAGE_LIMIT)))
+        # well-formed JSON can still hold the wrong types: the sender gets told, the server goes on
+        except (ValueError, AttributeError, TypeError, KeyError) as e:
+            reply = {'op': 'error', 'error': f'{type(e).__name__}: {e}'}
+
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+class TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+# serves the jobs of a batch to workers that pull them. a job is leased to one worker at a time;
+# leases that stop being renewed go back to the front of the queue. only the report under the
+# job's current lease counts: a worker given up on may still finish, but into a temporary file
+# of its own (the lease names it), and its result is dropped. on_report(kind, path, error) is
+# called once per job, from the server threads.
+class Coordinator():
+    def __init__(self, address, rules, on_report=None):
+        self.address = address
+        self.rules = rules
+        self.on_report = on_report
+        self.condition = threading.Condition()
+        self.ids = itertools.count(1)
+        self.queue = collections.deque()
+        self.paths = {}
+        self.containers = {}
+        self.leases = {}
+        self.attempts = {}
+        self.workers = {}
+        self.released = set()
+        self.finished = False
+        self.server = None
+
+    def __enter__(self):
+        family, target = parseAddress(self.address)
+
+        if family == socket.AF_UNIX:
+            # left over from a coordinator that didn't exit cleanly
+            if os.path.exists(target):
+                os.remove(target)
+
+            self.server = UnixServer(target, RequestHandler)
+        else:
+            self.server = TCPServer(target, RequestHandler)
+
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        return self
+
+    def __exit__(self, *_):
+        self.server.shutdown()
+        self.server.server_close()
+
+        family, target = parseAddress(self.address)
+
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.remove(target)
+
+    def add(self, path, container=None):
+        with self.condition:
+            job_id = next(self.ids)
+            self.paths[job_id] = path
+            self.containers[job_id] = container
+            self.queue.append(job_id)
+
+    def report(self, job_id, kind, error=None):
+        path = self.paths.pop(job_id)
+        self.containers.pop(job_id, None)
+        self.leases.pop(job_id, None)
+        self.attempts.pop(job_id, None)
+
+        if self.on_report:
+            self.on_report(kind, path, error)
+
+        self.condition.notify_all()
+
+    # leases not renewed in time: the worker died, hangs or can't reach us
+    def expire(self, now):
+        for job_id, (worker, expires, _) in list(self.leases.items()):
+            if expires >= now:
+                continue
+
+            del self.leases[job_id]
+
+            if self.attempts[job_id] >= MAX_ATTEMPTS:
+                self.report(job_id, FAILED, f'lost {MAX_ATTEMPTS} workers, the last one {worker}')
+            else:
+                self.queue.appendleft(job_id)
+
+    def handle(self, message):
+        op = message.get('op')
+        worker = str(message.get('worker'))
+        now = time.monotonic()
+
+        with self.condition:
+            self.workers[worker] = now
+            self.expire(now)
+
+            if op == 'next':
+                if self.queue:
+                    job_id = self.queue.popleft()
+                    lease = secrets.token_hex(8)
+                    self.leases[job_id] = (worker, now + LEASE_TIMEOUT, lease)
+                    self.attempts[job_id] = self.attempts.get(job_id, 0) + 1
+
+                    # relative to our working directory, not the worker's
+                    return {
+                        'op': 'job',
+                        'id': job_id,
+                        'lease': lease,
+                        'path': os.path.abspath(self.paths[job_id]),
+                        'container': self.containers[job_id],
+                        'rules': self.rules,
+                    }
+
+                if self.finished and not self.paths:
+                    self.released.add(worker)
+                    self.condition.notify_all()
+
+                    return {'op': 'done'}
+
+                return {'op': 'wait', 'seconds': POLL_INTERVAL}
+
+            if op == 'heartbeat':
+                lost = []
+
+                for job_id, lease in message.get('jobs', []):
+                    held = self.leases.get(job_id)
+
+                    if held and held[2] == lease:
+                        self.leases[job_id] = (worker, now + LEASE_TIMEOUT, lease)
+                    else:
+                        lost.append(job_id)
+
+                return {'op': 'ok', 'lost': lost}
+
+            if op == 'report':
+                job_id = message.get('id')
+                held = self.leases.get(job_id)
+
+                if held is None or held[2] != message.get('lease'):
+                    return {'op': 'stale'}
+
+                self.report(job_id, message.get('kind') or FAILED, message.get('error'))
+
+                return {'op': 'ok'}
+
+        return {'op': 'error', 'error': f'unknown op {op}'}
+
+    def wait(self, predicate):
+        with self.condition:
+            while not predicate():
+                self.condition.wait(HEARTBEAT)
+                self.expire(time.monotonic())
+
+    # hands out what the walk finds, at most SCAN_QUEUE jobs ahead of the workers, until all are reported
+    def run(self, paths):
+        while True:
+            window = nextWindow(paths, SCAN_QUEUE)
+
+            if window is None:
+                break
+
+            for path, container in longestFirst(window, lambda source: estimateDuration(source[0])):
+                self.add(path, container)
+
+            self.wait(lambda: len(self.paths) < SCAN_QUEUE)
+
+        with self.condition:
+            self.finished = True
+
+        self.wait(lambda: not self.paths)
+
+        # stay up a little so workers still polling hear that we are done
+        deadline = time.monotonic() + LEASE_TIMEOUT
+
+        with self.condition:
+            while time.monotonic() < deadline:
+                active = {w for w, seen in self.workers.items() if seen > time.monotonic() - LEASE_TIMEOUT}
+
+                if active <= self.released:
+                    break
+
+                self.condition.wait(deadline - time.monotonic())
+
+# asked by a job before its outputs take their final names. the same as a heartbeat, so a lease
+# confirmed here is renewed and can't run out during the rename. an unreachable coordinator
+# confirms nothing: the job may be running elsewhere by now. travels to the process pool, so no lambdas.
+class LeaseCheck():
+    def __init__(self, address, worker, job_id, lease):
+        self.address = address
+        self.worker = worker
+        self.job_id = job_id
+        self.lease = lease
+
+    def __call__(self):
+        try:
+            reply = request(self.address, {'op': 'heartbeat', 'worker': self.worker, 'jobs': [[self.job_id, self.lease]]})
+        except (OSError, ValueError):
+            return False
+
+        return reply.get('op') == 'ok' and self.job_id not in reply.get('lost', [self.job_id])
+
+# pulls jobs from a coordinator and runs up to `workers` of them at once in a process pool,
+# like the local batch does. the source paths must be the same on every host (a shared filesystem).
+class Worker():
+    def __init__(self, address, workers=1, name=None):
+        self.address = address
+        self.workers = workers
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.counts = {}
+
+    def call(self, message):
+        return request(self.address, {**message, 'worker': self.name})
+
+    def heartbeat(self):
+        while not self.stopped.wait(HEARTBEAT):
+            with self.lock:
+                jobs = [[job_id, lease] for lease, (job_id, _) in self.running.items()]
+
+            if not jobs:
+                continue
+
+            # a lost job is not stopped: it finishes into its own temporary file and its report is dropped
+            try:
+                self.call({'op': 'heartbeat', 'jobs': jobs})
+            except (OSError, ValueError):
+                pass
+
+    def report(self, lease, future):
+        error = None
+
+        try:
+            kind = future.result()
+
+            if trace.ENABLED:
+                kind, events = kind
+                trace.extend(events)
+        except Exception as e:
+            kind, error = FAILED, str(e)
+
+        with self.lock:
+            job_id, path = self.running.pop(lease)
+
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        print(f'{kind}\t{path}', flush=True)
+
+        # unreported, the job runs again elsewhere once its lease runs out
+        try:
+            reply = self.call({'op': 'report', 'id': job_id, 'lease': lease, 'kind': kind, 'error': error})
+        except (OSError, ValueError) as e:
+            print(f'{path}: result not delivered ({e})', file=sys.stderr)
+            return
+
+        if reply.get('op') == 'stale':
+            print(f'{path}: result dropped, the job was given to another worker', file=sys.stderr)
+
+    def run(self):
+        threading.Thread(target=self.heartbeat, daemon=True).start()
+        unreachable_since = None
+        done = False
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {}
+
+                while not done or futures:
+                    delay = POLL_INTERVAL
+
+                    while not done and len(futures) < self.workers:
+                        try:
+                            reply = self.call({'op': 'next'})
+                            unreachable_since = None
+                        except (OSError, ValueError) as e:
+                            unreachable_since = unreachable_since or time.monotonic()
+
+                            if time.monotonic() - unreachable_since > CONNECT_TIMEOUT:
+                                print(f'{self.address}: coordinator unreachable ({e})', file=sys.stderr)
+                                done = True
+
+                            break
+
+                        if reply['op'] == 'done':
+                            done = True
+                        elif reply['op'] == 'job':
+                            with self.lock:
+                                self.running[reply['lease']] = (reply['id'], reply['path'])
+
+                            still_leased = LeaseCheck(self.address, self.name, reply['id'], reply['lease'])
+                            futures[executor.submit(processFile, reply['path'], reply['rules'], trace.now(), reply.get('container'), reply['lease'], still_leased)] = reply['lease']
+                        else:
+                            delay = reply.get('seconds', POLL_INTERVAL)
+                            break
+
+                    if futures:
+                        finished, _ = wait(futures, timeout=delay, return_when=FIRST_COMPLETED)
+
+                        for future in finished:
+                            self.report(futures.pop(future), future)
+                    elif not done:
+                        time.sleep(delay)
+        finally:
+            self.stopped.set()
+
+        print(', '.join(f'{k}: {v}' for k, v in sorted(self.counts.items())) or 'no files')
+
+        return 1 if any(kind in self.counts for kind in UNFINISHED) else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='audio_editor.cluster', description='Run jobs served by a coordinator (python -m audio_editor DIRECTORY --serve ADDRESS).')
+    parser.add_argument('address', help='the coordinator, host:port or a Unix socket path')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='jobs run at once on this host')
+    parser.add_argument('--name', help='how the coordinator knows this worker (default: host:pid)')
+    args = parser.parse_args(argv)
+
+    return Worker(args.address, max(1, args.workers), args.name).run()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+import functools
+import importlib.util
+
+from .scanner import containerFamily, sniff
+
+# the planner only asks whether mutagen is there; it loads with the first tag read or written
+HAS_MUTAGEN = importlib.util.find_spec('mutagen') is not None
+
+MP3_GAIN_STEP = 1.5
+MP3_UNDO_TAG = 'MP3GAIN_UNDO'
+ITUNES = '----:com.apple.iTunes:'
+
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+# by container, not by name. with a path the file's bytes have to agree as well.
+def supportsGain(container, path=None):
+    if path is not None and containerFamily(sniff(path)) != containerFamily(container):
+        return False
+
+    return container == '.mp3' or (HAS_MUTAGEN and container in ('.m4a', '.mp4', '.flac'))
+
+# gain is only ever written into what the file really holds: a wrong guess patches random bytes
+def checkContainer(path, container):
+    if containerFamily(sniff(path)) != containerFamily(container):
+        raise ValueError(f'{path} does not hold {container} audio')
+
+def crc16Table():
+    table = []
+
+    for byte in range(256):
+        crc = byte << 8
+
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005 if crc & 0x8000 else crc << 1) & 0xFFFF
+
+        table.append(crc)
+
+    return tuple(table)
+
+CRC16_TABLE = crc16Table()
+
+def crc16(data, crc=0xFFFF):
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ byte]
+
+    return crc
+
+def id3Size(data):
+    if data[:3] != b'ID3' or len(data) < 10:
+        return 0
+
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+
+    return 10 + size + footer
+
+# (frame length, side info length, global_gain bit offsets, has crc) of a layer III header,
+# None if it isn't one. a stream repeats a handful of headers, each is decoded once.
+@functools.lru_cache(maxsize=1024)
+def mp3Layout(header):
+    version = (header >> 19) & 0x3
+    layer = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    rate_index = (header >> 10) & 0x3
+
+    if (header >> 21) != 0x7FF or version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    padding = (header >> 9) & 0x1
+    bitrate = MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+
+    has_crc = not (header >> 16) & 0x1
+    mono = (header >> 6) & 0x3 == 3
+    channels = 1 if mono else 2
+
+    if mpeg1:
+        side_length = 17 if mono else 32
+        base = 9 + (5 if mono else 3) + 4 * channels
+        gains = tuple(base + i * 59 + 21 for i in range(2 * channels))
+    else:
+        side_length = 9 if mono else 17
+        base = 8 + (1 if mono else 2)
+        gains = tuple(base + i * 63 + 21 for i in range(channels))
+
+    return length, side_length, gains, has_crc
+
+# length of the layer III frame starting at offset, None if there is no valid header
+def mp3FrameLength(data, offset):
+    if offset + 4 > len(data):
+        return None
+
+    layout = mp3Layout(int.from_bytes(data[offset:offset + 4], 'big'))
+
+    return layout[0] if layout else None
+
+# yields (offset, side info offset, side info length, global_gain bit offsets, has crc).
+# out of sync, a header only counts if the next one sits where its length says: 11 set bits
+# turn up in any compressed data, two in a row at the right distance don't.
+def mp3Frames(data):
+    offset = id3Size(data)
+    end = len(data) - (128 if data[-128:-125] == b'TAG' else 0)
+    synced = False
+
+    while offset + 4 <= end:
+        layout = mp3Layout(int.from_bytes(data[offset:offset + 4], 'big'))
+
+        if layout is None or (not synced and mp3FrameLength(data, offset + layout[0]) is None):
+            synced = False
+            offset += 1
+            continue
+
+        synced = True
+        length, side_length, gains, has_crc = layout
+        side = offset + 4 + (2 if has_crc else 0)
+
+        if side + side_length > end:
+            break
+
+        yield offset, side, side_length, gains, has_crc
+        offset += length
+
+# every granule's 8 bit global_gain as (byte index, shift) into a big-endian 16 bit word,
+# so a whole file is read and written with a few array operations
+def gainFields(frames):
+    import numpy as np
+
+    bits = np.fromiter((side * 8 + g for _, side, _, positions, _ in frames for g in positions), dtype=np.int64)
+
+    return bits >> 3, 8 - (bits & 7)
+
+def readGains(buffer, index, shift):
+    import numpy as np
+
+    word = (buffer[index].astype(np.int32) << 8) | buffer[index + 1]
+
+    return (word >> shift) & 0xFF
+
+def writeGains(buffer, index, shift, gains):
+    import numpy as np
+
+    word = (buffer[index].astype(np.int32) << 8) | buffer[index + 1]
+    word = (word & ~(0xFF << shift)) | (gains << shift)
+
+    buffer[index] = word >> 8
+    buffer[index + 1] = word & 0xFF
+
+# the crc over header bytes 2-3 and the side info, for all frames of one side info length at once
+def writeCrcs(buffer, frames):
+    import numpy as np
+
+    table = np.array(CRC16_TABLE, dtype=np.int32)
+    offsets_by_length = {}
+
+    for offset, _, side_length, _, has_crc in frames:
+        if has_crc:
+            offsets_by_length.setdefault(side_length, []).append(offset)
+
+    for side_length, offsets in offsets_by_length.items():
+        offsets = np.array(offsets, dtype=np.int64)[:, None]
+        covered = buffer[np.concatenate([offsets + (2, 3), offsets + 6 + np.arange(side_length)], axis=1)]
+        crc = np.full(len(offsets), 0xFFFF, dtype=np.int32)
+
+        for column in covered.T:
+            crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ column]
+
+        buffer[offsets[:, 0] + 4] = crc >> 8
+        buffer[offsets[:, 0] + 5] = crc & 0xFF
+
+# adjusts every granule's global_gain like mp3gain, returns the steps applied
+def applyMp3Gain(path, steps):
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+
+    # Xing/Info frames carry an all-zero side info; leave them alone
+    frames = [frame for frame in mp3Frames(data) if any(data[frame[1]:frame[1] + frame[2]])]
+
+    if not frames or steps == 0:
+        return 0
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    index, shift = gainFields(frames)
+    gains = readGains(buffer, index, shift)
+
+    # never clip a granule, otherwise the change can't be undone exactly
+    steps = int(max(-gains.min(), min(255 - gains.max(), steps)))
+
+    writeGains(buffer, index, shift, gains + steps)
+    writeCrcs(buffer, frames)
+
+    with open(path, 'r+b') as f:
+        f.write(data)
+
+    return steps
+
+def itunNorm(gain):
+    scale = 10 ** (-gain / 10)
+    values = [round(1000 * scale)] * 2 + [round(2500 * scale)] * 2 + [0] * 6
+
+    return ''.join(f' {min(v, 0xFFFFFFFF):08X}' for v in values)
+
+def readMp3Undo(path):
+    from mutagen.id3 import ID3, ID3NoHeaderError
+
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        return 0
+
+    frame = tags.get(f'TXXX:{MP3_UNDO_TAG}')
+    return int(frame.text[0]) if frame else 0
+
+def writeMp3Undo(path, steps):
+    from mutagen.id3 import ID3, TXXX, ID3NoHeaderError
+
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        tags = ID3()
+
+    tags.delall(f'TXXX:{MP3_UNDO_TAG}')
+
+    if steps:
+        tags.add(TXXX(encoding=3, desc=MP3_UNDO_TAG, text=[str(steps)]))
+
+    tags.save(path)
+
+def writeGainTags(path, extension, gain):
+    if not HAS_MUTAGEN:
+        raise RuntimeError('mutagen is required to write gain tags')
+
+    import mutagen
+    from mutagen.mp4 import MP4, MP4FreeForm
+
+    if extension in ('.m4a', '.mp4'):
+        tags = MP4(path)
+        tags[f'{ITUNES}replaygain_track_gain'] = [MP4FreeForm(f'{gain:+.2f} dB'.encode())]
+        tags[f'{ITUNES}iTunNORM'] = [MP4FreeForm(itunNorm(gain).encode())]
+        tags.save()
+    else:
+        tags = mutagen.File(path)
+        tags['REPLAYGAIN_TRACK_GAIN'] = f'{gain:+.2f} dB'
+        tags.save()
+
+# true if there was a gain tag to remove
+def removeGainTags(path, extension):
+    if not HAS_MUTAGEN:
+        raise RuntimeError('mutagen is required to remove gain tags')
+
+    import mutagen
+    from mutagen.mp4 import MP4
+
+    if extension in ('.m4a', '.mp4'):
+        tags = MP4(path)
+        keys = (f'{ITUNES}replaygain_track_gain', f'{ITUNES}iTunNORM')
+    else:
+        tags = mutagen.File(path)
+        keys = ('REPLAYGAIN_TRACK_GAIN',)
+
+    if tags is None or tags.tags is None or not any(key in tags for key in keys):
+        return False
+
+    for key in keys:
+        tags.pop(key, None)
+
+    tags.save()
+
+    return True
+
+# what applyGain writes for a requested gain: mp3 frames only step in MP3_GAIN_STEP
+def plannedGain(container, gain):
+    if container != '.mp3':
+        return gain
+
+    return round(gain / MP3_GAIN_STEP) * MP3_GAIN_STEP
+
+# returns the gain in dB that was actually applied
+def applyGain(path, container, gain):
+    checkContainer(path, container)
+
+    if container != '.mp3':
+        writeGainTags(path, container, gain)
+        return gain
+
+    steps = applyMp3Gain(path, round(gain / MP3_GAIN_STEP))
+
+    if HAS_MUTAGEN:
+        writeMp3Undo(path, readMp3Undo(path) + steps)
+
+    return steps * MP3_GAIN_STEP
+
+# reverts what applyGain wrote, in place. false if the file carried no gain of ours.
+def undoGain(path, container):
+    checkContainer(path, container)
+
+    if container != '.mp3':
+        return removeGainTags(path, container)
+
+    if not HAS_MUTAGEN:
+        raise RuntimeError('mutagen is required to read the mp3 undo tag')
+
+    steps = readMp3Undo(path)
+
+    if not steps:
+        return False
+
+    applyMp3Gain(path, -steps)
+    writeMp3Undo(path, 0)
+
+    return True
@@ -0,0 +1,192 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+from .cache import fingerprint
+
+JOURNAL_PATH = os.environ.get(
+    'AUDIO_EDITOR_JOURNAL',
+    os.path.join(os.path.expanduser('~'), '.cache', 'audio-editor', 'journal.sqlite3')
+)
+
+SCHEMA_VERSION = 2
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+def checksum(path):
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def ffmpegVersion():
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+    except OSError:
+        return None
+
+    return result.stdout.split('\n', 1)[0]
+
+def recipeOf(audio_file):
+    return {
+        'source': os.path.abspath(audio_file.getBeforePath()),
+        'output': os.path.abspath(audio_file.getAfterPath()),
+        'codec': audio_file.codec,
+        'volume_diff': audio_file.getVolumeDiff(),
+        'extension': audio_file.extension_after,
+        'bitrate': audio_file.bitrate_after,
+        'gain_mode': audio_file.gain_mode,
+    }
+
+# what the output depends on: source content, everything we ask ffmpeg
+# to do, and the ffmpeg build doing it. the output path itself is the row key.
+def recipeHash(recipe):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(fingerprint(recipe['source']))
+
+    options = {k: v for k, v in recipe.items() if k not in ('source', 'output', 'applied_volume_diff')}
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(str(ffmpegVersion()).encode())
+
+    return digest.hexdigest()
+
+# one row per output file. a batch is resumed by re-running every job
+# that isn't done, or whose output no longer matches what was recorded.
+class Journal():
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' output TEXT PRIMARY KEY,'
+            ' source TEXT NOT NULL,'
+            ' directory TEXT NOT NULL,'
+            ' recipe TEXT NOT NULL,'
+            ' recipe_hash TEXT,'
+            ' state TEXT NOT NULL,'
+            ' kind TEXT,'
+            ' checksum TEXT,'
+            ' size INTEGER,'
+            ' mtime_ns INTEGER,'
+            ' error TEXT,'
+            ' updated REAL NOT NULL'
+            ')'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_directory ON jobs (directory, state)')
+
+        if version < 2 and 'recipe_hash' not in [c[1] for c in self.connection.execute('PRAGMA table_info(jobs)')]:
+            self.connection.execute('ALTER TABLE jobs ADD COLUMN recipe_hash TEXT')
+
+        self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _update(self, recipe, state, **fields):
+        columns = ('output', 'source', 'directory', 'recipe', 'state', 'updated', *fields)
+        values = (
+            recipe['output'],
+            recipe['source'],
+            os.path.dirname(recipe['source']),
+            json.dumps(recipe, sort_keys=True),
+            state,
+            time.time(),
+            *fields.values(),
+        )
+
+        with self.lock:
+            self.connection.execute(
+                f'INSERT OR REPLACE INTO jobs ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+                values
+            )
+
+    def enqueue(self, audio_file):
+        for target in audio_file.getTargets():
+            recipe = recipeOf(target)
+
+            if not self.isUpToDate(recipe, recipeHash(recipe)):
+                self._update(recipe, PENDING)
+
+    def start(self, recipe):
+        self._update(recipe, RUNNING)
+
+    def finish(self, recipe, kind, recipe_hash=None):
+        stat = os.stat(recipe['output'])
+        self._update(
+            recipe,
+            DONE,
+            kind=kind,
+            recipe_hash=recipe_hash or recipeHash(recipe),
+            checksum=checksum(recipe['output']),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns
+        )
+
+    def fail(self, recipe, error):
+        self._update(recipe, FAILED, error=str(error))
+
+    # the output on disk was produced from this exact source and recipe
+    def isUpToDate(self, recipe, recipe_hash):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT recipe_hash, size, mtime_ns FROM jobs WHERE output = ? AND state = ?',
+                (recipe['output'], DONE)
+            ).fetchone()
+
+        if not row or row[0] != recipe_hash:
+            return False
+
+        try:
+            stat = os.stat(recipe['output'])
+        except OSError:
+            return False
+
+        return stat.st_size == row[1] and stat.st_mtime_ns == row[2]
+
+    # jobs of a workspace tree that were queued or running when the batch stopped, subdirectories
+    # included. failed ones are not: they failed on their own and would only fail again on every open.
+    def unfinished(self, directory):
+        directory = os.path.abspath(directory)
+
+        # a range over the index instead of LIKE, which would need escaping and can't use it
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT recipe FROM jobs WHERE (directory = ? OR (directory > ? AND directory < ?)) AND state IN (?, ?)',
+                (directory, directory + os.sep, directory + chr(ord(os.sep) + 1), PENDING, RUNNING)
+            ).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_shared_journal = None
+_shared_lock = threading.Lock()
+
+def shared_journal():
+    global _shared_journal
+
+    with _shared_lock:
+        if _shared_journal is None:
+            _shared_journal = Journal()
+
+    return _shared_journal
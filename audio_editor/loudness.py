@@ -0,0 +1,568 @@
+import json
+import math
+import os
+import threading
+
+import ffmpeg
+import numpy as np
+
+from . import trace
+from .process import JobError, LimitedProcess, run
+from .waveform import PeakBuilder, linkPeaks, savePeaks
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+# scipy.signal takes over a second to import, so the first meter loads it, not the importer of this module.
+# None once we know it is missing.
+_lfilter = False
+
+def loadFilter():
+    global _lfilter
+
+    if _lfilter is False:
+        try:
+            from scipy.signal import lfilter
+        except ImportError:
+            lfilter = None
+
+        _lfilter = lfilter
+
+    return _lfilter
+
+CHUNK_FRAMES = 1 << 16
+
+# files at least this long (seconds) are split and analyzed in parallel
+SEGMENT_THRESHOLD = float(os.environ.get('AUDIO_EDITOR_SEGMENT_THRESHOLD', 600))
+SEGMENT_LENGTH = float(os.environ.get('AUDIO_EDITOR_SEGMENT_LENGTH', 300))
+
+# quick look: ESTIMATE_WINDOWS evenly spaced windows of ESTIMATE_WINDOW seconds, each reached by a seek.
+# shorter files are measured in full, which costs about the same.
+ESTIMATE_WINDOWS = 6
+ESTIMATE_WINDOW = 2.0
+ESTIMATE_MIN_DURATION = 4 * ESTIMATE_WINDOWS * ESTIMATE_WINDOW
+
+# the bound is about a 95% interval for the mean volume, from the spread between windows
+ESTIMATE_Z = 2.0
+ESTIMATE_BOUND_MAX = 30.0
+
+# decoded ahead of each segment to settle the K-weighting filter and gating blocks
+PREROLL_SUB_BLOCKS = 10
+
+# mean/max are computed on float samples, volumedetect works on s16.
+# on real material the two agree within this many dB.
+VOLUMEDETECT_TOLERANCE = 0.05
+
+# volumedetect's quietest level is one s16 step, so digital silence reads this rather than -inf
+VOLUMEDETECT_FLOOR = -91.0
+
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+HISTOGRAM_STEP = 0.01
+HISTOGRAM_TOP = 5.0
+
+# BS.1770 channel weights in ffmpeg's default channel order (FL FR FC LFE BL BR)
+CHANNEL_WEIGHTS = (1.0, 1.0, 1.0, 0.0, 1.41, 1.41)
+
+def toDecibel(power):
+    return 10 * math.log10(power) if power > 0 else -math.inf
+
+# pre-filter + RLB high-pass from BS.1770, recomputed for any sample rate
+def kWeightingFilter(sample_rate):
+    f0 = 1681.974450955533
+    gain = 3.999843853973347
+    q = 0.7071752369554196
+
+    k = math.tan(math.pi * f0 / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+
+    k = math.tan(math.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+
+    highpass_b = [1.0, -2.0, 1.0]
+    highpass_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    return np.convolve(shelf_b, highpass_b), np.convolve(shelf_a, highpass_a)
+
+# windowed-sinc interpolator split into one FIR per output phase
+def truePeakFilter(factor, taps_per_phase=12):
+    length = factor * taps_per_phase
+    n = np.arange(length) - (length - 1) / 2
+    h = np.sinc(n / factor) * np.hanning(length)
+
+    phases = [h[p::factor] for p in range(factor)]
+    return [phase / phase.sum() for phase in phases]
+
+class LoudnessMeter():
+    def __init__(self, sample_rate, channels, preroll=0):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.preroll = preroll
+        self.preroll_frames = preroll
+
+        self.samples = 0
+        self.energy = 0.0
+        self.peak = 0.0
+
+        self.weights = np.array([CHANNEL_WEIGHTS[c] if c < len(CHANNEL_WEIGHTS) else 1.0 for c in range(channels)])
+        self.hop = max(1, round(sample_rate / 10))
+        self.pending = np.zeros((0, channels))
+        self.recent = []
+        self.sub_blocks_seen = 0
+
+        bins = int((HISTOGRAM_TOP - ABSOLUTE_GATE) / HISTOGRAM_STEP) + 1
+        self.block_counts = np.zeros(bins, dtype=np.int64)
+        self.block_energies = np.zeros(bins)
+
+        self.lfilter = loadFilter()
+
+        if self.lfilter:
+            self.k_b, self.k_a = kWeightingFilter(sample_rate)
+            self.k_state = np.zeros((len(self.k_a) - 1, channels))
+
+        factor = 4 if sample_rate < 96000 else 2 if sample_rate < 192000 else 1
+        self.oversampling = truePeakFilter(factor) if factor > 1 else None
+        self.oversampling_history = np.zeros((len(self.oversampling[0]) - 1 if self.oversampling else 0, channels))
+        self.true_peak = 0.0
+
+    def feed(self, samples):
+        if len(samples) == 0:
+            return
+
+        samples = samples.astype(np.float64, copy=False)
+
+        # preroll only warms up the filters, its samples belong to the previous segment
+        counted = samples[self.preroll:]
+        self.preroll = max(0, self.preroll - len(samples))
+
+        if len(counted):
+            self.samples += counted.size
+            self.energy += float(np.einsum('ij,ij->', counted, counted))
+            self.peak = max(self.peak, float(np.abs(counted).max()))
+
+        if self.lfilter:
+            self._feedBlocks(samples)
+
+        self._feedTruePeak(samples)
+
+    def _feedBlocks(self, samples):
+        filtered, self.k_state = self.lfilter(self.k_b, self.k_a, samples, axis=0, zi=self.k_state)
+        filtered = np.concatenate((self.pending, filtered))
+
+        whole = len(filtered) // self.hop * self.hop
+        self.pending = filtered[whole:]
+
+        if whole == 0:
+            return
+
+        # mean square per 100ms sub-block and channel
+        squares = filtered[:whole].reshape(-1, self.hop, self.channels)
+        sub_blocks = np.einsum('ijk,ijk->ik', squares, squares) / self.hop
+
+        # 400ms gating blocks with 75% overlap are sums of four sub-blocks
+        first = self.sub_blocks_seen - len(self.recent)
+        self.sub_blocks_seen += len(sub_blocks)
+
+        sub_blocks = np.concatenate((np.array(self.recent).reshape(-1, self.channels), sub_blocks))
+        self.recent = list(sub_blocks[-3:])
+
+        if len(sub_blocks) < 4:
+            return
+
+        cumulative = np.cumsum(np.vstack((np.zeros(self.channels), sub_blocks)), axis=0)
+        blocks = (cumulative[4:] - cumulative[:-4]) / 4
+        block_energy = blocks @ self.weights
+
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10 * np.log10(block_energy)
+
+        # blocks ending inside the preroll are counted by the previous segment
+        last_sub_block = first + 3 + np.arange(len(blocks))
+        gated = (block_loudness > ABSOLUTE_GATE) & (last_sub_block * self.hop >= self.preroll_frames)
+
+        index = ((np.minimum(block_loudness[gated], HISTOGRAM_TOP) - ABSOLUTE_GATE) / HISTOGRAM_STEP).astype(np.int64)
+        np.add.at(self.block_counts, index, 1)
+        np.add.at(self.block_energies, index, block_energy[gated])
+
+    def _feedTruePeak(self, samples):
+        if not self.oversampling:
+            self.true_peak = self.peak
+            return
+
+        signal = np.concatenate((self.oversampling_history, samples))
+        self.oversampling_history = signal[len(signal) - len(self.oversampling_history):]
+
+        for c in range(self.channels):
+            for phase in self.oversampling:
+                interpolated = np.convolve(signal[:, c], phase, mode='valid')
+
+                if len(interpolated):
+                    self.true_peak = max(self.true_peak, float(np.abs(interpolated).max()))
+
+        self.true_peak = max(self.true_peak, self.peak)
+
+    # combines the measurements of consecutive segments of one stream
+    def merge(self, other):
+        self.samples += other.samples
+        self.energy += other.energy
+        self.peak = max(self.peak, other.peak)
+        self.true_peak = max(self.true_peak, other.true_peak)
+        self.block_counts += other.block_counts
+        self.block_energies += other.block_energies
+
+    def integratedLoudness(self):
+        if not self.lfilter or self.block_counts.sum() == 0:
+            return None
+
+        absolute = self.block_energies.sum() / self.block_counts.sum()
+        threshold = -0.691 + toDecibel(absolute) + RELATIVE_GATE
+
+        start = max(0, int(math.ceil((threshold - ABSOLUTE_GATE) / HISTOGRAM_STEP)))
+        counts = self.block_counts[start:].sum()
+
+        if counts == 0:
+            return None
+
+        return round(-0.691 + toDecibel(self.block_energies[start:].sum() / counts), 2)
+
+    def result(self):
+        if self.samples == 0:
+            return {
+                'mean_volume': None,
+                'max_volume': None,
+                'integrated_loudness': None,
+                'true_peak': None,
+            }
+
+        # volumedetect works on clipped s16, so never report above 0 dBFS or below its floor
+        return {
+            'mean_volume': round(min(max(toDecibel(self.energy / self.samples), VOLUMEDETECT_FLOOR), 0.0), 2),
+            'max_volume': round(min(max(2 * toDecibel(self.peak), VOLUMEDETECT_FLOOR), 0.0), 2),
+            'integrated_loudness': self.integratedLoudness(),
+            'true_peak': round(max(2 * toDecibel(self.true_peak), VOLUMEDETECT_FLOOR), 2),
+        }
+
+# mean square of every window, fed like PeakBuilder from the chunks of one decode
+class WindowEnergy():
+    def __init__(self, window_frames):
+        self.window_frames = window_frames
+        self.frames = 0
+        self.energies = np.zeros(0)
+        self.counts = np.zeros(0)
+
+    def feed(self, samples):
+        windows = (self.frames + np.arange(len(samples))) // self.window_frames
+        self.frames += len(samples)
+
+        energies = np.bincount(windows, weights=np.einsum('ij,ij->i', samples, samples, dtype=np.float64))
+        counts = np.bincount(windows) * samples.shape[1]
+
+        size = max(len(self.energies), len(energies))
+        self.energies = np.pad(self.energies, (0, size - len(self.energies))) + np.pad(energies, (0, size - len(energies)))
+        self.counts = np.pad(self.counts, (0, size - len(self.counts))) + np.pad(counts, (0, size - len(counts)))
+
+    # +/- dB around the mean volume, the wider of the two sides. `sampled` is the share
+    # of the file the windows cover; all of it would leave no uncertainty.
+    def bound(self, sampled):
+        whole = self.counts > 0
+        means = self.energies[whole] / self.counts[whole]
+
+        if len(means) < 2 or means.mean() <= 0:
+            return None
+
+        mean = means.mean()
+        error = ESTIMATE_Z * means.std(ddof=1) / math.sqrt(len(means)) * math.sqrt(max(0.0, 1 - sampled))
+
+        upper = 10 * math.log10((mean + error) / mean)
+        lower = -10 * math.log10(max(mean - error, mean * 10 ** (-ESTIMATE_BOUND_MAX / 10)) / mean)
+
+        return round(max(upper, lower), 2)
+
+def probe(path, limits=None):
+    info = json.loads(run(['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path], 'probe', limits))
+    audio = next((s for s in info['streams'] if s['codec_type'] == 'audio'), None)
+
+    if audio is None:
+        raise JobError('probe', 'no audio stream')
+
+    bitrate = info['format'].get('bit_rate')
+    duration = info['format'].get('duration')
+
+    return {
+        'codec': audio.get('codec_name'),
+        'sample_rate': int(audio['sample_rate']),
+        'channels': int(audio['channels']),
+        'bitrate': int(bitrate) // 1000 if bitrate else None,
+        'duration': float(duration) if duration else None,
+        'start_time': float(audio.get('start_time', 0) or 0),
+    }
+
+# header-only probe for the first loader phase. mutagen reads the tags in
+# process, which is far cheaper than spawning ffprobe per file.
+def probeHeader(path):
+    if mutagen is None:
+        return probe(path)
+
+    try:
+        tagged = mutagen.File(path)
+    except mutagen.MutagenError:
+        tagged = None
+
+    if tagged is None or not getattr(tagged.info, 'length', None):
+        return probe(path)
+
+    info = tagged.info
+    codec = getattr(info, 'codec', None) or type(tagged).__name__.lower()
+
+    return {
+        'codec': 'aac' if codec.startswith('mp4a') else codec,
+        'sample_rate': getattr(info, 'sample_rate', None),
+        'channels': getattr(info, 'channels', None),
+        # same definition as ffmpeg's container bitrate
+        'bitrate': int(os.path.getsize(path) * 8 / info.length) // 1000,
+        'duration': info.length,
+    }
+
+# md5 of the first audio stream's packets, without decoding them. the same audio under other tags,
+# another name or in another container has the same digest; None if ffmpeg can't read the file.
+def audioDigest(path, limits=None):
+    argv = (
+        ffmpeg.input(path)['a:0']
+            .output('pipe:', format='hash', hash='md5', acodec='copy')
+            .global_args('-nostdin', '-v', 'error')
+            .compile()
+    )
+
+    try:
+        out = run(argv, 'digest', limits)
+    except JobError:
+        return None
+
+    return out.decode().strip().lower() or None
+
+# measurements taken from another file with the same audio, via reuse(digest), or None.
+# the decode is skipped only if its waveform can come along too.
+def reuseAnalysis(path, digest, reuse):
+    if reuse is None or digest is None:
+        return None
+
+    reused = reuse(digest)
+
+    if reused is None or not linkPeaks(reused.pop('fingerprint'), path):
+        return None
+
+    return {**reused, 'audio_digest': digest}
+
+# the waveform peaks come out of the same decoded chunks as the loudness
+# ffmpeg's stderr is parsed as it comes, see process.StderrParser
+def decodeInto(meter, stream, chunk_frames=CHUNK_FRAMES, peaks=None, limits=None):
+    argv = (
+        stream
+            .output('pipe:', format='f32le', acodec='pcm_f32le')
+            .global_args('-nostdin', '-v', 'error')
+            .compile()
+    )
+    process = LimitedProcess(argv, 'analysis', limits)
+
+    frame_bytes = 4 * meter.channels
+    pcm_bytes = 0
+
+    # thread_cpu of this span is the meter, ffmpeg_cpu the decoder
+    with trace.span('decode', 'analysis') as span, process.stdout:
+        while True:
+            data = process.stdout.read(chunk_frames * frame_bytes)
+
+            if not data:
+                break
+
+            pcm_bytes += len(data)
+            usable = len(data) // frame_bytes * frame_bytes
+            samples = np.frombuffer(data[:usable], dtype='<f4').reshape(-1, meter.channels)
+            meter.feed(samples)
+
+            if peaks is not None:
+                peaks.feed(samples)
+
+        span.set(pcm_bytes=pcm_bytes, ffmpeg_cpu=trace.processCpu(process.pid))
+
+    process.wait()
+
+    return process.stderr
+
+# ffmpeg may exit cleanly on a file it could make nothing of; that is a failure too, not a record of Nones
+def checkDecoded(meter, stderr):
+    if meter.samples == 0:
+        raise JobError('analysis', 'no audio decoded', 0, stderr.tail)
+
+# a file that can't be measured raises a JobError. limits (process.ResourceLimits) apply to
+# every ffmpeg started for it.
+def analyze(path, chunk_frames=CHUNK_FRAMES, reuse=None, limits=None):
+    with trace.span('analyze', 'analysis', file=os.path.basename(path), bytes_read=trace.fileSize(path)) as span:
+        digest = audioDigest(path, limits)
+        reused = reuseAnalysis(path, digest, reuse)
+
+        if reused is not None:
+            span.set(reused=True)
+            return reused
+
+        header = probe(path, limits)
+        meter = LoudnessMeter(header['sample_rate'], header['channels'])
+        peaks = PeakBuilder(header['sample_rate'])
+
+        checkDecoded(meter, decodeInto(meter, ffmpeg.input(path)['a:0'], chunk_frames, peaks, limits))
+        savePeaks(path, peaks)
+
+    return {
+        'codec': header['codec'],
+        'bitrate': header['bitrate'],
+        'duration': header['duration'],
+        'audio_digest': digest,
+        **meter.result(),
+    }
+
+# quick-look measurements from a few windows, with 'estimated' set and the mean volume's
+# confidence bound in 'volume_bound'. max_volume is the loudest sample seen, so the real one
+# is at least that. short files get the full analysis.
+def estimate(path, windows=ESTIMATE_WINDOWS, window=ESTIMATE_WINDOW, reuse=None, limits=None):
+    header = probe(path, limits)
+    duration = header['duration']
+
+    if not duration or duration < ESTIMATE_MIN_DURATION:
+        return analyze(path, reuse=reuse, limits=limits)
+
+    with trace.span('estimate', 'analysis', file=os.path.basename(path)):
+        sample_rate = header['sample_rate']
+        meter = LoudnessMeter(sample_rate, header['channels'])
+        energy = WindowEnergy(round(window * sample_rate))
+
+        # one ffmpeg run: every window is its own input, seeked to, and they play back to back
+        spacing = duration / windows
+        starts = [max(0.0, spacing * (i + 0.5) - window / 2) for i in range(windows)]
+        stream = ffmpeg.concat(*(ffmpeg.input(path, ss=start, t=window)['a:0'] for start in starts), v=0, a=1)
+
+        checkDecoded(meter, decodeInto(meter, stream, CHUNK_FRAMES, energy, limits))
+
+    return {
+        'codec': header['codec'],
+        'bitrate': header['bitrate'],
+        'duration': duration,
+        **meter.result(),
+        'estimated': True,
+        'volume_bound': energy.bound(windows * window / duration),
+    }
+
+# one long file split into time segments that can run on separate workers.
+# boundaries are whole sub-blocks, so the merged numbers equal a single pass.
+class SegmentedAnalysis():
+    def __init__(self, path, duration, segment_length=SEGMENT_LENGTH, reuse=None, limits=None):
+        self.path = path
+        self.reuse = reuse
+        self.limits = limits
+        self.failed = False
+        self.digest = None
+        self.reused = None
+        self.looked_up = False
+        self.segment_length = segment_length
+        self.count = max(1, math.ceil(duration / segment_length))
+        self.meters = [None] * self.count
+        self.peaks = [None] * self.count
+        self.remaining = self.count
+        self.header = None
+        self.lock = threading.Lock()
+
+    def analyzeSegment(self, index, chunk_frames=CHUNK_FRAMES):
+        header = probe(self.path, self.limits)
+        sample_rate = header['sample_rate']
+
+        hop = max(1, round(sample_rate / 10))
+        step = max(hop, round(self.segment_length * sample_rate) // hop * hop)
+        start = index * step
+        end = None if index == self.count - 1 else start + step
+        preroll = min(start, PREROLL_SUB_BLOCKS * hop)
+
+        meter = LoudnessMeter(sample_rate, header['channels'], preroll)
+        peaks = PeakBuilder(sample_rate, preroll, start)
+
+        # the filter graph runs in 1/sample_rate, so atrim cuts on exact samples.
+        # -copyts keeps the original timeline after the coarse input seek.
+        offset = round(header['start_time'] * sample_rate)
+        trim = {}
+
+        if start:
+            trim['start_pts'] = offset + start - preroll
+
+        if end is not None:
+            trim['end_pts'] = offset + end
+
+        seek = max(0.0, (start - preroll) / sample_rate - 1)
+        stream = ffmpeg.input(self.path, ss=seek, copyts=None)['a:0']
+
+        if trim:
+            stream = stream.filter('atrim', **trim)
+
+        stderr = decodeInto(meter, stream, chunk_frames, peaks, self.limits)
+
+        return header, meter, peaks, stderr
+
+    # returns the merged measurements once the last segment is done, otherwise None.
+    # the segment that fails raises; the ones after it skip their work and return None.
+    def run(self, index):
+        # the first segment to start looks for the same audio, the others wait for the answer
+        with self.lock:
+            if not self.looked_up:
+                self.digest = audioDigest(self.path, self.limits)
+                self.reused = reuseAnalysis(self.path, self.digest, self.reuse)
+                self.looked_up = True
+
+            if self.reused is not None or self.failed:
+                self.remaining -= 1
+                return None if self.remaining or self.failed else self.reused
+
+        try:
+            with trace.span('analyze segment', 'analysis', file=os.path.basename(self.path), segment=index):
+                header, meter, peaks, stderr = self.analyzeSegment(index)
+        except Exception:
+            with self.lock:
+                self.failed = True
+                self.remaining -= 1
+
+            raise
+
+        with self.lock:
+            self.meters[index] = meter
+            self.peaks[index] = peaks
+            self.header = header
+            self.remaining -= 1
+
+            if self.remaining or self.failed:
+                return None
+
+        merged = self.meters[0]
+
+        for meter in self.meters[1:]:
+            merged.merge(meter)
+
+        checkDecoded(merged, stderr)
+
+        for peaks in self.peaks[1:]:
+            self.peaks[0].merge(peaks)
+
+        savePeaks(self.path, self.peaks[0])
+
+        return {
+            'codec': self.header['codec'],
+            'bitrate': self.header['bitrate'],
+            'duration': self.header['duration'],
+            'audio_digest': self.digest,
+            **merged.result(),
+        }
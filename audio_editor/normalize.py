@@ -0,0 +1,69 @@
+TRACK = 'track'
+ALBUM = 'album'
+MODES = (TRACK, ALBUM)
+
+DEFAULT_TARGET = -16.0
+DEFAULT_CEILING = -1.0
+
+# loudness of a group of tracks as one programme: their energies averaged by duration.
+# close to measuring the concatenated album, without decoding it again.
+def groupLoudness(loudness, durations, group_index, group_count):
+    import numpy as np
+
+    energy = np.bincount(group_index, weights=durations * 10 ** (loudness / 10), minlength=group_count)
+    total = np.bincount(group_index, weights=durations, minlength=group_count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 10 * np.log10(energy / total)
+
+# gain in dB per file to reach `target`, never pushing a sample peak above `ceiling` dBFS.
+# album mode gives every file of a group the same gain, so their relative levels stay;
+# the loudest peak of the group then limits all of them.
+def normalizationGains(loudness, peaks, durations, groups, target=DEFAULT_TARGET, ceiling=DEFAULT_CEILING, mode=TRACK):
+    import numpy as np
+
+    loudness = np.asarray(loudness, dtype=np.float64)
+    peaks = np.asarray(peaks, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+
+    headroom = ceiling - peaks
+
+    if mode == TRACK:
+        return np.minimum(target - loudness, headroom)
+
+    _, group_index = np.unique(np.asarray(groups), return_inverse=True)
+    group_count = group_index.max() + 1 if len(group_index) else 0
+
+    # a track without a usable duration still counts, with a nominal weight
+    durations = np.where(durations > 0, durations, 1.0)
+
+    group_headroom = np.full(group_count, np.inf)
+    np.minimum.at(group_headroom, group_index, headroom)
+
+    gains = np.minimum(target - groupLoudness(loudness, durations, group_index, group_count), group_headroom)
+
+    return gains[group_index]
+
+# the target is in LUFS, so only files with an integrated loudness take part. a mean volume is
+# unweighted and ungated RMS, off from LUFS by an amount that depends on the material: mixed in,
+# those files would come out systematically louder or quieter than the rest.
+def isNormalizable(audio_file):
+    return audio_file.analyzed and audio_file.integrated_loudness is not None
+
+# new mean_volume_after for normalizable files (isNormalizable): a gain is the same dB shift
+# on the integrated loudness and on the mean volume.
+def normalizedVolumes(audio_files, target=DEFAULT_TARGET, ceiling=DEFAULT_CEILING, mode=TRACK):
+    import numpy as np
+
+    if not audio_files:
+        return []
+
+    gains = normalizationGains(
+        [f.integrated_loudness for f in audio_files],
+        [f.max_volume for f in audio_files],
+        [f.duration or 0 for f in audio_files],
+        [f.directory for f in audio_files],
+        target, ceiling, mode
+    )
+
+    return np.round(np.array([f.mean_volume for f in audio_files]) + gains, 2).tolist()
@@ -0,0 +1,427 @@
+import asyncio
+import glob
+import itertools
+import os
+import subprocess
+import time
+
+from . import trace
+from .journal import recipeHash, recipeOf
+from .process import JOB_LIMITS, READ_SIZE, StderrParser, errorOf
+from .planner import AUDIO_ONLY, ENCODE, REMUX, planJob, remuxArgs, runFastPath
+from .scheduler import AdaptiveLimiter, longestFirst, poolSize
+
+# job results besides the planner kinds
+CACHED = 'cached'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMEOUT = 'timeout'
+# stream copied from the output of a file with the same audio
+SHARED = 'shared'
+
+CONCURRENCY = poolSize()
+
+# a job gets at least TIMEOUT_MIN seconds, longer files one second per second of audio.
+# AUDIO_EDITOR_JOB_TIMEOUT replaces both with a fixed limit.
+JOB_TIMEOUT = float(os.environ.get('AUDIO_EDITOR_JOB_TIMEOUT', 0))
+TIMEOUT_MIN = 60
+
+def jobTimeout(duration):
+    return JOB_TIMEOUT or max(TIMEOUT_MIN, duration or 0)
+
+# hidden, but keeps the real extension so ffmpeg still picks the right muxer.
+# attempts at the same job that may overlap (cluster leases) each write their own.
+def temporaryPath(path, attempt=None):
+    directory, file = os.path.split(path)
+    name, ext = os.path.splitext(file)
+    partial = f'partial-{attempt}' if attempt else 'partial'
+
+    return os.path.join(directory, f'.{name}.{partial}{ext}')
+
+# what other attempts at the same output left behind, e.g. a worker that was killed
+def abandonedPartials(path, attempt):
+    directory, file = os.path.split(path)
+    name, ext = os.path.splitext(file)
+    pattern = os.path.join(glob.escape(directory), f'.{glob.escape(name)}.partial-*{glob.escape(ext)}')
+
+    return [p for p in glob.glob(pattern) if p != temporaryPath(path, attempt)]
+
+# the attempt was given up on and the job handed to someone else, who owns the output now
+class LeaseLost(Exception):
+    pass
+
+# lossless sources stay lossless where the container allows it
+def codecArgs(target):
+    if target.container == '.flac' and target.extension_after == '.flac':
+        return ['-c:v', 'copy', '-c:a', 'flac']
+    if target.container == '.flac' and target.extension_after in ('.m4a', '.mp4'):
+        return ['-c:v', 'copy', '-c:a', 'alac']
+
+    return ['-b:a', f'{target.bitrate_after}']
+
+# every target of one source in a single ffmpeg run: one decode, one volume filter, split per output
+def encodeArgs(targets, after_paths):
+    source = targets[0]
+    volume = f'volume={source.getVolumeDiff()}dB'
+
+    if len(targets) == 1:
+        args = ['-i', source.getBeforePath(), '-af', volume, *codecArgs(source), after_paths[0]]
+    else:
+        labels = [f'[a{i}]' for i in range(len(targets))]
+        args = ['-i', source.getBeforePath(), '-filter_complex', f'[0:a]{volume},asplit={len(targets)}{"".join(labels)}']
+
+        for target, label, after_path in zip(targets, labels, after_paths):
+            args += ['-map', label]
+
+            if target.extension_after not in AUDIO_ONLY:
+                args += ['-map', '0:v?']
+
+            args += [*codecArgs(target), after_path]
+
+    return ['ffmpeg', '-nostdin', '-v', 'error', '-nostats', '-progress', 'pipe:1', '-y', *args]
+
+# encoded outputs that come out the same for every file with this audio.
+# the codec arguments stand in for the bitrate, which a lossless target ignores.
+def shareKey(target):
+    digest = getattr(target, 'audio_digest', None)
+
+    if digest is None:
+        return None
+
+    return (digest, target.getVolumeDiff(), target.extension_after, *codecArgs(target))
+
+# the audio of an output encoded for a duplicate, with this file's own tags (and video, where kept)
+def shareArgs(target, encoded_path, before_path, after_path):
+    streams = ['-map', '0:a'] if target.extension_after in AUDIO_ONLY else ['-map', '0:a', '-map', '1:v?']
+
+    return [
+        'ffmpeg', '-nostdin', '-v', 'error', '-nostats', '-progress', 'pipe:1', '-y',
+        '-i', encoded_path, '-i', before_path, *streams, '-map_metadata', '1', '-c', 'copy', after_path
+    ]
+
+class JobProgress():
+    def __init__(self, duration):
+        self.duration = duration or 0
+        self.position = 0
+        self.speed = None
+        self.cpu = None
+        self.done = False
+
+    # one key=value line of ffmpeg -progress output
+    def update(self, key, value):
+        if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+            self.position = min(int(value) / 1000000, self.duration)
+        elif key == 'speed' and value.endswith('x'):
+            try:
+                self.speed = float(value[:-1])
+            except ValueError:
+                self.speed = None
+
+    # jobs that didn't run ffmpeg to the end drop out of the batch throughput
+    def finish(self, processed=True):
+        if processed:
+            self.position = self.duration
+        else:
+            self.duration = self.position
+
+        self.done = True
+
+    def eta(self):
+        if self.done:
+            return 0
+        if not self.speed:
+            return None
+
+        return (self.duration - self.position) / self.speed
+
+# runs ffmpeg jobs as asyncio subprocesses, longest first and at most `concurrency` at a time.
+# with adaptive set, a batch resizes that limit from measured cpu load.
+# on_progress(path, job_progress) and on_report(path, kind) are called from the loop thread,
+# cancel() may be called from any thread. files with the same audio and the same edits are
+# encoded once, the others copy that encode's audio stream. every ffmpeg runs under limits
+# (process.ResourceLimits); a failed job leaves its structured error on the AudioFile.
+# attempt names the temporary outputs, see temporaryPath. still_leased() is asked, off the loop,
+# right before the outputs take their final names; false drops them and raises LeaseLost.
+class Orchestrator():
+    def __init__(self, concurrency=CONCURRENCY, timeout=None, on_progress=None, on_report=None, adaptive=True, limits=None, attempt=None, still_leased=None):
+        self.concurrency = concurrency
+        self.attempt = attempt
+        self.still_leased = still_leased
+        self.adaptive = adaptive
+        self.timeout = timeout
+        self.limits = limits or JOB_LIMITS
+        self.on_progress = on_progress
+        self.on_report = on_report
+        self.limiter = None
+        self.loop = None
+        self.started = None
+        self.tasks = {}
+        self.progress = {}
+        self.shared = {}
+        self.trace_ids = itertools.count(1 << 20)
+
+    async def runJob(self, audio_file, journal=None):
+        if self.limiter is None:
+            self.limiter = AdaptiveLimiter(self.concurrency)
+
+        audio_file.error = None
+
+        # jobs interleave on the loop thread, so each gets its own row in the trace
+        tid = next(self.trace_ids)
+        queued_at = trace.now()
+        name = os.path.basename(audio_file.getBeforePath())
+
+        async with self.limiter:
+            started_at = trace.now()
+            trace.complete('queue wait', 'orchestrator', queued_at, started_at, tid=tid, file=name)
+            kind = FAILED
+
+            try:
+                kind = await self._runJob(audio_file, journal, tid)
+                return kind
+            except Exception as e:
+                audio_file.error = errorOf(e, 'encode')
+                raise
+            finally:
+                if trace.ENABLED:
+                    trace.complete(
+                        'job', 'orchestrator', started_at, tid=tid, file=name, kind=kind,
+                        bytes_read=trace.fileSize(audio_file.getBeforePath()),
+                        bytes_written=sum(trace.fileSize(t.getAfterPath()) or 0 for t in audio_file.getTargets())
+                    )
+
+    # one job per source, whatever number of outputs it has.
+    # returns the kinds of the outputs joined with '+', e.g. 'encode' or 'encode+remux'.
+    async def _runJob(self, audio_file, journal, tid=None):
+        kinds = []
+        outputs = []
+
+        for target in audio_file.getTargets():
+            recipe = recipeOf(target)
+            recipe_hash = None
+
+            if journal:
+                recipe_hash = recipeHash(recipe)
+
+                if journal.isUpToDate(recipe, recipe_hash):
+                    kinds.append(CACHED)
+                    continue
+
+            outputs.append((target, planJob(target, verify=True), recipe, recipe_hash, temporaryPath(recipe['output'], self.attempt)))
+
+        if journal:
+            for _, _, recipe, _, _ in outputs:
+                journal.start(recipe)
+
+        # the first job with a share key encodes it, later ones wait for that output
+        encodes, borrowed, leading = [], [], []
+
+        for index, output in enumerate(outputs):
+            if output[1] != ENCODE:
+                continue
+
+            key = shareKey(output[0])
+
+            if key in self.shared:
+                borrowed.append((index, self.shared[key]))
+                continue
+
+            if key is not None:
+                self.shared[key] = asyncio.get_running_loop().create_future()
+                leading.append((self.shared[key], output[2]['output']))
+
+            encodes.append(output)
+
+        try:
+            source = audio_file.getBeforePath()
+
+            if encodes:
+                await self._execute(source, encodeArgs([o[0] for o in encodes], [o[4] for o in encodes]), audio_file.duration, tid)
+
+            fallback = []
+
+            for index, future in borrowed:
+                target, _, recipe, recipe_hash, temporary_path = outputs[index]
+                encoded_path = await asyncio.shield(future)
+
+                if encoded_path and os.path.exists(encoded_path):
+                    await self._execute(source, shareArgs(target, encoded_path, source, temporary_path), audio_file.duration, tid)
+                    outputs[index] = (target, SHARED, recipe, recipe_hash, temporary_path)
+                else:
+                    fallback.append(outputs[index])
+
+            # the shared encode failed: do our own
+            if fallback:
+                await self._execute(source, encodeArgs([o[0] for o in fallback], [o[4] for o in fallback]), audio_file.duration, tid)
+
+            for target, kind, _, _, temporary_path in outputs:
+                if kind == REMUX:
+                    await self._execute(source, remuxArgs(target, source, temporary_path), audio_file.duration, tid)
+                elif kind not in (ENCODE, SHARED):
+                    applied = await asyncio.get_running_loop().run_in_executor(None, runFastPath, kind, target, source, temporary_path)
+
+                    # journaled next to the request, which stays what the recipe hash is over
+                    if applied is not None:
+                        target.applied_volume_diff = applied
+                        recipe['applied_volume_diff'] = applied
+
+            if self.still_leased and not await asyncio.get_running_loop().run_in_executor(None, self.still_leased):
+                raise LeaseLost(f'{source} was handed to another worker')
+
+            for _, _, recipe, _, temporary_path in outputs:
+                os.replace(temporary_path, recipe['output'])
+
+                # the lease is ours, so whoever wrote these is not coming back for them
+                if self.attempt:
+                    for abandoned in abandonedPartials(recipe['output'], self.attempt):
+                        try:
+                            os.remove(abandoned)
+                        except OSError:
+                            pass
+
+            for future, output_path in leading:
+                future.set_result(output_path)
+        except BaseException as e:
+            for future, _ in leading:
+                if not future.done():
+                    future.set_result(None)
+
+            for _, _, recipe, _, temporary_path in outputs:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+
+                # the journal row is the new lease holder's
+                if journal and not isinstance(e, LeaseLost):
+                    journal.fail(recipe, str(e) or type(e).__name__)
+
+            raise
+
+        for _, kind, recipe, recipe_hash, _ in outputs:
+            if journal:
+                journal.finish(recipe, kind, recipe_hash)
+
+            kinds.append(kind)
+
+        return '+'.join(sorted(set(kinds)))
+
+    async def _execute(self, path, argv, duration, tid=None):
+        progress = self.progress.setdefault(path, JobProgress(duration))
+        started_at = trace.now()
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.limits.applyTo(process.pid)
+        stderr = StderrParser()
+
+        try:
+            reader = asyncio.ensure_future(self._parse(process.stderr, stderr))
+            await asyncio.wait_for(self._follow(path, process, progress), self.timeout or jobTimeout(duration))
+            await process.wait()
+            await reader
+        finally:
+            # cancelled or timed out: don't leave ffmpeg writing behind us
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        trace.complete('ffmpeg', 'orchestrator', started_at, tid=tid, cpu=progress.cpu, returncode=process.returncode)
+
+        if process.returncode != 0:
+            raise stderr.error('encode', process.returncode, self.limits)
+
+    async def _parse(self, stream, stderr):
+        while True:
+            data = await stream.read(READ_SIZE)
+
+            if not data:
+                break
+
+            stderr.feed(data)
+
+        stderr.close()
+
+    async def _follow(self, path, process, progress):
+        async for line in process.stdout:
+            key, _, value = line.decode(errors='replace').strip().partition('=')
+
+            if key == 'progress':
+                # the last sample before ffmpeg exits is its cpu time; it is gone once reaped
+                if trace.ENABLED:
+                    progress.cpu = trace.processCpu(process.pid) or progress.cpu
+
+                if self.on_progress:
+                    self.on_progress(path, progress)
+            else:
+                progress.update(key, value)
+
+    async def _report(self, audio_file, journal):
+        path = audio_file.getBeforePath()
+
+        try:
+            kind = await self.runJob(audio_file, journal)
+        except asyncio.CancelledError:
+            kind = CANCELLED
+        except asyncio.TimeoutError:
+            kind = TIMEOUT
+        except Exception:
+            kind = FAILED
+
+        self.progress[path].finish(kind not in (CACHED, FAILED, CANCELLED, TIMEOUT))
+
+        if self.on_progress:
+            self.on_progress(path, self.progress[path])
+        if self.on_report:
+            self.on_report(path, kind)
+
+        return kind
+
+    async def runBatch(self, audio_files, journal=None):
+        self.loop = asyncio.get_running_loop()
+        self.started = time.monotonic()
+
+        self.limiter = AdaptiveLimiter(self.concurrency)
+        self.shared = {}
+        audio_files = longestFirst(audio_files, lambda f: f.duration)
+
+        for audio_file in audio_files:
+            self.progress[audio_file.getBeforePath()] = JobProgress(audio_file.duration)
+
+        # tasks queue on the limiter in creation order
+        self.tasks = {f.getBeforePath(): asyncio.ensure_future(self._report(f, journal)) for f in audio_files}
+        adapter = asyncio.ensure_future(self.limiter.adapt()) if self.adaptive else None
+
+        try:
+            kinds = await asyncio.gather(*self.tasks.values())
+        finally:
+            if adapter:
+                adapter.cancel()
+
+        return dict(zip(self.tasks.keys(), kinds))
+
+    # cancels one job by source path, or the whole batch
+    def cancel(self, path=None):
+        if self.loop is None:
+            return
+
+        tasks = list(self.tasks.values()) if path is None else [self.tasks[path]] if path in self.tasks else []
+
+        for task in tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    # batch throughput in seconds of audio per second of wall time, and time left at that rate
+    def stats(self):
+        total = sum(p.duration for p in self.progress.values())
+        position = sum(p.position for p in self.progress.values())
+        elapsed = time.monotonic() - self.started if self.started else 0
+        factor = position / elapsed if elapsed > 0 else 0
+
+        return {
+            'done': sum(1 for p in self.progress.values() if p.done),
+            'total': len(self.progress),
+            'fraction': position / total if total else 0,
+            'realtime_factor': factor,
+            'eta': (total - position) / factor if factor else None,
+        }
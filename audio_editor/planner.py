@@ -0,0 +1,77 @@
+import shutil
+
+from .gain import applyGain, plannedGain, supportsGain
+
+COPY = 'copy'
+REMUX = 'remux'
+GAIN = 'gain'
+ENCODE = 'encode'
+
+# codecs each output container can take without re-encoding
+CONTAINER_CODECS = {
+    '.flac': ('flac',),
+    '.mp3': ('mp3',),
+    '.m4a': ('aac', 'alac'),
+    '.mp4': ('aac', 'alac', 'mp3'),
+}
+
+# used when the source codec was never probed
+DEFAULT_CODECS = {
+    '.flac': 'flac',
+    '.mp3': 'mp3',
+    '.m4a': 'aac',
+    '.mp4': 'aac',
+}
+
+# audio-only containers drop video/cover streams on remux
+AUDIO_ONLY = ('.flac', '.mp3', '.m4a')
+
+# decided by what the source holds: a misnamed file never ends up copied under the wrong name.
+# with verify the source's bytes are sniffed as well before they are patched in place.
+def planJob(audio_file, verify=False):
+    container = getattr(audio_file, 'container', None) or audio_file.extension
+
+    if audio_file.bitrate != audio_file.bitrate_after:
+        return ENCODE
+
+    if round(audio_file.getVolumeDiff(), 2) != 0:
+        # volume-only edits can skip the transcode when the user asked for it
+        if getattr(audio_file, 'gain_mode', ENCODE) == GAIN and container == audio_file.extension_after and supportsGain(container, audio_file.getBeforePath() if verify else None):
+            return GAIN
+
+        return ENCODE
+
+    if container == audio_file.extension_after:
+        return COPY
+
+    codec = getattr(audio_file, 'codec', None) or DEFAULT_CODECS.get(container)
+
+    if codec in CONTAINER_CODECS.get(audio_file.extension_after, ()):
+        return REMUX
+
+    return ENCODE
+
+def remuxArgs(audio_file, before_path, after_path):
+    streams = '0:a' if audio_file.extension_after in AUDIO_ONLY else '0'
+
+    return ['ffmpeg', '-nostdin', '-v', 'error', '-nostats', '-progress', 'pipe:1', '-y', '-i', before_path, '-map', streams, '-c', 'copy', after_path]
+
+# pipeline as shown before the job runs, with the gain a lossless edit will really write
+def describeJob(audio_file):
+    kind = planJob(audio_file)
+
+    if kind == GAIN and plannedGain(audio_file.container, audio_file.getVolumeDiff()) != audio_file.getVolumeDiff():
+        return f'{kind} ({plannedGain(audio_file.container, audio_file.getVolumeDiff()):+.1f} dB)'
+
+    return kind
+
+# the in-process fast paths; remuxing runs ffmpeg with remuxArgs.
+# returns the gain in dB a gain job applied, None for a copy.
+def runFastPath(kind, audio_file, before_path, after_path):
+    if kind in (COPY, GAIN):
+        shutil.copyfile(before_path, after_path)
+
+        if kind == GAIN:
+            return applyGain(after_path, audio_file.container, audio_file.getVolumeDiff())
+    else:
+        raise ValueError(f'{kind} is not a fast path')
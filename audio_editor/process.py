@@ -0,0 +1,197 @@
+import collections
+import os
+import signal
+import subprocess
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# limits for every ffmpeg/ffprobe a job starts, 0 for none: address space in MiB and cpu seconds.
+# the decode and the encode run in those processes; our side of an analysis reads in fixed chunks.
+JOB_MEMORY = int(os.environ.get('AUDIO_EDITOR_JOB_MEMORY', 0))
+JOB_CPU = int(os.environ.get('AUDIO_EDITOR_JOB_CPU', 0))
+
+# what is kept of a process's stderr: the last few distinct lines, each cut to LINE_LIMIT bytes
+STDERR_LINES = 8
+LINE_LIMIT = 1024
+READ_SIZE = 64 * 1024
+
+MEMORY = 'memory'
+CPU = 'cpu'
+
+OUT_OF_MEMORY = ('cannot allocate memory', 'out of memory')
+
+class ResourceLimits():
+    # None takes the environment's default
+    def __init__(self, memory=None, cpu=None):
+        self.memory = JOB_MEMORY if memory is None else memory
+        self.cpu = JOB_CPU if cpu is None else cpu
+
+    # set on the child right after it started: preexec_fn isn't safe next to the threads we run.
+    # past the soft cpu limit it gets SIGXCPU, a second later SIGKILL; over the memory limit its
+    # allocations fail. prlimit is linux only, elsewhere there are no limits.
+    def applyTo(self, pid):
+        if not hasattr(resource, 'prlimit'):
+            return
+
+        try:
+            if self.memory:
+                limit = self.memory << 20
+                resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+
+            if self.cpu:
+                resource.prlimit(pid, resource.RLIMIT_CPU, (self.cpu, self.cpu + 1))
+        except ProcessLookupError:
+            pass
+
+    # which limit, if any, ended a process that exited with returncode
+    def exceeded(self, returncode, stderr):
+        if self.cpu and returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+            return CPU
+
+        if self.memory and (stderr.out_of_memory or returncode in (-signal.SIGSEGV, -signal.SIGABRT)):
+            return MEMORY
+
+        return None
+
+JOB_LIMITS = ResourceLimits()
+
+# a failed step of a job, as data: which stage, how the process ended, the tail of its stderr
+# and the limit it ran into. the fields pickle, so it crosses process pools as it is.
+class JobError(Exception):
+    def __init__(self, stage, message, returncode=None, stderr=(), limit=None):
+        super().__init__(stage, message, returncode, list(stderr), limit)
+        self.stage = stage
+        self.message = message
+        self.returncode = returncode
+        self.stderr = list(stderr)
+        self.limit = limit
+
+    def __str__(self):
+        detail = f' ({self.stderr[-1]})' if self.stderr else ''
+        limit = f', {self.limit} limit exceeded' if self.limit else ''
+
+        return f'{self.stage}: {self.message}{limit}{detail}'
+
+    def asDict(self):
+        return {
+            'stage': self.stage,
+            'message': self.message,
+            'returncode': self.returncode,
+            'stderr': self.stderr,
+            'limit': self.limit,
+        }
+
+# the structured form of any exception a job step raised
+def errorOf(e, stage):
+    if isinstance(e, JobError):
+        return e.asDict()
+
+    return JobError(stage, f'{type(e).__name__}: {e}').asDict()
+
+# takes stderr in whatever pieces it arrives and keeps only what an error report needs.
+# a file that makes ffmpeg warn on every frame costs a counter, not a growing buffer.
+class StderrParser():
+    def __init__(self, lines=STDERR_LINES):
+        self.tail = collections.deque(maxlen=lines)
+        self.partial = b''
+        self.count = 0
+        self.repeated = 0
+        self.out_of_memory = False
+
+    def feed(self, data):
+        *lines, partial = (self.partial + data).split(b'\n')
+
+        # a line without an end in sight is cut, not buffered
+        self.partial = partial[:LINE_LIMIT]
+
+        for line in lines:
+            self.line(line[:LINE_LIMIT])
+
+    def line(self, data):
+        text = data.decode(errors='replace').strip()
+
+        if not text:
+            return
+
+        self.count += 1
+
+        if any(marker in text.lower() for marker in OUT_OF_MEMORY):
+            self.out_of_memory = True
+
+        if self.tail and self.tail[-1] == text:
+            self.repeated += 1
+            return
+
+        self.tail.append(text)
+
+    def close(self):
+        if self.partial:
+            self.line(self.partial)
+            self.partial = b''
+
+    # reads a pipe to its end, e.g. on a thread next to the one reading stdout
+    def drain(self, stream):
+        with stream:
+            for data in iter(lambda: stream.read1(READ_SIZE), b''):
+                self.feed(data)
+
+        self.close()
+
+    def error(self, stage, returncode, limits):
+        return JobError(stage, f'exited with {returncode}', returncode, self.tail, limits.exceeded(returncode, self))
+
+# a child process under the job limits whose stderr is parsed as it comes.
+# stdout is the caller's to read; wait() raises a JobError if it didn't exit cleanly.
+class LimitedProcess():
+    def __init__(self, argv, stage, limits=None):
+        self.stage = stage
+        self.limits = limits or JOB_LIMITS
+        self.stderr = StderrParser()
+        self.process = subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.limits.applyTo(self.process.pid)
+        self.reader = threading.Thread(target=self.stderr.drain, args=(self.process.stderr,), daemon=True)
+        self.reader.start()
+
+    @property
+    def stdout(self):
+        return self.process.stdout
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def wait(self):
+        returncode = self.process.wait()
+        self.reader.join()
+
+        if returncode != 0:
+            raise self.stderr.error(self.stage, returncode, self.limits)
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+# for processes with a small output: all of stdout, once the process is done
+def run(argv, stage, limits=None):
+    process = LimitedProcess(argv, stage, limits)
+
+    try:
+        with process.stdout:
+            out = process.stdout.read()
+    except BaseException:
+        process.kill()
+        raise
+
+    process.wait()
+
+    return out
@@ -0,0 +1,22 @@
+import asyncio
+
+from .cache import shared_cache
+from .loudness import analyze
+from .orchestrator import Orchestrator
+
+def loadMetadata(path, cache=None, limits=None):
+    cache = cache or shared_cache()
+    metadata = cache.get(path)
+
+    if metadata is None:
+        metadata = analyze(path, reuse=cache.findAudio, limits=limits)
+
+        if metadata['mean_volume'] is not None:
+            cache.put(path, metadata)
+
+    return metadata
+
+# runs the cheapest pipeline for a reserved file and returns which one it was.
+# the output only appears under its real name once it is complete.
+def runJob(audio_file, journal=None, timeout=None, limits=None, attempt=None, still_leased=None):
+    return asyncio.run(Orchestrator(1, timeout, limits=limits, attempt=attempt, still_leased=still_leased).runJob(audio_file, journal))
@@ -0,0 +1,130 @@
+import fnmatch
+import os
+
+from . import EXTENSIONS
+
+# names never descended into or listed: hidden entries (our own .partial outputs among them)
+# and the housekeeping folders NAS boxes and Windows leave in music shares
+DEFAULT_IGNORE = ('.*', '@eaDir', '#recycle', '$RECYCLE.BIN', 'System Volume Information', 'lost+found')
+
+# candidates travel to the analyzers through a queue of this size, so the walk never runs far ahead
+SCAN_QUEUE = 256
+
+SNIFF_BYTES = 16
+
+# one ISO base media file under two names; the ftyp brand doesn't decide between them
+# (iTunes writes M4A, plenty of encoders write isom, mp42 or dash into .m4a files)
+ISO_BMFF = ('.m4a', '.mp4')
+
+def containerFamily(container):
+    return '.mp4' if container in ISO_BMFF else container
+
+# container by magic bytes, None for anything we can't process.
+# an extension says what a file should be, this says what it is: a name only counts
+# when the bytes are of its family.
+def sniff(path):
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+
+            # an ID3v2 tag can sit in front of anything, look behind it
+            if head[:3] == b'ID3' and len(head) >= 10:
+                f.seek(10 + ((head[6] & 0x7f) << 21 | (head[7] & 0x7f) << 14 | (head[8] & 0x7f) << 7 | head[9] & 0x7f))
+                behind = f.read(4)
+
+                return '.flac' if behind == b'fLaC' else '.mp3'
+    except OSError:
+        return None
+
+    if head[:4] == b'fLaC':
+        return '.flac'
+
+    if head[4:8] == b'ftyp':
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension in ISO_BMFF:
+            return extension
+
+        return '.m4a' if head[8:11] == b'M4A' or head[8:11] == b'M4B' else '.mp4'
+
+    # MPEG audio frame sync with a layer set; ADTS (layer 0) is raw AAC, which we don't take
+    if len(head) >= 2 and head[0] == 0xff and head[1] & 0xe0 == 0xe0 and head[1] & 0x06:
+        return '.mp3'
+
+    return None
+
+# our own outputs are never inputs
+def isOutput(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    return name.endswith('_adjusted') or '_adjusted_' in name
+
+def isIgnored(name, ignore=DEFAULT_IGNORE):
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in ignore)
+
+def isCandidate(name):
+    return os.path.splitext(name)[1].lower() in EXTENSIONS
+
+# depth-first walk that yields (path, stat, container) while it goes. only one directory listing is
+# held at a time plus the directories still to visit, so memory doesn't grow with the tree.
+# with sniff off every candidate by name is yielded and container is None.
+class Scanner():
+    def __init__(self, root, max_depth=None, ignore=DEFAULT_IGNORE, sniff=True, on_directory=None):
+        self.root = root
+        self.max_depth = max_depth
+        self.ignore = tuple(ignore)
+        self.sniff = sniff
+        self.on_directory = on_directory
+        self.directories = 0
+        self.skipped = 0
+
+    def __iter__(self):
+        stack = [(self.root, 0)]
+
+        while stack:
+            directory, depth = stack.pop()
+
+            # e.g. put a watch on it: anything created after the listing is still reported
+            if self.on_directory:
+                self.on_directory(directory)
+
+            try:
+                with os.scandir(directory) as entries:
+                    listing = sorted((entry for entry in entries if not isIgnored(entry.name, self.ignore)), key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            self.directories += 1
+            subdirectories = []
+
+            for entry in listing:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.max_depth is None or depth < self.max_depth:
+                            subdirectories.append(entry.path)
+                        continue
+
+                    if not isCandidate(entry.name) or not entry.is_file():
+                        continue
+
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                container = sniff(entry.path) if self.sniff else None
+
+                if self.sniff and container is None:
+                    self.skipped += 1
+                    continue
+
+                yield entry.path, stat, container
+
+            stack.extend((path, depth + 1) for path in reversed(subdirectories))
+
+# producer side of the bounded queue: blocks while the consumers are behind, None marks the end
+def scanInto(items, queue):
+    try:
+        for item in items:
+            queue.put(item)
+    finally:
+        queue.put(None)
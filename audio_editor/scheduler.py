@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import os
+
+from .cache import shared_cache
+
+CPU_COUNT = os.cpu_count() or 1
+
+# concurrency starts at one job per core and moves by one step per ADJUST_INTERVAL seconds:
+# up while cores sit idle and work is waiting, down while more threads are runnable than there are cores.
+# ffmpeg's own threads show up in the runnable count, so jobs that thread internally get fewer slots.
+ADJUST_INTERVAL = 1.0
+LOW_UTILIZATION = 0.75
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = CPU_COUNT * 2
+
+def poolSize():
+    return CPU_COUNT
+
+# bytes per second of a 128K stream, for files we can't read a duration from
+FALLBACK_BYTE_RATE = 16000
+
+# a cheap duration estimate for ordering: analysis cache, then the container header, then the size
+def estimateDuration(path):
+    metadata = shared_cache().get(path)
+
+    if metadata and metadata.get('duration'):
+        return metadata['duration']
+
+    # mutagen loads with the first batch, not with whoever imports the scheduler
+    try:
+        import mutagen
+
+        info = mutagen.File(path)
+
+        if info is not None and info.info.length:
+            return info.info.length
+    except Exception:
+        pass
+
+    try:
+        return os.path.getsize(path) / FALLBACK_BYTE_RATE
+    except OSError:
+        return 0
+
+# the longest job decides the makespan, so it has to start first
+def longestFirst(items, duration):
+    return sorted(items, key=lambda item: -(duration(item) or 0))
+
+# system-wide cpu utilization and runnable threads since the previous sample (linux /proc/stat)
+class CpuMonitor():
+    def __init__(self):
+        self.previous = self._read()
+
+    def _read(self):
+        try:
+            with open('/proc/stat') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+        times = [int(value) for value in lines[0].split()[1:]]
+        runnable = next((int(line.split()[1]) for line in lines if line.startswith('procs_running')), None)
+
+        # idle + iowait
+        return sum(times), times[3] + (times[4] if len(times) > 4 else 0), runnable
+
+    def sample(self):
+        current = self._read()
+
+        if current is None or self.previous is None:
+            return None, None
+
+        total = current[0] - self.previous[0]
+        idle = current[1] - self.previous[1]
+        self.previous = current
+
+        return (1 - idle / total if total > 0 else None), current[2]
+
+def adjust(limit, utilization, runnable, waiting):
+    if utilization is None:
+        return limit
+
+    if runnable is not None and runnable > CPU_COUNT + 1 and limit > MIN_CONCURRENCY:
+        return limit - 1
+
+    if utilization < LOW_UTILIZATION and waiting and limit < MAX_CONCURRENCY:
+        return limit + 1
+
+    return limit
+
+# an asyncio semaphore whose size can change while jobs hold it. waiters are served in order.
+class AdaptiveLimiter():
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiters = collections.deque()
+
+    async def acquire(self):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # cancelled right after being handed a slot: give it to the next one
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.active < self.limit:
+            waiter = self.waiters.popleft()
+
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    def resize(self, limit):
+        self.limit = limit
+        self._wake()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    # runs until cancelled
+    async def adapt(self, monitor=None):
+        monitor = monitor or CpuMonitor()
+
+        while True:
+            await asyncio.sleep(ADJUST_INTERVAL)
+            utilization, runnable = monitor.sample()
+            self.resize(adjust(self.limit, utilization, runnable, bool(self.waiters)))
@@ -0,0 +1,30 @@
+import json
+import os
+
+from .cache import CACHE_PATH
+
+SESSION_PATH = os.environ.get('AUDIO_EDITOR_SESSION', os.path.join(os.path.dirname(CACHE_PATH), 'session.json'))
+
+# the workspace open when the app last ran, if it is still there
+def lastWorkspace(path=SESSION_PATH):
+    try:
+        with open(path) as f:
+            workspace = json.load(f).get('workspace')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+    return workspace if isinstance(workspace, str) and os.path.isdir(workspace) else None
+
+def saveWorkspace(workspace, path=SESSION_PATH):
+    temporary = f'{path}.{os.getpid()}.partial'
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(temporary, 'w') as f:
+            json.dump({'workspace': workspace}, f)
+
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
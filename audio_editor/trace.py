@@ -0,0 +1,162 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# AUDIO_EDITOR_TRACE=<file.json> records spans for every job and UI handler and writes
+# them as Chrome trace events (chrome://tracing, ui.perfetto.dev) at exit, plus a summary on stderr.
+TRACE_PATH = os.environ.get('AUDIO_EDITOR_TRACE')
+ENABLED = bool(TRACE_PATH)
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+_events = []
+_main_pid = os.getpid()
+
+def now():
+    return time.perf_counter_ns() // 1000
+
+def complete(name, category, start, end=None, tid=None, **args):
+    if not ENABLED or start is None:
+        return
+
+    _events.append({
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': start,
+        'dur': (end or now()) - start,
+        'pid': os.getpid(),
+        'tid': tid if tid is not None else threading.get_native_id(),
+        'args': args,
+    })
+
+class Span():
+    __slots__ = ('name', 'category', 'args', 'start', 'cpu_start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = now()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.args['thread_cpu'] = round(time.thread_time() - self.cpu_start, 6)
+
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+
+        complete(self.name, self.category, self.start, **self.args)
+
+    def set(self, **args):
+        self.args.update(args)
+
+class NullSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+NULL_SPAN = NullSpan()
+
+def span(name, category, **args):
+    return Span(name, category, args) if ENABLED else NULL_SPAN
+
+# cpu seconds of a child process, readable until it is reaped (linux only)
+def processCpu(pid):
+    if not ENABLED:
+        return None
+
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+def fileSize(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+# marks when a signal was emitted so the receiving handler can report delivery latency
+def stamp(signals):
+    if ENABLED:
+        signals.emitted_at = now()
+
+# wraps a Qt slot; returns it untouched when tracing is off
+def handler(func):
+    if not ENABLED:
+        return func
+
+    code = func.__code__
+    takes = None if code.co_flags & 0x04 else code.co_argcount
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        # Qt passes every signal argument, the slot may take fewer
+        args = args[:takes] if takes is not None else args
+        window = args[0]
+        sender = window.sender() if hasattr(window, 'sender') else None
+        emitted_at = getattr(sender, 'emitted_at', None)
+
+        if emitted_at is not None:
+            complete('signal delivery', 'qt', emitted_at, slot=func.__name__)
+
+        with span(func.__name__, 'ui'):
+            return func(*args)
+
+    return wrapper
+
+# events recorded in a pool worker process, handed back to the parent with the result
+def drain():
+    events = _events[:]
+    del _events[:len(events)]
+
+    return events
+
+def extend(events):
+    _events.extend(events)
+
+def summary():
+    groups = {}
+
+    for event in _events:
+        groups.setdefault((event['cat'], event['name']), []).append(event['dur'] / 1000)
+
+    lines = [f'{"category":13} {"name":28} {"count":>7} {"total ms":>10} {"mean ms":>9} {"p95 ms":>9} {"max ms":>9}']
+
+    for (category, name), durations in sorted(groups.items(), key=lambda item: -sum(item[1])):
+        durations.sort()
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        lines.append(f'{category:13} {name:28} {len(durations):>7} {sum(durations):>10.1f} {sum(durations) / len(durations):>9.2f} {p95:>9.2f} {durations[-1]:>9.2f}')
+
+    return '\n'.join(lines)
+
+def export(path=None):
+    # forked pool workers share this module state but must not write the file
+    if os.getpid() != _main_pid:
+        return
+
+    with open(path or TRACE_PATH, 'w') as f:
+        json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, f)
+
+    print(summary(), file=sys.stderr)
+
+if ENABLED:
+    atexit.register(export)
@@ -0,0 +1,198 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import threading
+
+from .scanner import DEFAULT_IGNORE, Scanner, isCandidate, isIgnored, sniff
+
+# inotify(7) flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# a file counts as changed once its writer closes it, so a copy in progress isn't analyzed half way.
+# IN_CREATE is only acted on for directories.
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.inotify_init1
+except (OSError, AttributeError):
+    libc = None
+
+# a workspace tree, watched with one inotify watch per directory where the platform has it and
+# rescanned otherwise. files maps relative paths to (size, mtime_ns); the scanner fills it through
+# add() and watchDirectory() as it walks. names() collects what the kernel reported, changes() turns
+# that into added/removed/modified against the known state, so unrelated files are never touched.
+class DirectoryWatcher():
+    def __init__(self, dir_path, max_depth=None, ignore=DEFAULT_IGNORE):
+        self.dir_path = dir_path
+        self.max_depth = max_depth
+        self.ignore = tuple(ignore)
+        self.files = {}
+        self.directories = {}
+        self.lock = threading.Lock()
+        self.fd = None
+        self.exhausted = False
+
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+            # no inotify (ENOSYS) or out of instances: fall back to polling
+            if fd >= 0:
+                self.fd = fd
+
+    # the owner switches to rescanning and close()s once this turns true
+    @property
+    def polling(self):
+        return self.fd is None or self.exhausted
+
+    def fileno(self):
+        return self.fd
+
+    def relative(self, path):
+        return os.path.relpath(path, self.dir_path)
+
+    # called before a directory is listed, so nothing falls between the listing and the watch
+    def watchDirectory(self, directory):
+        with self.lock:
+            if self.polling:
+                return
+
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+
+            # out of watches (ENOSPC): a partly watched tree would miss changes, so all of it is polled
+            if wd < 0:
+                self.exhausted = True
+                return
+
+            self.directories[wd] = self.relative(directory)
+
+    # false when the file is known already, e.g. reported by an event while the scan was on its way
+    def add(self, relative_path, stat):
+        with self.lock:
+            if relative_path in self.files:
+                return False
+
+            self.files[relative_path] = (stat.st_size, stat.st_mtime_ns)
+            return True
+
+    def scanner(self, root=None, **kwargs):
+        return Scanner(root or self.dir_path, self.max_depth, self.ignore, on_directory=self.watchDirectory, **kwargs)
+
+    # relative paths from the pending events; None means "rescan everything" (queue overflow, workspace gone)
+    def names(self):
+        names = set()
+
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return names
+                raise
+
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0'))
+                offset += EVENT.size + length
+
+                with self.lock:
+                    directory = self.directories.get(wd)
+
+                    if mask & IN_IGNORED:
+                        self.directories.pop(wd, None)
+
+                if mask & IN_Q_OVERFLOW or (directory == '.' and mask & (IN_DELETE_SELF | IN_MOVE_SELF)):
+                    names = None
+                elif names is None or directory is None or not name or isIgnored(name, self.ignore):
+                    continue
+                elif mask & IN_ISDIR or not mask & IN_CREATE:
+                    names.add(os.path.normpath(os.path.join(directory, name)))
+
+            if names is None:
+                # drain what is left, a full rescan covers it
+                while True:
+                    try:
+                        os.read(self.fd, READ_SIZE)
+                    except OSError:
+                        return None
+
+    # (added, removed, modified) relative paths since the last call, for the given names or all of them.
+    # a name can be a directory, which stands for everything below it.
+    def changes(self, names=None):
+        current = {}
+        checked = set()
+
+        for name in ([None] if names is None else names):
+            path = self.dir_path if name is None else os.path.join(self.dir_path, name)
+
+            if os.path.isdir(path):
+                # a new or moved-in directory gets its watches on the way
+                for file_path, stat, _ in self.scanner(path, sniff=False):
+                    current[self.relative(file_path)] = (stat.st_size, stat.st_mtime_ns)
+            elif name is not None and isCandidate(name):
+                try:
+                    stat = os.stat(path)
+                    current[name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    pass
+
+            checked.add(name)
+
+        added, removed, modified = [], [], []
+
+        with self.lock:
+            if None in checked:
+                known = list(self.files)
+            else:
+                # files are looked up directly, only directories (present or gone) need a pass over all names
+                directories = tuple(f'{name}{os.sep}' for name in checked if name not in self.files and not isCandidate(name) or os.path.isdir(os.path.join(self.dir_path, name)))
+                known = [name for name in checked if name in self.files]
+
+                if directories:
+                    known += [name for name in self.files if name.startswith(directories)]
+
+            for name in set(known) | set(current):
+                before, after = self.files.get(name), current.get(name)
+
+                if before == after:
+                    continue
+
+                if after is None:
+                    removed.append(name)
+                    del self.files[name]
+                elif before is None:
+                    # only now is the content looked at, and only for files we didn't know
+                    if sniff(os.path.join(self.dir_path, name)) is None:
+                        continue
+
+                    added.append(name)
+                    self.files[name] = after
+                else:
+                    modified.append(name)
+                    self.files[name] = after
+
+        return sorted(added), sorted(removed), sorted(modified)
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
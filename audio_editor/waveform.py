@@ -0,0 +1,203 @@
+import os
+import shutil
+import struct
+
+import numpy as np
+
+from .cache import CACHE_PATH, fingerprint
+
+# min/max per BASE_BLOCK frames, every coarser level merges LEVEL_FACTOR blocks of the one below.
+# a 10 minute 44.1k file is ~103k base blocks, under 1.2 MB for all levels.
+BASE_BLOCK = 256
+LEVEL_FACTOR = 4
+
+PEAKS_PATH = os.environ.get('AUDIO_EDITOR_PEAKS', os.path.join(os.path.dirname(CACHE_PATH), 'peaks'))
+
+# magic, version, sample rate, base block, level factor, level count; then one block count per level
+HEADER = struct.Struct('<4sHIIIH')
+LEVEL_COUNT = struct.Struct('<Q')
+MAGIC = b'AEPK'
+VERSION = 1
+
+# collects per-block min/max of all channels next to the loudness meter.
+# `start` is the first counted frame of a segment, so segments line up on the same block grid.
+class PeakBuilder():
+    def __init__(self, sample_rate, preroll=0, start=0):
+        self.sample_rate = sample_rate
+        self.preroll = preroll
+
+        # the first block may already have frames from the previous segment
+        skipped = start % BASE_BLOCK
+        self.first_block = start // BASE_BLOCK
+        self.pending_low = np.full(skipped, np.inf, dtype=np.float32)
+        self.pending_high = np.full(skipped, -np.inf, dtype=np.float32)
+
+        self.lows = []
+        self.highs = []
+
+    def feed(self, samples):
+        counted = samples[self.preroll:]
+        self.preroll = max(0, self.preroll - len(samples))
+
+        if len(counted) == 0:
+            return
+
+        low = np.concatenate((self.pending_low, counted.min(axis=1)))
+        high = np.concatenate((self.pending_high, counted.max(axis=1)))
+
+        whole = len(low) // BASE_BLOCK * BASE_BLOCK
+        self.pending_low = low[whole:]
+        self.pending_high = high[whole:]
+
+        if whole:
+            self.lows.append(low[:whole].reshape(-1, BASE_BLOCK).min(axis=1))
+            self.highs.append(high[:whole].reshape(-1, BASE_BLOCK).max(axis=1))
+
+    def blocks(self):
+        lows = self.lows + [self.pending_low.min(keepdims=True)] if len(self.pending_low) else self.lows
+        highs = self.highs + [self.pending_high.max(keepdims=True)] if len(self.pending_high) else self.highs
+
+        if not lows:
+            return np.zeros((0, 2), dtype=np.float32)
+
+        return np.stack((np.concatenate(lows), np.concatenate(highs)), axis=1).astype(np.float32)
+
+    # appends the next segment; a block cut by the segment boundary is merged
+    def merge(self, other):
+        mine = self.blocks()
+        theirs = other.blocks()
+
+        if len(theirs) and len(mine) and other.first_block == self.first_block + len(mine) - 1:
+            theirs[0] = (min(mine[-1, 0], theirs[0, 0]), max(mine[-1, 1], theirs[0, 1]))
+            mine = mine[:-1]
+
+        merged = np.concatenate((mine, theirs))
+        self.lows = [merged[:, 0]]
+        self.highs = [merged[:, 1]]
+        self.pending_low = self.pending_high = np.zeros(0, dtype=np.float32)
+
+def pyramid(blocks):
+    levels = [blocks]
+
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        padded = np.pad(level, ((0, -len(level) % LEVEL_FACTOR), (0, 0)), mode='edge').reshape(-1, LEVEL_FACTOR, 2)
+        levels.append(np.stack((padded[:, :, 0].min(axis=1), padded[:, :, 1].max(axis=1)), axis=1))
+
+    return levels
+
+# sidecars are named by content, so a renamed or copied file finds its waveform
+def sidecarPath(path, digest=None):
+    return os.path.join(PEAKS_PATH, f'{(digest or fingerprint(path)).hex()}.peaks')
+
+# a file with the same audio as the one `digest` fingerprints shares its sidecar.
+# false when there is none to share, e.g. measured before waveforms were kept.
+def linkPeaks(digest, path):
+    source = sidecarPath(None, digest)
+
+    try:
+        sidecar = sidecarPath(path)
+    except OSError:
+        return False
+
+    if os.path.exists(sidecar):
+        return True
+
+    try:
+        os.link(source, sidecar)
+    except FileExistsError:
+        pass
+    except OSError:
+        # gone, or a filesystem without hard links
+        try:
+            shutil.copyfile(source, sidecar)
+        except OSError:
+            return False
+
+    return True
+
+def savePeaks(path, builder):
+    try:
+        sidecar = sidecarPath(path)
+    except OSError:
+        return
+
+    levels = pyramid(builder.blocks())
+    temporary = f'{sidecar}.{os.getpid()}.partial'
+
+    try:
+        os.makedirs(PEAKS_PATH, exist_ok=True)
+
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, builder.sample_rate, BASE_BLOCK, LEVEL_FACTOR, len(levels)))
+
+            for level in levels:
+                f.write(LEVEL_COUNT.pack(len(level)))
+
+            for level in levels:
+                f.write(level.astype('<f4').tobytes())
+
+        os.replace(temporary, sidecar)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+# the levels of one sidecar, memory mapped: drawing touches only the pages of the level it reads
+class Peaks():
+    def __init__(self, sidecar):
+        with open(sidecar, 'rb') as f:
+            magic, version, self.sample_rate, self.base_block, self.level_factor, count = HEADER.unpack(f.read(HEADER.size))
+
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'not a peaks file: {sidecar}')
+
+            counts = [LEVEL_COUNT.unpack(f.read(LEVEL_COUNT.size))[0] for _ in range(count)]
+
+        offset = HEADER.size + LEVEL_COUNT.size * count
+        self.levels = []
+
+        for n in counts:
+            self.levels.append(np.memmap(sidecar, dtype='<f4', mode='r', offset=offset, shape=(n, 2)) if n else np.zeros((0, 2), dtype='<f4'))
+            offset += n * 8
+
+    @property
+    def duration(self):
+        return len(self.levels[0]) * self.base_block / self.sample_rate if self.levels else 0
+
+    # (low, high) per column for `columns` columns between two times, from the coarsest level
+    # that still has at least one block per column
+    def columns(self, start, end, columns):
+        if not self.levels or columns <= 0 or end <= start:
+            return np.zeros(0), np.zeros(0)
+
+        frames_per_column = (end - start) * self.sample_rate / columns
+        index = 0
+
+        while index + 1 < len(self.levels) and self.base_block * self.level_factor ** (index + 1) <= frames_per_column:
+            index += 1
+
+        level = self.levels[index]
+        block = self.base_block * self.level_factor ** index
+
+        first = max(0, int(start * self.sample_rate / block))
+        last = min(len(level), int(np.ceil(end * self.sample_rate / block)))
+
+        if last <= first:
+            return np.zeros(0), np.zeros(0)
+
+        # column starts in blocks of the chosen level. zoomed in past the base level
+        # several columns share a block, and reduceat gives each of them that block.
+        edges = np.linspace(start * self.sample_rate / block, end * self.sample_rate / block, columns, endpoint=False)
+        starts = np.clip(edges.astype(np.int64), first, last - 1) - first
+
+        window = np.asarray(level[first:last])
+        low = np.minimum.reduceat(window[:, 0], starts)
+        high = np.maximum.reduceat(window[:, 1], starts)
+
+        return low, high
+
+def loadPeaks(path):
+    try:
+        return Peaks(sidecarPath(path))
+    except (OSError, ValueError, struct.error):
+        return None
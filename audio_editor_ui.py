@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'audio-editor.ui'
+#
+# Regenerate after editing the .ui file:
+#     pyuic5 audio-editor.ui -o audio_editor_ui.py
+#
+# WARNING! All changes made in this file will be lost!
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(959, 644)
+        self.centralwidget = QtWidgets.QWidget(MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.directory_button = QtWidgets.QPushButton(self.centralwidget)
+        self.directory_button.setGeometry(QtCore.QRect(10, 10, 161, 32))
+        self.directory_button.setStyleSheet("")
+        self.directory_button.setObjectName("directory_button")
+        self.directory_label = QtWidgets.QLabel(self.centralwidget)
+        self.directory_label.setGeometry(QtCore.QRect(180, 10, 771, 31))
+        self.directory_label.setStyleSheet("")
+        self.directory_label.setFrameShape(QtWidgets.QFrame.StyledPanel)
+        self.directory_label.setText("")
+        self.directory_label.setObjectName("directory_label")
+        self.horizontalLayoutWidget = QtWidgets.QWidget(self.centralwidget)
+        self.horizontalLayoutWidget.setGeometry(QtCore.QRect(10, 50, 941, 481))
+        self.horizontalLayoutWidget.setStyleSheet("")
+        self.horizontalLayoutWidget.setObjectName("horizontalLayoutWidget")
+        self.horizontalLayout = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget)
+        self.horizontalLayout.setSizeConstraint(QtWidgets.QLayout.SetDefaultConstraint)
+        self.horizontalLayout.setContentsMargins(0, 10, 0, 10)
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.file_list = QtWidgets.QListWidget(self.horizontalLayoutWidget)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.file_list.sizePolicy().hasHeightForWidth())
+        self.file_list.setSizePolicy(sizePolicy)
+        self.file_list.setMinimumSize(QtCore.QSize(500, 0))
+        self.file_list.setStyleSheet("")
+        self.file_list.setObjectName("file_list")
+        self.horizontalLayout.addWidget(self.file_list)
+        self.verticalLayout = QtWidgets.QVBoxLayout()
+        self.verticalLayout.setContentsMargins(5, 5, -1, 5)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.metadata_title = QtWidgets.QLabel(self.horizontalLayoutWidget)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.metadata_title.sizePolicy().hasHeightForWidth())
+        self.metadata_title.setSizePolicy(sizePolicy)
+        self.metadata_title.setMinimumSize(QtCore.QSize(300, 0))
+        self.metadata_title.setStyleSheet("")
+        self.metadata_title.setFrameShape(QtWidgets.QFrame.NoFrame)
+        self.metadata_title.setAlignment(QtCore.Qt.AlignCenter)
+        self.metadata_title.setObjectName("metadata_title")
+        self.verticalLayout.addWidget(self.metadata_title)
+        self.metadata = QtWidgets.QLabel(self.horizontalLayoutWidget)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Preferred)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.metadata.sizePolicy().hasHeightForWidth())
+        self.metadata.setSizePolicy(sizePolicy)
+        self.metadata.setMinimumSize(QtCore.QSize(400, 100))
+        self.metadata.setMaximumSize(QtCore.QSize(16777215, 100))
+        font = QtGui.QFont()
+        font.setPointSize(12)
+        self.metadata.setFont(font)
+        self.metadata.setAutoFillBackground(False)
+        self.metadata.setStyleSheet("")
+        self.metadata.setFrameShape(QtWidgets.QFrame.StyledPanel)
+        self.metadata.setText("")
+        self.metadata.setObjectName("metadata")
+        self.verticalLayout.addWidget(self.metadata, 0, QtCore.Qt.AlignHCenter)
+        self.label = QtWidgets.QLabel(self.horizontalLayoutWidget)
+        self.label.setEnabled(True)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.label.sizePolicy().hasHeightForWidth())
+        self.label.setSizePolicy(sizePolicy)
+        self.label.setStyleSheet("font-style:bold")
+        self.label.setAlignment(QtCore.Qt.AlignCenter)
+        self.label.setObjectName("label")
+        self.verticalLayout.addWidget(self.label)
+        self.metadata_after = QtWidgets.QLabel(self.horizontalLayoutWidget)
+        self.metadata_after.setMinimumSize(QtCore.QSize(400, 100))
+        self.metadata_after.setMaximumSize(QtCore.QSize(16777215, 100))
+        font = QtGui.QFont()
+        font.setPointSize(12)
+        self.metadata_after.setFont(font)
+        self.metadata_after.setFrameShape(QtWidgets.QFrame.StyledPanel)
+        self.metadata_after.setFrameShadow(QtWidgets.QFrame.Plain)
+        self.metadata_after.setText("")
+        self.metadata_after.setObjectName("metadata_after")
+        self.verticalLayout.addWidget(self.metadata_after, 0, QtCore.Qt.AlignHCenter|QtCore.Qt.AlignVCenter)
+        self.formLayout = QtWidgets.QFormLayout()
+        self.formLayout.setSizeConstraint(QtWidgets.QLayout.SetDefaultConstraint)
+        self.formLayout.setLabelAlignment(QtCore.Qt.AlignLeading|QtCore.Qt.AlignLeft|QtCore.Qt.AlignVCenter)
+        self.formLayout.setFormAlignment(QtCore.Qt.AlignLeading|QtCore.Qt.AlignLeft|QtCore.Qt.AlignTop)
+        self.formLayout.setContentsMargins(-1, 5, -1, 5)
+        self.formLayout.setObjectName("formLayout")
+        self.extension_label = QtWidgets.QLabel(self.horizontalLayoutWidget)
+        self.extension_label.setStyleSheet("")
+        self.extension_label.setObjectName("extension_label")
+        self.formLayout.setWidget(0, QtWidgets.QFormLayout.LabelRole, self.extension_label)
+        self.extension_combo_box = QtWidgets.QComboBox(self.horizontalLayoutWidget)
+        self.extension_combo_box.setEnabled(False)
+        self.extension_combo_box.setStyleSheet("")
+        self.extension_combo_box.setObjectName("extension_combo_box")
+        self.extension_combo_box.addItem("")
+        self.extension_combo_box.addItem("")
+        self.extension_combo_box.addItem("")
+        self.formLayout.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.extension_combo_box)
+        self.quality_label = QtWidgets.QLabel(self.horizontalLayoutWidget)
+        self.quality_label.setStyleSheet("")
+        self.quality_label.setObjectName("quality_label")
+        self.formLayout.setWidget(1, QtWidgets.QFormLayout.LabelRole, self.quality_label)
+        self.quality_combo_box = QtWidgets.QComboBox(self.horizontalLayoutWidget)
+        self.quality_combo_box.setEnabled(False)
+        self.quality_combo_box.setStyleSheet("")
+        self.quality_combo_box.setObjectName("quality_combo_box")
+        self.quality_combo_box.addItem("")
+        self.quality_combo_box.addItem("")
+        self.formLayout.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.quality_combo_box)
+        self.volume_label = QtWidgets.QLabel(self.horizontalLayoutWidget)
+        self.volume_label.setObjectName("volume_label")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.volume_label)
+        self.volume_double_spin_box = QtWidgets.QDoubleSpinBox(self.horizontalLayoutWidget)
+        self.volume_double_spin_box.setEnabled(False)
+        self.volume_double_spin_box.setMinimum(-100.0)
+        self.volume_double_spin_box.setMaximum(100.0)
+        self.volume_double_spin_box.setSingleStep(0.05)
+        self.volume_double_spin_box.setObjectName("volume_double_spin_box")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.volume_double_spin_box)
+        self.verticalLayout.addLayout(self.formLayout)
+        self.reserve_button = QtWidgets.QPushButton(self.horizontalLayoutWidget)
+        self.reserve_button.setEnabled(False)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.reserve_button.sizePolicy().hasHeightForWidth())
+        self.reserve_button.setSizePolicy(sizePolicy)
+        self.reserve_button.setMinimumSize(QtCore.QSize(0, 40))
+        self.reserve_button.setStyleSheet("")
+        self.reserve_button.setObjectName("reserve_button")
+        self.verticalLayout.addWidget(self.reserve_button)
+        self.verticalLayout.setStretch(0, 1)
+        self.verticalLayout.setStretch(1, 1)
+        self.verticalLayout.setStretch(3, 1)
+        self.verticalLayout.setStretch(4, 1)
+        self.verticalLayout.setStretch(5, 1)
+        self.horizontalLayout.addLayout(self.verticalLayout)
+        self.apply_button = QtWidgets.QPushButton(self.centralwidget)
+        self.apply_button.setEnabled(False)
+        self.apply_button.setGeometry(QtCore.QRect(600, 540, 331, 51))
+        self.apply_button.setAutoFillBackground(False)
+        self.apply_button.setStyleSheet("")
+        self.apply_button.setObjectName("apply_button")
+        self.progress_bar = QtWidgets.QProgressBar(self.centralwidget)
+        self.progress_bar.setGeometry(QtCore.QRect(600, 580, 331, 23))
+        self.progress_bar.setProperty("value", 0)
+        self.progress_bar.setObjectName("progress_bar")
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+
+        self.retranslateUi(MainWindow)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
+        self.directory_button.setText(_translate("MainWindow", "1. 경로 열기"))
+        self.metadata_title.setText(_translate("MainWindow", "메타데이터"))
+        self.label.setText(_translate("MainWindow", "↓"))
+        self.extension_label.setText(_translate("MainWindow", "extension"))
+        self.extension_combo_box.setItemText(0, _translate("MainWindow", ".m4a"))
+        self.extension_combo_box.setItemText(1, _translate("MainWindow", ".mp3"))
+        self.extension_combo_box.setItemText(2, _translate("MainWindow", ".mp4"))
+        self.quality_label.setText(_translate("MainWindow", "quality"))
+        self.quality_combo_box.setItemText(0, _translate("MainWindow", "192K"))
+        self.quality_combo_box.setItemText(1, _translate("MainWindow", "320K"))
+        self.volume_label.setText(_translate("MainWindow", "volume"))
+        self.reserve_button.setText(_translate("MainWindow", "2. 변경사항 예약"))
+        self.apply_button.setText(_translate("MainWindow", "3. 전체 적용"))
@@ -0,0 +1,83 @@
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from audio_editor import waveform
+from audio_editor.loudness import VOLUMEDETECT_FLOOR, VOLUMEDETECT_TOLERANCE, LoudnessMeter, SegmentedAnalysis, analyze
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not on PATH')
+
+# volumedetect prints one decimal
+VOLUMEDETECT_ROUNDING = 0.05
+
+@pytest.fixture(autouse=True)
+def peaks(tmp_path, monkeypatch):
+    monkeypatch.setattr(waveform, 'PEAKS_PATH', str(tmp_path / 'peaks'))
+
+def sine(amplitude, frequency, seconds, sample_rate=48000, channels=2):
+    t = np.arange(round(seconds * sample_rate)) / sample_rate
+    wave = amplitude * np.sin(2 * np.pi * frequency * t)
+
+    return np.repeat(wave[:, None], channels, axis=1)
+
+def measure(samples, sample_rate=48000):
+    meter = LoudnessMeter(sample_rate, samples.shape[1])
+
+    for start in range(0, len(samples), 1 << 16):
+        meter.feed(samples[start:start + (1 << 16)])
+
+    return meter.result()
+
+def encode(path, graph):
+    subprocess.run(['ffmpeg', '-nostdin', '-v', 'error', '-y', '-f', 'lavfi', '-i', graph, '-ac', '2', '-b:a', '192k', str(path)], check=True)
+
+    return str(path)
+
+def volumedetect(path):
+    stderr = subprocess.run(['ffmpeg', '-nostdin', '-i', path, '-af', 'volumedetect', '-f', 'null', '-'], capture_output=True, text=True).stderr
+
+    return {f'{k}_volume': float(v) for k, v in re.findall(r'(mean|max)_volume: (-?[\d.]+) dB', stderr)}
+
+def test_bs1770_sine():
+    pytest.importorskip('scipy')
+
+    result = measure(sine(0.1, 1000, 10))
+
+    assert result['integrated_loudness'] == pytest.approx(-20.0, abs=0.1)
+    assert result['mean_volume'] == pytest.approx(-23.01, abs=0.01)
+    assert result['max_volume'] == pytest.approx(-20.0, abs=0.01)
+
+def test_silence_stops_at_the_floor():
+    result = measure(np.zeros((48000, 2)))
+
+    assert result['mean_volume'] == VOLUMEDETECT_FLOOR
+    assert result['max_volume'] == VOLUMEDETECT_FLOOR
+    assert result['integrated_loudness'] is None
+
+@needs_ffmpeg
+@pytest.mark.parametrize('graph', ['sine=f=440:d=20,volume=0.3', 'anoisesrc=d=20:a=0.2:c=pink'])
+def test_agrees_with_volumedetect(tmp_path, graph):
+    path = encode(tmp_path / 'song.mp3', graph)
+
+    result = analyze(path)
+    expected = volumedetect(path)
+
+    for key in ('mean_volume', 'max_volume'):
+        assert abs(result[key] - expected[key]) <= VOLUMEDETECT_TOLERANCE + VOLUMEDETECT_ROUNDING
+
+@needs_ffmpeg
+def test_segments_merge_to_a_single_pass(tmp_path):
+    path = encode(tmp_path / 'song.mp3', 'anoisesrc=d=25:a=0.2:c=pink')
+
+    single = analyze(path)
+    segmented = SegmentedAnalysis(path, single['duration'], segment_length=10)
+    results = [segmented.run(index) for index in range(segmented.count)]
+
+    assert segmented.count == 3
+    assert results[:-1] == [None, None]
+
+    for key in ('mean_volume', 'max_volume', 'integrated_loudness', 'true_peak'):
+        assert results[-1][key] == pytest.approx(single[key], abs=0.01)
@@ -0,0 +1,41 @@
+import pytest
+
+from audio_editor.scanner import sniff
+
+def ftyp(brand):
+    return b'\x00\x00\x00\x20ftyp' + brand + b'\x00\x00\x02\x00' + brand + b'isom'
+
+@pytest.mark.parametrize('brand', [b'M4A ', b'M4B ', b'mp42', b'isom', b'dash'])
+@pytest.mark.parametrize('extension', ['.m4a', '.mp4', '.M4A'])
+def test_iso_bmff_keeps_its_own_name(tmp_path, brand, extension):
+    path = tmp_path / f'song{extension}'
+    path.write_bytes(ftyp(brand))
+
+    assert sniff(str(path)) == extension.lower()
+
+@pytest.mark.parametrize('brand, container', [(b'M4A ', '.m4a'), (b'mp42', '.mp4'), (b'isom', '.mp4'), (b'dash', '.mp4')])
+def test_iso_bmff_under_another_name(tmp_path, brand, container):
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(ftyp(brand))
+
+    assert sniff(str(path)) == container
+
+def test_other_families(tmp_path):
+    flac = tmp_path / 'song.m4a'
+    flac.write_bytes(b'fLaC' + bytes(12))
+
+    mp3 = tmp_path / 'song.mp4'
+    mp3.write_bytes(b'\xff\xfb\x90\x64' + bytes(12))
+
+    tagged = tmp_path / 'song.flac'
+    tagged.write_bytes(b'ID3\x04\x00\x00\x00\x00\x00\x02' + bytes(2) + b'\xff\xfb\x90\x64')
+
+    assert sniff(str(flac)) == '.flac'
+    assert sniff(str(mp3)) == '.mp3'
+    assert sniff(str(tagged)) == '.mp3'
+
+def test_unknown(tmp_path):
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(b'RIFF' + bytes(12))
+
+    assert sniff(str(path)) is None